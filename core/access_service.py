@@ -1,16 +1,27 @@
 import inspect
+import time
 
-from core.decorators import instance
+from core.alts_service import AltsService
+from core.ban_service import BanService
+from core.decorators import instance, event
+from core.dict_object import DictObject
 from core.logger import Logger
 
 
 @instance()
 class AccessService:
+    # access level handlers registered by modules may depend on data that does not trigger an invalidation,
+    # so cached access levels are also refreshed periodically
+    CACHE_MAX_AGE = 300
+
     def __init__(self):
         self.access_levels = [
             {"label": "none", "level": 0, "handler": self.no_access},
             {"label": "all", "level": 100, "handler": self.all_access}]
         self.logger = Logger(__name__)
+        self.access_level_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def inject(self, registry):
         self.character_service = registry.get_instance("character_service")
@@ -32,26 +43,70 @@ class AccessService:
         self.logger.debug("Registering access level %d with label '%s'" % (level, label))
         self.access_levels.append({"label": label.lower(), "level": level, "handler": handler})
         self.access_levels = sorted(self.access_levels, key=lambda k: k["level"])
+        self.clear_access_level_cache()
 
     def get_access_levels(self):
         return self.access_levels
 
     def get_access_level(self, char_id):
+        return self.get_cached_access_level(char_id).access_level
+
+    def get_cached_access_level(self, char_id):
+        cached = self.access_level_cache.get(char_id)
+        if cached and cached.expires_at > time.time():
+            self.cache_hits += 1
+            return cached
+
+        self.cache_misses += 1
+
         access_level1 = self.get_single_access_level(char_id)
+        main_char_id = char_id
 
         alts = self.alts_service.get_alts(char_id)
-        if not alts:
-            return access_level1
+        if alts and alts[0].char_id != char_id:
+            main_char_id = alts[0].char_id
+            access_level2 = self.get_single_access_level(main_char_id)
+            if access_level1["level"] >= access_level2["level"]:
+                access_level1 = access_level2
+
+        cached = DictObject({"access_level": access_level1,
+                             "main_char_id": main_char_id,
+                             "expires_at": time.time() + self.CACHE_MAX_AGE})
+        self.access_level_cache[char_id] = cached
+        return cached
+
+    def clear_access_level_cache(self, char_id=None):
+        """
+        Call after changing anything that an access level handler depends on.
+        Clears the cached access level for a character, along with any alts that inherit their access level from it,
+        or for all characters if char_id is not specified.
+
+        Args:
+            char_id: int
+        """
 
-        main = alts[0]
-        if main.char_id == char_id:
-            return access_level1
+        if char_id is None:
+            self.access_level_cache = {}
         else:
-            access_level2 = self.get_single_access_level(main.char_id)
-            if access_level1["level"] < access_level2["level"]:
-                return access_level1
-            else:
-                return access_level2
+            for k in [k for k, v in self.access_level_cache.items() if k == char_id or v.main_char_id == char_id]:
+                del self.access_level_cache[k]
+
+    def get_cache_stats(self):
+        return DictObject({"size": len(self.access_level_cache),
+                           "hits": self.cache_hits,
+                           "misses": self.cache_misses})
+
+    @event(event_type=AltsService.MAIN_CHANGED_EVENT_TYPE, description="Clear cached access levels when a main changes", is_system=True)
+    def main_changed_event(self, event_type, event_data):
+        self.clear_access_level_cache()
+
+    @event(event_type=BanService.BAN_ADDED_EVENT, description="Clear cached access level when a character is banned", is_system=True)
+    def ban_added_event(self, event_type, event_data):
+        self.clear_access_level_cache(event_data.char_id)
+
+    @event(event_type=BanService.BAN_REMOVED_EVENT, description="Clear cached access level when a character is unbanned", is_system=True)
+    def ban_removed_event(self, event_type, event_data):
+        self.clear_access_level_cache(event_data.char_id)
 
     def compare_access_levels(self, access_level1, access_level2):
         """
@@ -81,14 +136,14 @@ class AccessService:
         if char_id1 == char_id2:
             return True
 
+        cached1 = self.get_cached_access_level(char_id1)
+        cached2 = self.get_cached_access_level(char_id2)
+
         # return True if both chars have the same main
-        if self.alts_service.get_main(char_id1).char_id == self.alts_service.get_main(char_id2).char_id:
+        if cached1.main_char_id == cached2.main_char_id:
             return True
 
-        a1 = self.get_access_level(char_id1)
-        a2 = self.get_access_level(char_id2)
-
-        return a2["level"] - a1["level"] > 0
+        return cached2.access_level["level"] - cached1.access_level["level"] > 0
 
     def get_single_access_level(self, char_id):
         for access_level in self.access_levels:
@@ -39,11 +39,13 @@ class AdminService:
             # remove any existing admin access level first
             self.remove(char_id)
             self.db.exec("INSERT INTO admin (char_id, access_level) VALUES (?, ?)", [char_id, access_level])
+            self.access_service.clear_access_level_cache(char_id)
             return True
         else:
             return False
 
     def remove(self, char_id):
+        self.access_service.clear_access_level_cache(char_id)
         return self.db.exec("DELETE FROM admin WHERE char_id = ?", [char_id]) > 0
 
     def get_all(self):
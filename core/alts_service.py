@@ -8,15 +8,18 @@ class AltsService:
     MAIN = 2
 
     MAIN_CHANGED_EVENT_TYPE = "main_changed"
+    ALT_REMOVED_EVENT_TYPE = "alt_removed"
 
     def inject(self, registry):
         self.db = registry.get_instance("db")
         self.character_service = registry.get_instance("character_service")
         self.pork_service = registry.get_instance("pork_service")
         self.event_service = registry.get_instance("event_service")
+        self.access_service = registry.get_instance("access_service")
 
     def pre_start(self):
         self.event_service.register_event_type(self.MAIN_CHANGED_EVENT_TYPE)
+        self.event_service.register_event_type(self.ALT_REMOVED_EVENT_TYPE)
 
     def start(self):
         self.db.exec("CREATE TABLE IF NOT EXISTS alts (char_id INT NOT NULL PRIMARY KEY, group_id INT NOT NULL, status SMALLINT NOT NULL)")
@@ -89,6 +92,10 @@ class AltsService:
             return ["remove_main", False]
 
         self.db.exec("DELETE FROM alts WHERE char_id = ?", [alt_char_id])
+        self.access_service.clear_access_level_cache(alt_char_id)
+        self.event_service.fire_event(self.ALT_REMOVED_EVENT_TYPE,
+                                      DictObject({"alt_char_id": alt_char_id,
+                                                  "group_id": alt_row.group_id}))
         return ["success", True]
 
     def set_as_main(self, sender_char_id):
@@ -10,8 +10,16 @@ from core.aochat.crypt import generate_login_key
 
 
 class Bot:
+    # large enough to always hold at least one complete packet, since packet length is limited to 2 bytes
+    RECEIVE_BUFFER_SIZE = 1 << 17
+    PACKET_HEADER = struct.Struct(">2H")
+
     def __init__(self):
         self.socket = None
+        # received data that has not been read as packets yet is between receive_start and receive_end
+        self.receive_buffer = bytearray(self.RECEIVE_BUFFER_SIZE)
+        self.receive_start = 0
+        self.receive_end = 0
         self.char_id = None
         self.char_name = None
         self.is_main = None
@@ -26,6 +34,8 @@ class Bot:
             self.socket.shutdown(socket.SHUT_RDWR)
             self.socket.close()
             self.socket = None
+        self.receive_start = 0
+        self.receive_end = 0
 
     def login(self, username, password, character, is_main, wait_for_logged_in=20):
         self.is_main = is_main
@@ -77,49 +87,80 @@ class Bot:
         Wait for packet from server.
         """
 
-        read, write, error = select.select([self.socket], [], [], max_delay_time)
-        if not read:
-            return None
-        else:
-            # Read data from server
-            head = self.read_bytes(4)
-            packet_type, packet_length = struct.unpack(">2H", head)
-            data = self.read_bytes(packet_length)
-
-            try:
-                return ServerPacket.get_instance(packet_type, data)
-            except Exception:
-                self.logger.error("Error parsing packet parameters for packet_type '%d' and payload: %s" % (packet_type, data), exc_info=True)
+        # packets that were already received are returned without waiting on the socket
+        deadline = time.time() + max_delay_time
+        packet_data = self.get_next_packet_data()
+        while not packet_data:
+            read, write, error = select.select([self.socket], [], [], max(deadline - time.time(), 0))
+            if not read:
                 return None
 
-    def send_packet(self, packet):
-        data = packet.to_bytes()
-        data = struct.pack(">2H", packet.id, len(data)) + data
+            self.receive()
+            packet_data = self.get_next_packet_data()
 
-        self.write_bytes(data)
+        return self.decode_packet(*packet_data)
 
-    def read_bytes(self, num_bytes):
-        data = bytes()
+    def decode_packet(self, packet_type, data):
+        try:
+            return ServerPacket.get_instance(packet_type, data)
+        except Exception:
+            self.logger.error("Error parsing packet parameters for packet_type '%d' and payload: %s" % (packet_type, data), exc_info=True)
+            return None
 
-        while num_bytes > 0:
-            chunk = self.socket.recv(num_bytes)
+    def receive(self):
+        # move any partial packet to the start of the buffer so there is always room for a complete packet
+        if self.receive_start > 0 and self.receive_end > self.RECEIVE_BUFFER_SIZE // 2:
+            remaining = self.receive_end - self.receive_start
+            self.receive_buffer[:remaining] = self.receive_buffer[self.receive_start:self.receive_end]
+            self.receive_start = 0
+            self.receive_end = remaining
 
-            if len(chunk) == 0:
-                raise EOFError
+        num_bytes = self.socket.recv_into(memoryview(self.receive_buffer)[self.receive_end:])
+        if num_bytes == 0:
+            raise EOFError
+
+        self.receive_end += num_bytes
+
+    def get_next_packet_data(self):
+        available = self.receive_end - self.receive_start
+        if available < self.PACKET_HEADER.size:
+            return None
+
+        packet_type, packet_length = self.PACKET_HEADER.unpack_from(self.receive_buffer, self.receive_start)
+        if available < self.PACKET_HEADER.size + packet_length:
+            return None
+
+        data_start = self.receive_start + self.PACKET_HEADER.size
+        data = bytes(self.receive_buffer[data_start:data_start + packet_length])
+
+        self.receive_start = data_start + packet_length
+        if self.receive_start == self.receive_end:
+            self.receive_start = 0
+            self.receive_end = 0
+
+        return packet_type, data
+
+    def send_packet(self, packet):
+        self.send_packets([packet])
 
-            num_bytes -= len(chunk)
-            data = data + chunk
+    def send_packets(self, packets):
+        # packets are written with a single send when possible
+        parts = []
+        for packet in packets:
+            data = packet.to_bytes()
+            parts.append(self.PACKET_HEADER.pack(packet.id, len(data)))
+            parts.append(data)
 
-        return data
+        self.write_bytes(b"".join(parts))
 
     def write_bytes(self, data):
-        num_bytes = len(data)
+        view = memoryview(data)
+        offset = 0
 
-        while num_bytes > 0:
-            sent = self.socket.send(data)
+        while offset < len(view):
+            sent = self.socket.send(view[offset:])
 
             if sent == 0:
                 raise EOFError
 
-            data = data[sent:]
-            num_bytes -= sent
+            offset += sent
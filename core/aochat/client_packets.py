@@ -2,6 +2,13 @@ from core.aochat.packets import *
 
 
 class ClientPacket(Packet):
+    # packet id -> packet class, filled in as packet classes are defined
+    packet_types = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ClientPacket.packet_types[cls.id] = cls
+
     def __init__(self, packet_id, types, args):
         self.id = packet_id
         self.types = types
@@ -15,36 +22,9 @@ class ClientPacket(Packet):
 
     @classmethod
     def get_instance(cls, packet_id, data):
-        if packet_id == LoginRequest.id:
-            LoginRequest.from_bytes(data)
-        elif packet_id == LoginSelect.id:
-            LoginSelect.from_bytes(data)
-        elif packet_id == CharacterLookup.id:
-            CharacterLookup.from_bytes(data)
-        elif packet_id == PrivateMessage.id:
-            PrivateMessage.from_bytes(data)
-        elif packet_id == BuddyAdd.id:
-            BuddyAdd.from_bytes(data)
-        elif packet_id == BuddyRemove.id:
-            BuddyRemove.from_bytes(data)
-        elif packet_id == PrivateChannelInvite.id:
-            PrivateChannelInvite.from_bytes(data)
-        elif packet_id == PrivateChannelKick.id:
-            PrivateChannelKick.from_bytes(data)
-        elif packet_id == PrivateChannelJoin.id:
-            PrivateChannelJoin.from_bytes(data)
-        elif packet_id == PrivateChannelLeave.id:
-            PrivateChannelLeave.from_bytes(data)
-        elif packet_id == PrivateChannelKickAll.id:
-            PrivateChannelKickAll.from_bytes(data)
-        elif packet_id == PrivateChannelMessage.id:
-            PrivateChannelMessage.from_bytes(data)
-        elif packet_id == PublicChannelMessage.id:
-            PublicChannelMessage.from_bytes(data)
-        elif packet_id == Ping.id:
-            Ping.from_bytes(data)
-        elif packet_id == ChatCommand.id:
-            ChatCommand.from_bytes(data)
+        packet_type = cls.packet_types.get(packet_id)
+        if packet_type:
+            return packet_type.from_bytes(data)
         else:
             return None
 
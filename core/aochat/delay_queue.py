@@ -1,11 +1,25 @@
+import bisect
 import time
+from collections import deque
 
 
 class DelayQueue:
-    def __init__(self, recovery: int, burst=0):
+    def __init__(self, recovery: int, burst=0, coalesce=None):
+        """
+
+        :param recovery: seconds it takes to recover one item from the burst allowance
+        :param burst: number of items that can be dequeued at once before being rate limited
+        :param coalesce: optional (previous_item, item) -> merged item or None, used to merge an item into the previous
+        item with the same priority while both are still queued
+        """
         self.recovery = recovery
         self.burst = burst
-        self.items = []
+        self.coalesce = coalesce
+        # priority -> deque of items in insertion order
+        self.queues = {}
+        # priorities that currently have items, lowest value (highest priority) first
+        self.priorities = []
+        self.size = 0
         self.next_packet = 0
 
     def enqueue(self, item, priority=50):
@@ -15,34 +29,111 @@ class DelayQueue:
         :param priority: 0 is highest priority
         :return:
         """
-        index = 0
-        for _priority, _item in self.items:
-            if priority < _priority:
-                index += 1
-            else:
-                break
+        queue = self.queues.get(priority)
+        if queue is None:
+            queue = deque()
+            self.queues[priority] = queue
+            bisect.insort(self.priorities, priority)
+        elif self.coalesce:
+            merged = self.coalesce(queue[-1], item)
+            if merged:
+                queue[-1] = merged
+                return
 
-        self.items.insert(index, (priority, item))
+        queue.append(item)
+        self.size += 1
 
     def dequeue(self):
-        if self.items:
-            t = time.time()
-            time_with_burst = t - (self.burst * self.recovery)
-            if self.next_packet < time_with_burst:
-                self.next_packet = time_with_burst
-
-            if t >= self.next_packet:
-                self.next_packet += self.recovery
-                (priority, item) = self.items.pop()
-                return item
+        if self.size and self.get_delay() == 0:
+            self.next_packet += self.recovery
+            return self._pop()
         else:
             return None
 
+    def get_delay(self, t=None):
+        """
+
+        :return: seconds until the next item can be dequeued, or None if the queue is empty
+        """
+        if not self.size:
+            return None
+
+        t = t or time.time()
+        # token bucket implemented as a virtual schedule, unused allowance accumulates up to the burst size
+        time_with_burst = t - (self.burst * self.recovery)
+        if self.next_packet < time_with_burst:
+            self.next_packet = time_with_burst
+
+        return max(self.next_packet - t, 0)
+
+    def remove(self, predicate):
+        """
+
+        :param predicate: item -> bool
+        :return: the items removed, in the order they would have been dequeued
+        """
+        removed = []
+        for priority in list(self.priorities):
+            queue = self.queues[priority]
+            kept = deque()
+            for item in queue:
+                if predicate(item):
+                    removed.append(item)
+                else:
+                    kept.append(item)
+
+            if kept:
+                self.queues[priority] = kept
+            else:
+                self._remove_priority(priority)
+
+        self.size -= len(removed)
+        return removed
+
+    def drop(self, count):
+        """
+
+        :param count: number of items to remove, the oldest items with the lowest priority are removed first
+        :return: the number of items removed
+        """
+        num_dropped = 0
+        while num_dropped < count and self.size:
+            priority = self.priorities[-1]
+            queue = self.queues[priority]
+            queue.popleft()
+            if not queue:
+                self._remove_priority(priority)
+
+            self.size -= 1
+            num_dropped += 1
+
+        return num_dropped
+
+    def _pop(self):
+        priority = self.priorities[0]
+        queue = self.queues[priority]
+        item = queue.popleft()
+        if not queue:
+            self._remove_priority(priority)
+
+        self.size -= 1
+        return item
+
+    def _remove_priority(self, priority):
+        del self.queues[priority]
+        self.priorities.remove(priority)
+
     def __len__(self):
-        return len(self.items)
+        return self.size
+
+    def __iter__(self):
+        for priority in self.priorities:
+            yield from self.queues[priority]
 
     def clear(self):
-        self.items = []
+        self.queues = {}
+        self.priorities = []
+        self.size = 0
 
     def is_empty(self):
-        return len(self.items) == 0
+        return self.size == 0
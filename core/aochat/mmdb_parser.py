@@ -1,89 +1,71 @@
+import mmap
 import struct
 from core.logger import Logger
 
 
 class MMDBParser:
+    ENTRY_STRUCT = struct.Struct("<II")
+
     def __init__(self, filename):
         self.filename = filename
         self.logger = Logger(__name__)
+        self.data = None
+        self.index = {}
+        self.categories = []
+        self.message_cache = {}
+        self.load()
+
+    def load(self):
+        """maps the mmdb file into memory and builds a (category_id, instance_id) -> offset index so that
+        message strings can be resolved without re-opening or scanning the file"""
 
-    def get_message_string(self, category_id, instance_id):
         with open(self.filename, mode="rb") as file:
-            categories = self.get_categories(file)
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
 
-            try:
-                category = next(categories)
-                while category["id"] != category_id:
-                    category = next(categories)
-                next_category = next(categories)
-            except StopIteration:
-                return None
+        self.index = {}
+        self.message_cache = {}
+        self.categories = list(self.get_categories())
 
-            instance = self.find_entry(file, instance_id, category["offset"], next_category["offset"])
+        # the last category is a sentinel which only marks where the entries of the previous category end
+        for category, next_category in zip(self.categories, self.categories[1:]):
+            for offset in range(category["offset"], next_category["offset"], self.ENTRY_STRUCT.size):
+                instance_id, string_offset = self.ENTRY_STRUCT.unpack_from(self.data, offset)
+                self.index[(category["id"], instance_id)] = string_offset
 
-            if instance:
-                file.seek(instance["offset"])
-                return self.read_string(file)
-            else:
-                return None
+        self.logger.debug("indexed %d message strings in %d categories from '%s'" % (len(self.index), max(len(self.categories) - 1, 0), self.filename))
 
-    def get_all_message_strings(self):
-        with open(self.filename, mode="rb") as file:
-            categories = iter(list(self.get_categories(file)))
-            next_category = next(categories)
-
-            while True:
-                try:
-                    category = next_category
-                    next_category = next(categories)
-                except StopIteration:
-                    break
-
-                max_offset = next_category["offset"]
-                file.seek(category["offset"])
-
-                instances = []
-                while file.tell() < max_offset:
-                    entry = self.read_entry(file)
-                    instances.append(entry)
-
-                for instance in instances:
-                    file.seek(instance["offset"])
-                    message_string = self.read_string(file)
-                    print([category["id"], instance["id"], message_string])
-
-    def find_entry(self, file, entry_id, min_offset, max_offset):
-        file.seek(min_offset)
-        entry = self.read_entry(file)
-        while file.tell() <= max_offset:
-            if entry["id"] == entry_id:
-                return entry
-            entry = self.read_entry(file)
-
-        return None
-
-    def get_categories(self, file):
-        file.seek(4)
-        num_categories = self.read_int(file)
-        for i in range(0, num_categories):
-            yield self.read_entry(file)
+    def get_message_string(self, category_id, instance_id):
+        key = (category_id, instance_id)
+        message = self.message_cache.get(key)
+        if message is not None:
+            return message
+
+        offset = self.index.get(key)
+        if offset is None:
+            return None
 
-    def read_entry(self, file):
-        return {"id": self.read_int(file), "offset": self.read_int(file)}
+        message = self.read_string(offset)
+        self.message_cache[key] = message
+        return message
 
-    def read_int(self, file):
-        return int.from_bytes(file.read(4), byteorder="little")
+    def get_all_message_strings(self):
+        for (category_id, instance_id), offset in self.index.items():
+            print([category_id, instance_id, self.read_string(offset)])
+
+    def get_categories(self):
+        num_categories = self.read_int(4)
+        for i in range(0, num_categories):
+            category_id, offset = self.ENTRY_STRUCT.unpack_from(self.data, 8 + i * self.ENTRY_STRUCT.size)
+            yield {"id": category_id, "offset": offset}
 
-    def read_string(self, file):
-        message = bytearray()
-        char = file.read(1)
-        i = 0
-        while char and char != b'\x00':
-            i += 1
-            message.append(ord(char))
-            char = file.read(1)
+    def read_int(self, offset):
+        return struct.unpack_from("<I", self.data, offset)[0]
 
-        return message.decode("utf-8")
+    def read_string(self, offset):
+        end = self.data.find(b"\x00", offset)
+        if end == -1:
+            end = len(self.data)
+        return self.data[offset:end].decode("utf-8")
 
     def read_base_85(self, num_str):
         n = 0
@@ -9,87 +9,140 @@ class PacketMissingArgument(Exception):
     pass
 
 
-def decode_args(types, data):
-    args = []
-    for argtype in types:
-        if argtype == "I":
-            elem, data = data[:4], data[4:]
-            result = struct.unpack(">I", elem)[0]
+SHORT = struct.Struct(">H")
+INT = struct.Struct(">I")
+GROUP_ID = struct.Struct(">BI")
 
-        elif argtype == "S":
-            length = struct.unpack(">H", data[:2])[0]
-            result = data[2:2 + length].decode("utf-8", "ignore")
-            data = data[2 + length:]
 
-        elif argtype == "B":
-            length = struct.unpack(">H", data[:2])[0]
-            result = data[2:2 + length]
-            data = data[2 + length:]
+def _decode_ints(count):
+    ints = struct.Struct(">%dI" % count)
 
-        elif argtype == "G":
-            result, data = data[:5], data[5:]
-            # Convert result (5 bytes) to a long.  Can't use
-            # struct.unpack(">Q", "\x00"*3 + result), since we
-            # can't rely on "long long" being available.
-            high, low = struct.unpack(">BI", result)
-            result = (high << 32) + low
-
-        elif argtype == "i":
-            length = struct.unpack(">H", data[:2])[0]
-            result = struct.unpack(">%sI" % length, data[2:2 + 4 * length])
-            data = data[2 + 4 * length:]
+    def decode(data, offset):
+        return ints.unpack_from(data, offset), offset + ints.size
 
-        elif argtype == "s":
-            length = struct.unpack(">H", data[:2])[0]
-            data = data[2:]
-            result = []
-            while length:
-                slength = struct.unpack(">H", data[:2])[0]
-                result.append(data[2:2 + slength].decode("utf-8"))
-                data = data[2 + slength:]
-                length -= 1
+    return decode
+
+
+def _decode_string(data, offset):
+    length = SHORT.unpack_from(data, offset)[0]
+    offset += 2
+    return str(data[offset:offset + length], "utf-8", "ignore"), offset + length
+
+
+def _decode_bytes(data, offset):
+    length = SHORT.unpack_from(data, offset)[0]
+    offset += 2
+    return bytes(data[offset:offset + length]), offset + length
+
+
+def _decode_group_id(data, offset):
+    high, low = GROUP_ID.unpack_from(data, offset)
+    return (high << 32) + low, offset + 5
+
+
+def _decode_int_array(data, offset):
+    length = SHORT.unpack_from(data, offset)[0]
+    return struct.unpack_from(">%dI" % length, data, offset + 2), offset + 2 + 4 * length
 
+
+def _decode_string_array(data, offset):
+    length = SHORT.unpack_from(data, offset)[0]
+    offset += 2
+    result = []
+    while length:
+        slength = SHORT.unpack_from(data, offset)[0]
+        offset += 2
+        result.append(str(data[offset:offset + slength], "utf-8"))
+        offset += slength
+        length -= 1
+    return result, offset
+
+
+# argtype -> (data, offset) -> (value, new offset), "I" is handled separately so consecutive ints can be read at once
+_field_decoders = {
+    "S": _decode_string,
+    "B": _decode_bytes,
+    "G": _decode_group_id,
+    "i": _decode_int_array,
+    "s": _decode_string_array
+}
+
+# types -> decoder
+_decoders = {}
+
+
+def get_decoder(types):
+    """Returns a function that decodes `data` into a list of args for the given types.
+    Decoders are compiled once per distinct `types` and cached."""
+
+    decoder = _decoders.get(types)
+    if decoder:
+        return decoder
+
+    # each step is (decoder, is_multiple) where is_multiple indicates the decoder returns a tuple of several args
+    steps = []
+    index = 0
+    while index < len(types):
+        argtype = types[index]
+        if argtype == "I":
+            count = len(types[index:]) - len(types[index:].lstrip("I"))
+            steps.append((_decode_ints(count), True))
+            index += count
+        elif argtype in _field_decoders:
+            steps.append((_field_decoders[argtype], False))
+            index += 1
         else:
             raise UnknownArgumentType(argtype)
 
-        args.append(result)
+    def decode(data):
+        view = memoryview(data)
+        offset = 0
+        args = []
+        for step, is_multiple in steps:
+            result, offset = step(view, offset)
+            if is_multiple:
+                args.extend(result)
+            else:
+                args.append(result)
+        return args
 
-    return args
+    _decoders[types] = decode
+    return decode
 
 
-def encode_args(types, args):
-    data = b""
+def decode_args(types, data):
+    return get_decoder(types)(data)
 
-    for argtype in types:
-        if not args:
-            raise PacketMissingArgument
 
-        it = args[0]
-        del args[0]
+def encode_args(types, args):
+    if len(args) < len(types):
+        raise PacketMissingArgument
 
+    parts = []
+    for argtype, it in zip(types, args):
         if argtype == "I":
-            data += struct.pack(">I", it)
+            parts.append(INT.pack(it))
 
         elif argtype == "S":
             encoded = it.encode("utf-8")
-            data += struct.pack(">H", len(encoded))
-            data += encoded
+            parts.append(SHORT.pack(len(encoded)))
+            parts.append(encoded)
 
         elif argtype == "G":
-            data += struct.pack(">BI", it >> 32, it & 0xffffffff)
+            parts.append(GROUP_ID.pack(it >> 32, it & 0xffffffff))
 
         elif argtype == "s":
-            data += struct.pack(">H", len(it))
+            parts.append(SHORT.pack(len(it)))
             for it_elem in it:
                 encoded = it_elem.encode("utf-8")
-                data += struct.pack(">H", len(encoded))
-                data += encoded
+                parts.append(SHORT.pack(len(encoded)))
+                parts.append(encoded)
 
         else:
             raise UnknownArgumentType(argtype)
 
-    return data
+    return b"".join(parts)
 
 
 class Packet:
-    pass
+    __slots__ = ()
@@ -3,10 +3,32 @@ from core.aochat.packets import *
 
 
 class ServerPacket(Packet):
-    def __init__(self, packet_id, types, args):
-        self.id = packet_id
-        self.types = types
-        self.args = args
+    __slots__ = ("_data", "_args")
+    # packet id -> packet class, filled in as packet classes are defined
+    packet_types = {}
+    id = None
+    types = ""
+    # names of the args, in order, which are exposed as attributes
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.decoder = staticmethod(get_decoder(cls.types))
+        for index, field in enumerate(cls.fields):
+            setattr(cls, field, property(cls._field_getter(index), cls._field_setter(index)))
+        ServerPacket.packet_types[cls.id] = cls
+
+    def __init__(self, args):
+        self._data = None
+        self._args = args
+
+    @property
+    def args(self):
+        # args are only decoded once they are accessed
+        if self._args is None:
+            self._args = self.decoder(self._data)
+            self._data = None
+        return self._args
 
     def to_bytes(self):
         return encode_args(self.types, self.args)
@@ -14,443 +36,299 @@ class ServerPacket(Packet):
     def __str__(self):
         return "ServerPacket(%d): %s" % (self.id, self.args)
 
+    @classmethod
+    def from_bytes(cls, data):
+        packet = cls.__new__(cls)
+        packet._data = data
+        packet._args = None
+        return packet
+
     @classmethod
     def get_instance(cls, packet_id, data):
-        if packet_id == LoginSeed.id:
-            return LoginSeed.from_bytes(data)
-        elif packet_id == LoginOK.id:
-            return LoginOK.from_bytes(data)
-        elif packet_id == LoginError.id:
-            return LoginError.from_bytes(data)
-        elif packet_id == LoginCharacterList.id:
-            return LoginCharacterList.from_bytes(data)
-        elif packet_id == CharacterUnknown.id:
-            return CharacterUnknown.from_bytes(data)
-        elif packet_id == CharacterName.id:
-            return CharacterName.from_bytes(data)
-        elif packet_id == CharacterLookup.id:
-            return CharacterLookup.from_bytes(data)
-        elif packet_id == PrivateMessage.id:
-            return PrivateMessage.from_bytes(data)
-        elif packet_id == VicinityMessage.id:
-            return VicinityMessage.from_bytes(data)
-        elif packet_id == BroadcastMessage.id:
-            return BroadcastMessage.from_bytes(data)
-        elif packet_id == SimpleSystemMessage.id:
-            return SimpleSystemMessage.from_bytes(data)
-        elif packet_id == SystemMessage.id:
-            return SystemMessage.from_bytes(data)
-        elif packet_id == BuddyAdded.id:
-            return BuddyAdded.from_bytes(data)
-        elif packet_id == BuddyRemoved.id:
-            return BuddyRemoved.from_bytes(data)
-        elif packet_id == PrivateChannelInvited.id:
-            return PrivateChannelInvited.from_bytes(data)
-        elif packet_id == PrivateChannelKicked.id:
-            return PrivateChannelKicked.from_bytes(data)
-        elif packet_id == PrivateChannelLeft.id:
-            return PrivateChannelLeft.from_bytes(data)
-        elif packet_id == PrivateChannelClientJoined.id:
-            return PrivateChannelClientJoined.from_bytes(data)
-        elif packet_id == PrivateChannelClientLeft.id:
-            return PrivateChannelClientLeft.from_bytes(data)
-        elif packet_id == PrivateChannelMessage.id:
-            return PrivateChannelMessage.from_bytes(data)
-        elif packet_id == PrivateChannelInviteRefused.id:
-            return PrivateChannelInviteRefused.from_bytes(data)
-        elif packet_id == PublicChannelJoined.id:
-            return PublicChannelJoined.from_bytes(data)
-        elif packet_id == PublicChannelLeft.id:
-            return PublicChannelLeft.from_bytes(data)
-        elif packet_id == PublicChannelMessage.id:
-            return PublicChannelMessage.from_bytes(data)
-        elif packet_id == Pong.id:
-            return Pong.from_bytes(data)
+        packet_type = cls.packet_types.get(packet_id)
+        if packet_type:
+            return packet_type.from_bytes(data)
         else:
             return None
 
+    @staticmethod
+    def _field_getter(index):
+        return lambda self: self.args[index]
+
+    @staticmethod
+    def _field_setter(index):
+        def set_field(self, value):
+            self.args[index] = value
+        return set_field
+
 
 class LoginSeed(ServerPacket):
+    __slots__ = ()
     id = 0
     types = "S"
+    fields = ("seed",)
 
     def __init__(self, seed):
-        self.seed = seed
-        super().__init__(self.id, self.types, [self.seed])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([seed])
 
 
 class LoginOK(ServerPacket):
+    __slots__ = ()
     id = 5
     types = ""
+    fields = ()
 
     def __init__(self):
-        super().__init__(self.id, self.types, [])
-
-    @classmethod
-    def from_bytes(cls, data):
-        return cls()
+        super().__init__([])
 
 
 class LoginError(ServerPacket):
+    __slots__ = ()
     id = 6
     types = "S"
+    fields = ("message",)
 
     def __init__(self, message):
-        self.message = message
-        super().__init__(self.id, self.types, [self.message])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([message])
 
 
 class LoginCharacterList(ServerPacket):
+    __slots__ = ()
     id = 7
     types = "isii"
+    fields = ("char_ids", "names", "levels", "online_statuses")
 
     def __init__(self, char_ids, names, levels, online_statuses):
-        self.char_ids = char_ids
-        self.names = names
-        self.levels = levels
-        self.online_statuses = online_statuses
-        super().__init__(self.id, self.types, [self.char_ids, self.names, self.levels, self.online_statuses])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_ids, names, levels, online_statuses])
 
 
 class CharacterUnknown(ServerPacket):
+    __slots__ = ()
     id = 10
     types = "I"
+    fields = ("char_id",)
 
     def __init__(self, char_id):
-        self.char_id = char_id
-        super().__init__(self.id, self.types, [self.char_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id])
 
 
 class CharacterName(ServerPacket):
+    __slots__ = ()
     id = 20
     types = "IS"
+    fields = ("char_id", "name")
 
     def __init__(self, char_id, name):
-        self.char_id = char_id
-        self.name = name
-        super().__init__(self.id, self.types, [self.char_id, self.name])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id, name])
 
 
 class CharacterLookup(ServerPacket):
+    __slots__ = ()
     id = 21
     types = "IS"
+    fields = ("char_id", "name")
 
     def __init__(self, char_id, name):
-        self.char_id = char_id
-        self.name = name
-        super().__init__(self.id, self.types, [self.char_id, self.name])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id, name])
 
 
 class PrivateMessage(ServerPacket):
+    __slots__ = ()
     id = 30
     types = "ISS"
+    fields = ("char_id", "message", "blob")
 
     def __init__(self, char_id, message, blob):
-        self.char_id = char_id
-        self.message = message
-        self.blob = blob
-        super().__init__(self.id, self.types, [self.char_id, self.message, self.blob])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id, message, blob])
 
 
 class VicinityMessage(ServerPacket):
+    __slots__ = ()
     id = 34
     types = "ISS"
+    fields = ("char_id", "message", "blob")
 
     def __init__(self, char_id, message, blob):
-        self.char_id = char_id
-        self.message = message
-        self.blob = blob
-        super().__init__(self.id, self.types, [self.char_id, self.message, self.blob])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id, message, blob])
 
 
 class BroadcastMessage(ServerPacket):
+    __slots__ = ()
     id = 35
     types = "SSS"
+    fields = ("text", "message", "blob")
 
     def __init__(self, text, message, blob):
-        self.text = text
-        self.message = message
-        self.blob = blob
-        super().__init__(self.id, self.types, [self.text, self.message, self.blob])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([text, message, blob])
 
 
 class SimpleSystemMessage(ServerPacket):
+    __slots__ = ()
     id = 36
     types = "S"
+    fields = ("message",)
 
     def __init__(self, message):
-        self.message = message
-        super().__init__(self.id, self.types, [self.message])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([message])
 
 
 class SystemMessage(ServerPacket):
+    __slots__ = ("extended_message",)
     id = 37
     types = "IIIB"
+    fields = ("client_id", "window_id", "message_id", "message_args")
 
     def __init__(self, client_id, window_id, message_id, message_args):
-        self.client_id = client_id
-        self.window_id = window_id
-        self.message_id = message_id
-        self.message_args = message_args
+        super().__init__([client_id, window_id, message_id, message_args])
         self.extended_message: ExtendedMessage = None
-        super().__init__(self.id, self.types, [self.client_id, self.window_id, self.message_id, self.message_args])
 
     @classmethod
     def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        packet = super().from_bytes(data)
+        packet.extended_message = None
+        return packet
 
     def __str__(self):
         return super().__str__() + ", ExtendedMessage: %s" % self.extended_message
 
 
 class BuddyAdded(ServerPacket):
+    __slots__ = ()
     id = 40
     types = "IIS"
+    fields = ("char_id", "online", "status")
 
     def __init__(self, char_id, online, status):
-        self.char_id = char_id
-        self.online = online
-        self.status = status
-        super().__init__(self.id, self.types, [self.char_id, self.online, self.status])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id, online, status])
 
 
 class BuddyRemoved(ServerPacket):
+    __slots__ = ()
     id = 41
     types = "I"
+    fields = ("char_id",)
 
     def __init__(self, char_id):
-        self.char_id = char_id
-        super().__init__(self.id, self.types, [self.char_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([char_id])
 
 
 class PrivateChannelInvited(ServerPacket):
+    __slots__ = ()
     id = 50
     types = "I"
+    fields = ("private_channel_id",)
 
     def __init__(self, private_channel_id):
-        self.private_channel_id = private_channel_id
-        super().__init__(self.id, self.types, [self.private_channel_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id])
 
 
 class PrivateChannelKicked(ServerPacket):
+    __slots__ = ()
     id = 51
     types = "I"
+    fields = ("private_channel_id",)
 
     def __init__(self, private_channel_id):
-        self.private_channel_id = private_channel_id
-        super().__init__(self.id, self.types, [self.private_channel_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id])
 
 
 # does not appear to be used
 # in testing, PrivateChannelKicked (id = 51) was always sent instead of this one
 class PrivateChannelLeft(ServerPacket):
+    __slots__ = ()
     id = 53
     types = "I"
+    fields = ("private_channel_id",)
 
     def __init__(self, private_channel_id):
-        self.private_channel_id = private_channel_id
-        super().__init__(self.id, self.types, [self.private_channel_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id])
 
 
 class PrivateChannelClientJoined(ServerPacket):
+    __slots__ = ()
     id = 55
     types = "II"
+    fields = ("private_channel_id", "char_id")
 
     def __init__(self, private_channel_id, char_id):
-        self.private_channel_id = private_channel_id
-        self.char_id = char_id
-        super().__init__(self.id, self.types, [self.private_channel_id, self.char_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id, char_id])
 
 
 class PrivateChannelClientLeft(ServerPacket):
+    __slots__ = ()
     id = 56
     types = "II"
+    fields = ("private_channel_id", "char_id")
 
     def __init__(self, private_channel_id, char_id):
-        self.private_channel_id = private_channel_id
-        self.char_id = char_id
-        super().__init__(self.id, self.types, [self.private_channel_id, self.char_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id, char_id])
 
 
 class PrivateChannelMessage(ServerPacket):
+    __slots__ = ()
     id = 57
     types = "IISS"
+    fields = ("private_channel_id", "char_id", "message", "blob")
 
     def __init__(self, private_channel_id, char_id, message, blob):
-        self.private_channel_id = private_channel_id
-        self.char_id = char_id
-        self.message = message
-        self.blob = blob
-        super().__init__(self.id, self.types, [self.private_channel_id, self.char_id, self.message, self.blob])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id, char_id, message, blob])
 
 
 class PrivateChannelInviteRefused(ServerPacket):
+    __slots__ = ()
     id = 58
     types = "II"
+    fields = ("private_channel_id", "char_id")
 
     def __init__(self, private_channel_id, char_id):
-        self.private_channel_id = private_channel_id
-        self.char_id = char_id
-        super().__init__(self.id, self.types, [self.private_channel_id, self.char_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([private_channel_id, char_id])
 
 
 class PublicChannelJoined(ServerPacket):
+    __slots__ = ()
     id = 60
     types = "GSIS"
+    fields = ("channel_id", "name", "unknown", "flags")
 
     def __init__(self, channel_id, name, unknown, flags):
-        self.channel_id = channel_id
-        self.name = name
-        self.unknown = unknown
-        self.flags = flags
-        super().__init__(self.id, self.types, [self.channel_id, self.name, self.unknown, self.flags])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([channel_id, name, unknown, flags])
 
 
 class PublicChannelLeft(ServerPacket):
+    __slots__ = ()
     id = 61
     types = "G"
+    fields = ("channel_id",)
 
     def __init__(self, channel_id):
-        self.channel_id = channel_id
-        super().__init__(self.id, self.types, [self.channel_id])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([channel_id])
 
 
 class PublicChannelMessage(ServerPacket):
+    __slots__ = ("extended_message",)
     id = 65
     types = "GISS"
+    fields = ("channel_id", "char_id", "message", "blob")
 
     def __init__(self, channel_id, char_id, message, blob):
-        self.channel_id = channel_id
-        self.char_id = char_id
-        self.message = message
-        self.blob = blob
+        super().__init__([channel_id, char_id, message, blob])
         self.extended_message: ExtendedMessage = None
-        super().__init__(self.id, self.types, [self.channel_id, self.char_id, self.message, self.blob])
 
     @classmethod
     def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        packet = super().from_bytes(data)
+        packet.extended_message = None
+        return packet
 
     def __str__(self):
         return super().__str__() + ", ExtendedMessage: %s" % self.extended_message
 
 
 class Pong(ServerPacket):
+    __slots__ = ()
     id = 100
     types = "S"
+    fields = ("blob",)
 
     def __init__(self, blob):
-        self.blob = blob
-        super().__init__(self.id, self.types, [self.blob])
-
-    @classmethod
-    def from_bytes(cls, data):
-        args = decode_args(cls.types, data)
-        return cls(*args)
+        super().__init__([blob])
@@ -1,3 +1,6 @@
+import math
+from collections import deque
+
 from core.conn import Conn
 from core.decorators import instance
 from core.lookup.character_service import CharacterService
@@ -11,14 +14,30 @@ class BuddyService:
     BUDDY_LOGON_EVENT = "buddy_logon"
     BUDDY_LOGOFF_EVENT = "buddy_logoff"
 
+    # buddy packets queued by add_buddies() and remove_buddies() are sent in batches of this size per conn, once per interval
+    BUDDY_BATCH_SIZE = 50
+    BUDDY_BATCH_INTERVAL = 1
+
     def __init__(self):
         self.buddy_list_size = 0
         self.logger = Logger(__name__)
+        # char_id -> buddy, the same dict objects are also stored in conn.buddy_list for the conn the buddy is on
+        self.buddies = {}
+        # type -> set of char_ids which have that type
+        self.buddies_by_type = {}
+        # conn char_id -> conn_id
+        self.conn_char_ids = {}
+        # conn_id -> max number of buddies for that conn
+        self.conn_capacities = {}
+        # conn_id -> deque of buddy packets waiting to be sent
+        self.pending_packets = {}
+        self.pending_packets_job_id = None
 
     def inject(self, registry):
         self.character_service: CharacterService = registry.get_instance("character_service")
         self.bot = registry.get_instance("bot")
         self.event_service = registry.get_instance("event_service")
+        self.job_scheduler = registry.get_instance("job_scheduler")
 
     def pre_start(self):
         self.bot.register_packet_handler(server_packets.BuddyAdded.id, self.handle_add)
@@ -32,22 +51,23 @@ class BuddyService:
             self.logger.warning("Buddy added or updated with char_id '0'")
             return
 
-        buddy = conn.buddy_list.get(packet.char_id, {"types": [], "conn_id": conn.id})
-        buddy["online"] = packet.online
-        conn.buddy_list[packet.char_id] = buddy
+        buddy = self.buddies.get(packet.char_id)
+        if buddy and buddy["conn_id"] != conn.id:
+            # buddy already exists on another conn, so move it to this conn and remove it from the other conn
+            other_conn = self.bot.conns.get(buddy["conn_id"])
+            if other_conn:
+                other_conn.buddy_list.pop(packet.char_id, None)
 
-        # verify that buddy does not exist on any other conn
-        for conn_id, other_conn in self.bot.get_conns():
-            if conn.id == conn_id:
-                continue
+                self.logger.warning("Removing char '%s' from conn '%s' since it already exists on another conn" % (packet.char_id, other_conn.id))
+                other_conn.send_packet(client_packets.BuddyRemove(packet.char_id))
 
-            buddy = other_conn.buddy_list.get(packet.char_id, None)
-            if buddy:
-                # remove from other conn list
-                del other_conn.buddy_list[packet.char_id]
+            buddy["conn_id"] = conn.id
+        elif not buddy:
+            buddy = {"types": [], "conn_id": conn.id}
+            self.buddies[packet.char_id] = buddy
 
-                self.logger.warning("Removing char '%s' from conn '%s' since it already exists on another conn" % (packet.char_id, conn.id))
-                other_conn.send_packet(client_packets.BuddyRemove(packet.char_id))
+        buddy["online"] = packet.online
+        conn.buddy_list[packet.char_id] = buddy
 
         if packet.online == 1:
             self.event_service.fire_event(self.BUDDY_LOGON_EVENT, packet)
@@ -58,17 +78,40 @@ class BuddyService:
         if packet.char_id == 0:
             self.logger.warning("Buddy removed with char_id '0'")
 
-        if packet.char_id in conn.buddy_list:
-            if len(conn.buddy_list[packet.char_id]["types"]) > 0:
-                self.logger.warning("Removing buddy %d that still has types %s" % (packet.char_id, conn.buddy_list[packet.char_id]["types"]))
+        buddy = conn.buddy_list.pop(packet.char_id, None)
+        if buddy:
+            if len(buddy["types"]) > 0:
+                self.logger.warning("Removing buddy %d that still has types %s" % (packet.char_id, buddy["types"]))
 
-            del conn.buddy_list[packet.char_id]
+            # only remove from the index if the buddy has not since been moved to another conn
+            if buddy["conn_id"] == conn.id:
+                del self.buddies[packet.char_id]
+                for _type in buddy["types"]:
+                    self._remove_from_type_index(packet.char_id, _type)
 
     def handle_login_ok(self, conn: Conn, packet):
         self.buddy_list_size += 1000
+        self.conn_capacities[conn.id] = 1000
+        self.conn_char_ids[conn.char_id] = conn.id
         # conn.buddy_list[conn.char_id] = {"online": True, "types": ["conn"], "conn_id": conn.id}
 
     def add_buddy(self, char_id, _type):
+        return self._add_buddy(char_id, _type, self._send_packet)
+
+    def add_buddies(self, char_ids, _type):
+        """
+        Adds many buddies at once. The buddy list is updated straight away, but the packets are spread over time
+        so that large changes do not flood the chat server.
+
+        Args:
+            char_ids: list of int
+            _type: str
+        """
+
+        for char_id in char_ids:
+            self._add_buddy(char_id, _type, self._queue_packet)
+
+    def _add_buddy(self, char_id, _type, send_packet):
         if not char_id:
             return False
 
@@ -76,50 +119,99 @@ class BuddyService:
         if self.is_conn_char_id(char_id):
             return False
 
-        buddy = self.get_buddy(char_id)
+        buddy = self.buddies.get(char_id)
         if buddy:
             buddy["types"].append(_type)
         else:
             conn = self.get_conn_for_new_buddy()
             # TODO send ChatCommand packet in order to get back response - use FeatureFlag
-            conn.send_packet(client_packets.BuddyAdd(char_id, "\1"))
-            conn.buddy_list[char_id] = {"online": None, "types": [_type], "conn_id": conn.id}
+            send_packet(conn, client_packets.BuddyAdd(char_id, "\1"))
+            buddy = {"online": None, "types": [_type], "conn_id": conn.id}
+            self.buddies[char_id] = buddy
+            conn.buddy_list[char_id] = buddy
+
+        self.buddies_by_type.setdefault(_type, set()).add(char_id)
 
         return True
 
     def is_conn_char_id(self, char_id):
-        for _id, conn in self.bot.get_conns():
-            if conn.char_id == char_id:
-                return True
-
-        return False
+        return char_id in self.conn_char_ids
 
     def remove_buddy(self, char_id, _type, force_remove=False):
+        return self._remove_buddy(char_id, _type, force_remove, self._send_packet)
+
+    def remove_buddies(self, char_ids, _type):
+        """
+        Removes many buddies at once, the counterpart of add_buddies()
+
+        Args:
+            char_ids: list of int
+            _type: str
+        """
+
+        for char_id in char_ids:
+            self._remove_buddy(char_id, _type, False, self._queue_packet)
+
+    def _remove_buddy(self, char_id, _type, force_remove, send_packet):
         if not char_id:
             return False
 
-        for _id, conn in self.bot.get_conns():
-            if char_id == conn.char_id:
-                continue
+        if self.is_conn_char_id(char_id):
+            return True
 
-            buddy = conn.buddy_list.get(char_id, None)
-            if buddy:
-                if _type in buddy["types"]:
-                    buddy["types"].remove(_type)
+        buddy = self.buddies.get(char_id)
+        if buddy:
+            if _type in buddy["types"]:
+                buddy["types"].remove(_type)
+                self._remove_from_type_index(char_id, _type)
 
-                if len(buddy["types"]) == 0 or force_remove:
-                    conn = self.bot.conns[buddy["conn_id"]]
-                    conn.send_packet(client_packets.BuddyRemove(char_id))
+            if len(buddy["types"]) == 0 or force_remove:
+                conn = self.bot.conns[buddy["conn_id"]]
+                send_packet(conn, client_packets.BuddyRemove(char_id))
 
         return True
 
+    def _send_packet(self, conn, packet):
+        # packets are not sent ahead of packets that are still waiting for the same conn, so they arrive in order
+        if conn.id in self.pending_packets:
+            self._queue_packet(conn, packet)
+        else:
+            conn.send_packet(packet)
+
+    def _queue_packet(self, conn, packet):
+        self.pending_packets.setdefault(conn.id, deque()).append(packet)
+        if not self.pending_packets_job_id:
+            self.pending_packets_job_id = self.job_scheduler.delayed_job(self.send_pending_packets, 0)
+
+    def send_pending_packets(self, t):
+        self.pending_packets_job_id = None
+        for conn_id, packets in list(self.pending_packets.items()):
+            batch = [packets.popleft() for _ in range(min(self.BUDDY_BATCH_SIZE, len(packets)))]
+            if not packets:
+                del self.pending_packets[conn_id]
+
+            conn = self.bot.conns.get(conn_id)
+            if conn:
+                conn.send_packets(batch)
+
+        if self.pending_packets:
+            self.pending_packets_job_id = self.job_scheduler.delayed_job(self.send_pending_packets, self.BUDDY_BATCH_INTERVAL)
+
+    def get_num_pending_packets(self):
+        return sum(len(packets) for packets in self.pending_packets.values())
+
+    def get_pending_packets_delay(self):
+        """Returns the number of seconds until all buddy packets which are currently queued have been sent"""
+
+        max_pending = max((len(packets) for packets in self.pending_packets.values()), default=0)
+        return math.ceil(max_pending / self.BUDDY_BATCH_SIZE) * self.BUDDY_BATCH_INTERVAL
+
     def get_buddy(self, char_id):
-        for _id, conn in self.bot.get_conns():
-            if conn.char_id == char_id:
-                return {"online": 1, "types": ["conn"], "conn_id": conn.id}
-            elif char_id in conn.buddy_list:
-                return conn.buddy_list[char_id]
-        return None
+        conn_id = self.conn_char_ids.get(char_id)
+        if conn_id:
+            return {"online": 1, "types": ["conn"], "conn_id": conn_id}
+
+        return self.buddies.get(char_id)
 
     def is_online(self, char_id):
         buddy = self.get_buddy(char_id)
@@ -129,36 +221,50 @@ class BuddyService:
             return buddy.get("online", None)
 
     def get_all_buddies(self):
-        result = {}
-        for _id, conn in self.bot.get_conns():
-            for char_id, buddy in conn.buddy_list.items():
-                # TODO what if buddies exist on multiple conns?
-                result[char_id] = buddy
+        return dict(self.buddies)
 
-        return result
+    def get_buddies_by_type(self, _type):
+        return {char_id: self.buddies[char_id] for char_id in self.buddies_by_type.get(_type, [])}
 
     def remove_all_buddies_by_type(self, _type):
-        buddies = filter(lambda obj: _type in obj["types"], self.get_all_buddies())
-        for char_id, buddy in buddies.items():
-            buddy["types"].remove(_type)
+        for char_id in self.buddies_by_type.pop(_type, set()):
+            buddy = self.buddies.get(char_id)
+            if not buddy:
+                continue
+
+            buddy["types"] = [t for t in buddy["types"] if t != _type]
 
             if len(buddy["types"]) == 0:
                 conn = self.bot.conns[buddy["conn_id"]]
                 conn.send_packet(client_packets.BuddyRemove(char_id))
 
     def get_buddy_list_size(self):
-        count = 0
-        for _id, conn in self.bot.get_conns():
-            count += len(conn.buddy_list)
+        return len(self.buddies)
 
-        return count
+    def get_free_buddy_slots(self):
+        # summed over all conns, since new buddies are spread over the conns by get_conn_for_new_buddy()
+        return sum(max(0, self.conn_capacities.get(_id, 1000) - len(conn.buddy_list)) for _id, conn in self.bot.get_conns())
 
     def get_conn_for_new_buddy(self):
-        buddy_list_size = None
+        # pick the conn with the most free space remaining on its buddy list
         selected_conn = None
+        free_space = None
         for _id, conn in self.bot.get_conns():
-            if buddy_list_size is None or len(conn.buddy_list) < buddy_list_size:
-                buddy_list_size = len(conn.buddy_list)
+            conn_free_space = self.conn_capacities.get(_id, 1000) - len(conn.buddy_list)
+            if free_space is None or conn_free_space > free_space:
+                free_space = conn_free_space
                 selected_conn = conn
 
         return selected_conn
+
+    def _remove_from_type_index(self, char_id, _type):
+        # a buddy can have the same type more than once, so only remove it from the index once all are gone
+        buddy = self.buddies.get(char_id)
+        if buddy and _type in buddy["types"]:
+            return
+
+        char_ids = self.buddies_by_type.get(_type)
+        if char_ids:
+            char_ids.discard(char_id)
+            if not char_ids:
+                del self.buddies_by_type[_type]
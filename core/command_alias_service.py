@@ -6,9 +6,11 @@ from core.logger import Logger
 class CommandAliasService:
     def __init__(self):
         self.logger = Logger(__name__)
+        self.alias_cache = None
 
     def inject(self, registry):
         self.db = registry.get_instance("db")
+        self.command_service = registry.get_instance("command_service")
 
     def check_for_alias(self, command_str):
         row = self.get_alias(command_str)
@@ -24,8 +26,20 @@ class CommandAliasService:
         else:
             return None
 
+    def can_resolve_without_args(self, command_str):
+        """Returns True if the command args are only appended to the aliased command, so the alias can be resolved ahead of time"""
+        return True
+
     def get_alias(self, alias):
-        return self.db.query_single("SELECT alias, command, enabled FROM command_alias WHERE alias = ?", [alias])
+        if self.alias_cache is None:
+            data = self.db.query("SELECT alias, command, enabled FROM command_alias")
+            self.alias_cache = {row.alias.lower(): row for row in data}
+
+        return self.alias_cache.get(alias.lower())
+
+    def clear_alias_cache(self):
+        self.alias_cache = None
+        self.command_service.invalidate_routing_table()
 
     def add_alias(self, alias, command, force_enable=False):
         """Call during start"""
@@ -35,9 +49,11 @@ class CommandAliasService:
                 return False
             elif force_enable:
                 self.db.exec("UPDATE command_alias SET command = ?, enabled = 1 WHERE alias = ?", [command, alias])
+                self.clear_alias_cache()
             return True
         else:
             self.db.exec("INSERT INTO command_alias (alias, command, enabled) VALUES (?, ?, 1)", [alias, command])
+            self.clear_alias_cache()
             return True
 
     def remove_alias(self, alias):
@@ -45,6 +61,7 @@ class CommandAliasService:
         if row:
             if row.enabled:
                 self.db.exec("UPDATE command_alias SET enabled = 0 WHERE alias = ?", [alias])
+                self.clear_alias_cache()
                 return True
             else:
                 return False
@@ -10,22 +10,27 @@ from core.sender_obj import SenderObj
 from core.setting_service import SettingService
 from core.registry import Registry
 from core.logger import Logger
+from core.metrics_service import Histogram
 from core.chat_blob import ChatBlob
 from core.functions import flatmap, get_attrs
 import collections
 import re
 import inspect
+import time
 
 
 @instance()
 class CommandService:
     PRIVATE_MESSAGE_CHANNEL = "msg"
+    MAX_ALIAS_DEPTH = 20
 
     def __init__(self):
         self.handlers = collections.defaultdict(list)
         self.logger = Logger(__name__)
         self.channels = {}
         self.pre_processors = []
+        self.routing_table = None
+        self.handler_times = Histogram("command_handler_seconds", "Time spent handling commands, per handler", ["handler"])
         self.ignore_regexes = [
             re.compile(r" is AFK \(Away from keyboard\) since ", re.IGNORECASE),
             re.compile(r"I am away from my keyboard right now", re.IGNORECASE),
@@ -139,6 +144,7 @@ class CommandService:
         # save reference to command handler
         r = re.compile(self.get_regex_from_params(params), re.IGNORECASE | re.DOTALL)
         self.handlers[command_key].append({"regex": r, "callback": handler, "help": help_text, "description": description, "params": params, "check_access": check_access})
+        self.invalidate_routing_table()
 
     def register_command_pre_processor(self, pre_processor):
         """
@@ -165,6 +171,7 @@ class CommandService:
 
         self.logger.debug("Registering command channel '%s'" % value)
         self.channels[value] = label
+        self.invalidate_routing_table()
 
     def is_command_channel(self, channel):
         return channel in self.channels
@@ -184,19 +191,19 @@ class CommandService:
 
             command_str, command_args = self.get_command_parts(message)
 
-            # check for command alias
-            command_alias_str = self.command_alias_service.get_alias_command_str(command_str, command_args)
-
-            alias_depth_count = 0
-            while command_alias_str:
-                alias_depth_count += 1
-                command_str, command_args = self.get_command_parts(command_alias_str)
-                command_alias_str = self.command_alias_service.get_alias_command_str(command_str, command_args)
+            # aliases that can be resolved ahead of time are already resolved in the routing table
+            route = self.get_route(command_str, channel)
+            if not route:
+                command_str, command_args = self.resolve_alias(command_str, command_args, message)
+                route = self.get_route(command_str, channel)
 
-                if alias_depth_count > 20:
-                    raise Exception("Command alias infinite recursion detected for command '%s'" % message)
+            if route:
+                command_str = route.command
+                command_args = route.args + command_args
+                cmd_configs = route.cmd_configs
+            else:
+                cmd_configs = []
 
-            cmd_configs = self.get_command_configs(command_str, channel, 1)
             access_level = self.access_service.get_access_level(char_id)
             sender = SenderObj(char_id, self.character_service.resolve_char_to_name(char_id, "Unknown(%d)" % char_id), access_level)
             if cmd_configs:
@@ -204,21 +211,22 @@ class CommandService:
                 cmd_config, matches, handler = self.get_matches(cmd_configs, command_args)
                 if matches:
                     if handler["check_access"](char_id, cmd_config.access_level):
-                        response = handler["callback"](CommandRequest(conn, channel, sender, reply), *self.process_matches(matches, handler["params"]))
-                        if response is not None:
-                            reply(response)
+                        handler_name = self.util.get_handler_name(handler["callback"])
+                        start_time = time.perf_counter()
+                        try:
+                            response = handler["callback"](CommandRequest(conn, channel, sender, reply), *self.process_matches(matches, handler["params"]))
+                            if response is not None:
+                                reply(response)
+                        finally:
+                            self.handler_times.observe(time.perf_counter() - start_time, handler_name)
 
                         # record command usage
-                        self.usage_service.add_usage(command_str, self.util.get_handler_name(handler["callback"]), char_id, channel)
+                        self.usage_service.add_usage(command_str, handler_name, char_id, channel)
                     else:
                         self.access_denied_response(message, sender, cmd_config, reply)
                 else:
                     # handlers were found, but no handler regex matched
-                    data = self.db.query("SELECT command, sub_command, access_level FROM command_config "
-                                         "WHERE command = ? AND channel = ? AND enabled = 1",
-                                         [command_str, channel])
-
-                    help_text = self.format_help_text(data, char_id)
+                    help_text = self.format_help_text(cmd_configs, char_id)
                     if help_text:
                         reply(self.format_help_text_blob(command_str, help_text))
                     else:
@@ -260,11 +268,82 @@ class CommandService:
 
         return self.db.query(sql, params)
 
+    def resolve_alias(self, command_str, command_args, message):
+        command_alias_str = self.command_alias_service.get_alias_command_str(command_str, command_args)
+
+        alias_depth_count = 0
+        while command_alias_str:
+            alias_depth_count += 1
+            command_str, command_args = self.get_command_parts(command_alias_str)
+            command_alias_str = self.command_alias_service.get_alias_command_str(command_str, command_args)
+
+            if alias_depth_count > self.MAX_ALIAS_DEPTH:
+                raise Exception("Command alias infinite recursion detected for command '%s'" % message)
+
+        return command_str, command_args
+
+    def resolve_alias_ahead_of_time(self, alias):
+        """Returns the command and the args to put in front of the command args for an alias, or None if the alias depends on the command args or is recursive"""
+
+        command_str, command_args = alias, ""
+        for _ in range(self.MAX_ALIAS_DEPTH + 1):
+            if not self.command_alias_service.can_resolve_without_args(command_str):
+                return None
+
+            command_alias_str = self.command_alias_service.get_alias_command_str(command_str, command_args)
+            if not command_alias_str:
+                return command_str, command_args
+
+            command_str, command_args = self.get_command_parts(command_alias_str)
+
+        return None
+
+    def get_route(self, command, channel):
+        """
+        Returns the route for a command or alias and channel from the in-memory routing table, or None if there is no route
+
+        Returns:
+            DictObject with the resolved `command`, the `args` to put in front of the command args,
+            and the enabled command configs for the command along with their handlers as `cmd_configs`
+        """
+
+        if self.routing_table is None:
+            self.routing_table = self.build_routing_table()
+
+        return self.routing_table.get((command, channel))
+
+    def build_routing_table(self):
+        cmd_configs = collections.defaultdict(list)
+        data = self.db.query("SELECT command, sub_command, access_level, channel, enabled FROM command_config "
+                             "WHERE enabled = 1 ORDER BY sub_command, channel")
+        for row in data:
+            row["handlers"] = self.handlers[self.get_command_key(row.command, row.sub_command)]
+            cmd_configs[(row.command, row.channel)].append(row)
+
+        routing_table = {}
+        for (command, channel), rows in cmd_configs.items():
+            routing_table[(command, channel)] = DictObject({"command": command, "args": "", "cmd_configs": rows})
+
+        # aliases take precedence over commands with the same name
+        for row in self.command_alias_service.get_enabled_aliases():
+            alias = row.alias.lower()
+            resolved = self.resolve_alias_ahead_of_time(alias)
+            for channel in self.channels:
+                routing_table.pop((alias, channel), None)
+                if resolved:
+                    command, args = resolved
+                    routing_table[(alias, channel)] = DictObject({"command": command, "args": args, "cmd_configs": cmd_configs.get((command, channel), [])})
+
+        return routing_table
+
+    def invalidate_routing_table(self):
+        """Call after changing the command_config or command_alias tables so that the change is picked up when processing commands"""
+
+        self.routing_table = None
+
     def get_matches(self, cmd_configs, command_args):
         for row in cmd_configs:
-            command_key = self.get_command_key(row.command, row.sub_command)
-            handlers = self.handlers[command_key]
-            for handler in handlers:
+            for handler in row["handlers"]:
                 matches = handler["regex"].search(command_args)
                 if matches:
                     return row, matches, handler
@@ -337,7 +416,8 @@ class CommandService:
         return self.handlers.get(command_key, None)
 
     def handle_private_message(self, conn: Conn, packet: server_packets.PrivateMessage):
-        if not self.setting_service.get("accept_commands_from_slave_bots").get_value() and not conn.is_main:
+        settings = self.setting_service.get_snapshot()
+        if not settings.accept_commands_from_slave_bots and not conn.is_main:
             return
 
         # since the command symbol is not required for private messages,
@@ -364,7 +444,7 @@ class CommandService:
             conn)
 
     def trim_command_symbol(self, s):
-        symbol = self.setting_service.get("symbol").get_value()
+        symbol = self.setting_service.get_snapshot().symbol
         if s.startswith(symbol):
             s = s[len(symbol):]
         return s
@@ -2,19 +2,32 @@ import threading
 import time
 
 from core.aochat.bot import Bot
-from core.aochat.client_packets import Ping
+from core.aochat.client_packets import Ping, PrivateMessage, PublicChannelMessage
 from core.aochat.delay_queue import DelayQueue
 from core.dict_object import DictObject
 
 
 class Conn(Bot):
+    # when more messages than this are queued, tells are moved to the overflow queue to be sent by other conns,
+    # and if there are still too many queued the oldest messages with the lowest priority are dropped
+    MAX_QUEUED_MESSAGES = 30
+    # coalesced messages are kept well below the max page lengths so they are never too long to be sent
+    MAX_COALESCED_MESSAGE_LENGTH = 1000
+
     def __init__(self, _id, failure_callback):
         super().__init__()
         self.id = _id
-        self.packet_queue = DelayQueue(2, 2.5)
+        self.packet_queue = DelayQueue(2, 2.5, self.coalesce_packets)
+        self.packet_queue_condition = threading.Condition()
+        self.overflow_queue = None
+        # called after packets are queued, if the conn is being serviced by something other than run_sender()
+        self.wakeup = None
         self.packet_last_received_timestamp = time.time()
         self.failure_callback = failure_callback
         self.send_lock = threading.Lock()
+        # packet id -> number of packets, read by the metrics service
+        self.packets_received = {}
+        self.packets_sent = {}
         self.org_channel_id = None
         self.org_id = None
         self.org_name = None
@@ -27,46 +40,157 @@ class Conn(Bot):
         })
 
     def read_packet(self, max_delay_time=1):
-        self.check_outgoing_message_queue()
         packet = super().read_packet(max_delay_time)
         if not packet:
-            time_since = time.time() - self.packet_last_received_timestamp
-            if time_since > 90:
-                self.logger.error(f"no packet received in 90 seconds for conn {self.id}")
-                self.failure_callback()
-            elif time_since > 60:
-                self.send_packet(Ping("tyrbot_aochat"))
+            self.check_connection()
         else:
             self.packet_last_received_timestamp = time.time()
+            self.packets_received[packet.id] = self.packets_received.get(packet.id, 0) + 1
         return packet
 
+    def read_buffered_packets(self):
+        # returns all complete packets that have already been received
+        packets = []
+        packet_data = self.get_next_packet_data()
+        while packet_data:
+            packet = self.decode_packet(*packet_data)
+            if packet:
+                packets.append(packet)
+                self.packets_received[packet.id] = self.packets_received.get(packet.id, 0) + 1
+            packet_data = self.get_next_packet_data()
+
+        if packets:
+            self.packet_last_received_timestamp = time.time()
+        return packets
+
+    def check_connection(self):
+        time_since = time.time() - self.packet_last_received_timestamp
+        if time_since > 90:
+            self.logger.error(f"no packet received in 90 seconds for conn {self.id}")
+            self.failure_callback()
+        elif time_since > 60:
+            self.send_packet(Ping("tyrbot_aochat"))
+
     def send_packet(self, packet):
+        self.send_packets([packet])
+
+    def send_packets(self, packets):
         # synchronize sending packets
         try:
             with self.send_lock:
-                super().send_packet(packet)
+                super().send_packets(packets)
+                for packet in packets:
+                    self.packets_sent[packet.id] = self.packets_sent.get(packet.id, 0) + 1
         except Exception as e:
             self.failure_callback()
 
     def add_packets_to_queue(self, packets):
-        for packet in packets:
-            self.packet_queue.enqueue(packet)
-        self.check_outgoing_message_queue()
+        with self.packet_queue_condition:
+            for packet in packets:
+                self.packet_queue.enqueue(packet)
+            self.check_outgoing_message_queue()
+            self.packet_queue_condition.notify()
 
-    def check_outgoing_message_queue(self):
-        # check packet queue for outgoing packets
-        outgoing_packet = self.packet_queue.dequeue()
-        while outgoing_packet:
-            self.send_packet(outgoing_packet)
-            outgoing_packet = self.packet_queue.dequeue()
+        if self.wakeup:
+            self.wakeup()
 
-        num_messages = len(self.packet_queue)
-        if num_messages > 30:
-            self.logger.warning("automatically clearing outgoing message queue (%d messages)" % num_messages)
+    def clear_packet_queue(self):
+        with self.packet_queue_condition:
+            num_messages = len(self.packet_queue)
             self.packet_queue.clear()
-        elif num_messages > 10:
+            return num_messages
+
+    def check_outgoing_message_queue(self):
+        num_messages = len(self.packet_queue)
+        if num_messages > self.MAX_QUEUED_MESSAGES and self.overflow_queue:
+            num_moved = self.move_private_messages_to_overflow_queue(num_messages - self.MAX_QUEUED_MESSAGES)
+            if num_moved:
+                self.logger.warning("moved %d messages from outgoing message queue to overflow queue (%d messages)" % (num_moved, num_messages))
+                num_messages -= num_moved
+
+        if num_messages > self.MAX_QUEUED_MESSAGES:
+            num_dropped = self.packet_queue.drop(num_messages - self.MAX_QUEUED_MESSAGES)
+            self.logger.warning("dropped %d messages from outgoing message queue (%d messages)" % (num_dropped, num_messages))
+            num_messages -= num_dropped
+
+        if num_messages > 10:
             self.logger.warning("%d messages in outgoing message queue" % num_messages)
 
+    def move_private_messages_to_overflow_queue(self, min_messages):
+        # all queued tells to a recipient are moved together so that multi-page messages are still received in order,
+        # starting with the recipients that were most recently added to the queue
+        recipients = {}
+        for packet in self.packet_queue:
+            if isinstance(packet, PrivateMessage):
+                recipients[packet.char_id] = recipients.get(packet.char_id, 0) + 1
+
+        selected = set()
+        num_selected = 0
+        for char_id, count in reversed(recipients.items()):
+            if num_selected >= min_messages:
+                break
+            selected.add(char_id)
+            num_selected += count
+
+        packets = self.packet_queue.remove(lambda x: isinstance(x, PrivateMessage) and x.char_id in selected)
+        for packet in packets:
+            self.overflow_queue.put(packet)
+
+        return len(packets)
+
+    def coalesce_packets(self, previous_packet, packet):
+        # consecutive short messages to the same destination are sent as a single message
+        if type(previous_packet) != type(packet) or previous_packet.blob != packet.blob:
+            return None
+
+        if len(previous_packet.message) + len(packet.message) + 1 > self.MAX_COALESCED_MESSAGE_LENGTH:
+            return None
+
+        if isinstance(packet, PrivateMessage) and previous_packet.char_id == packet.char_id:
+            return PrivateMessage(packet.char_id, previous_packet.message + "\n" + packet.message, packet.blob)
+        elif isinstance(packet, PublicChannelMessage) and previous_packet.channel_id == packet.channel_id:
+            return PublicChannelMessage(packet.channel_id, previous_packet.message + "\n" + packet.message, packet.blob)
+        else:
+            return None
+
+    def run_sender(self, is_running, mass_message_queue=None):
+        # sends queued packets as soon as the rate limit allows, and takes packets from the mass message queue when idle
+        while is_running():
+            self.send_queued_packets(mass_message_queue)
+            with self.packet_queue_condition:
+                # checked while holding the lock so that packets queued while sending are not missed
+                delay = self.packet_queue.get_delay()
+                if delay is None:
+                    self.packet_queue_condition.wait(0.1 if mass_message_queue else 1)
+                elif delay > 0:
+                    self.packet_queue_condition.wait(delay)
+
+    def send_queued_packets(self, mass_message_queue=None):
+        """Sends every queued packet that the rate limit allows, taking a packet from `mass_message_queue` if nothing is queued
+
+        Returns:
+            seconds until another packet can be sent, or None if there are no packets queued
+        """
+
+        packets = []
+        with self.packet_queue_condition:
+            if mass_message_queue and self.packet_queue.is_empty():
+                mass_message_packet = mass_message_queue.get_or_default(block=False)
+                if mass_message_packet:
+                    self.packet_queue.enqueue(mass_message_packet)
+
+            packet = self.packet_queue.dequeue()
+            while packet:
+                packets.append(packet)
+                packet = self.packet_queue.dequeue()
+
+            delay = self.packet_queue.get_delay()
+
+        if packets:
+            self.send_packets(packets)
+
+        return delay
+
     def get_char_name(self):
         return self.char_name
 
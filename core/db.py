@@ -1,12 +1,85 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+
 from core.decorators import instance
 from core.dict_object import DictObject
 from core.logger import Logger
+from core.metrics_service import Counter, Histogram
 from pkg_resources import parse_version
 import mysql.connector
 import sqlite3
 import re
 import os
+import threading
 import time
+import weakref
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections, which are created on demand up to `max_size`"""
+
+    def __init__(self, connect, max_size):
+        """
+        Args:
+            connect: () -> connection
+            max_size: int
+        """
+
+        self.connect = connect
+        self.max_size = max_size
+        self.idle = []
+        self.size = 0
+        self.condition = threading.Condition()
+
+    def get(self):
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                self.condition.wait()
+
+            if self.idle:
+                return self.idle.pop()
+
+            self.size += 1
+
+        try:
+            return self.connect()
+        except Exception:
+            self.discard(None)
+            raise
+
+    def put(self, conn):
+        with self.condition:
+            self.idle.append(conn)
+            self.condition.notify()
+
+    def discard(self, conn):
+        """Removes a connection that is no longer usable from the pool"""
+
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def get_num_idle(self):
+        return len(self.idle)
+
+    def get_num_in_use(self):
+        return self.size - len(self.idle)
+
+
+class DBThreadState(threading.local):
+    def __init__(self):
+        # connection pinned to the thread while in a transaction or a connection() block
+        self.conn = None
+        self.pin_count = 0
+        self.conn_discarded = False
+        self.transaction_level = 0
+        self.lastrowid = None
 
 
 @instance()
@@ -14,13 +87,43 @@ class DB:
     SQLITE = "sqlite"
     MYSQL = "mysql"
 
+    MAX_MYSQL_CONNECTIONS = 5
+    SQL_CACHE_SIZE = 500
+    # in-memory search indexes are only used when the keys of the matching rows fit in an IN list of this size,
+    # which is a power of two since IN lists are padded to a power of two
+    MAX_SEARCH_INDEX_VALUES = 512
+    # lock wait timeout and deadlock, which can succeed when the statement is run again
+    TRANSIENT_MYSQL_ERRNOS = {1205, 1213}
+
     def __init__(self):
+        # the SQLite connection, which is shared by all threads and is only used by one thread at a time
         self.conn = None
+        self.sqlite_lock = threading.RLock()
+        # MySQL connections are pooled so each thread can use its own
+        self.pool = None
+        self.thread_state = DBThreadState()
+        # (db type, sql) -> translated sql, so statement templates are only translated once
+        self.sql_cache = OrderedDict()
+        # sql -> parsed <EXTENDED_LIKE> template
+        self.extended_like_cache = OrderedDict()
+        self.sql_cache_lock = threading.Lock()
+        # MySQL connection -> buffered cursor, which is reused since the driver checks the connection with a round trip to the server
+        # every time a cursor is created
+        self.cursors = weakref.WeakKeyDictionary()
         self.enhanced_like_regex = re.compile(r"(\s+)(\S+)\s+<EXTENDED_LIKE=(\d+)>\s+\?(\s*)", re.IGNORECASE)
-        self.lastrowid = None
+        self.table_alias_regex = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|ON|USING|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|JOIN|ORDER|GROUP|HAVING|LIMIT|UNION)\b)(\w+))?", re.IGNORECASE)
+        # the trigram tokenizer can only use the index for search terms with at least 3 consecutive non-wildcard characters
+        self.search_index_term_regex = re.compile(r"[^%_]{3}")
+        # the in-memory index can only be used for search terms without wildcards, which can only match within a single word
+        self.memory_search_index_term_regex = re.compile(r"^[^%_\s]+$")
+        self.search_indexes = {}
+        self.insert_statement_regex = re.compile(r"^(INSERT(?: OR IGNORE)? INTO\s+\S+(?:\s*\([^)]*\))?\s*VALUES)\s*(\(.*\))\s*;?$", re.IGNORECASE)
         self.logger = Logger(__name__)
         self.type = None
-        self.transaction_level = 0
+        self.query_times = Histogram("db_query_seconds", "Time spent executing queries, per SQL statement", ["sql"], max_series=500)
+        self.connection_wait_times = Histogram("db_connection_wait_seconds", "Time spent waiting for a database connection")
+        self.reconnects = Counter("db_reconnects_total", "Queries retried after the database connection was lost")
+        self.sql_cache_lookups = Counter("db_sql_cache_lookups_total", "Lookups of translated SQL statements, per result", ["result"])
 
     def sqlite_row_factory(self, cursor: sqlite3.Cursor, row):
         d = {}
@@ -29,94 +132,254 @@ class DB:
         return d
 
     def connect_mysql(self, host, port, username, password, database_name):
+        def connect():
+            conn = mysql.connector.connect(user=username, password=password, host=host, port=port, database=database_name, charset="utf8", autocommit=True)
+            # session settings must be applied to every connection in the pool
+            cur = conn.cursor()
+            cur.execute("SET collation_connection = 'utf8_general_ci'")
+            cur.execute("SET sql_mode = 'TRADITIONAL,ANSI'")
+            cur.close()
+            return conn
+
         self.type = self.MYSQL
-        self.conn = mysql.connector.connect(user=username, password=password, host=host, port=port, database=database_name, charset="utf8", autocommit=True)
-        self.exec("SET collation_connection = 'utf8_general_ci'")
-        self.exec("SET sql_mode = 'TRADITIONAL,ANSI'")
+        self.pool = ConnectionPool(connect, self.MAX_MYSQL_CONNECTIONS)
         self.create_db_version_table()
 
     def connect_sqlite(self, filename):
         self.type = self.SQLITE
-        self.conn = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.conn = sqlite3.connect(filename, isolation_level=None, check_same_thread=False, cached_statements=self.SQL_CACHE_SIZE)
         self.conn.row_factory = self.sqlite_row_factory
         self.create_db_version_table()
 
     def create_db_version_table(self):
         self.exec("CREATE TABLE IF NOT EXISTS db_version (file VARCHAR(255) NOT NULL, version VARCHAR(255) NOT NULL, verified SMALLINT NOT NULL)")
 
-    def get_cursor(self):
+    def get_cursor(self, conn):
         if self.type == self.MYSQL:
-            # buffered=True - https://stackoverflow.com/a/33632767/280574
-            return self.conn.cursor(dictionary=True, buffered=True)
+            # the connection is only used by one thread at a time, but the dict of connections is shared
+            with self.sql_cache_lock:
+                cur = self.cursors.get(conn)
+                if cur is None:
+                    # buffered=True - https://stackoverflow.com/a/33632767/280574
+                    cur = conn.cursor(dictionary=True, buffered=True)
+                    self.cursors[conn] = cur
+            return cur
         else:
-            return self.conn.cursor()
+            return conn.cursor()
+
+    def translate_sql(self, sql):
+        """Returns `sql` formatted for the current database type and driver"""
+
+        key = (self.type, sql)
+        with self.sql_cache_lock:
+            translated_sql = self.sql_cache.get(key)
+            if translated_sql:
+                self.sql_cache.move_to_end(key)
+
+        if translated_sql:
+            self.sql_cache_lookups.inc("hit")
+            return translated_sql
+
+        self.sql_cache_lookups.inc("miss")
+        translated_sql, _ = self.format_sql(sql)
+        if self.type == self.MYSQL:
+            translated_sql = translated_sql.replace("?", "%s")
+
+        with self.sql_cache_lock:
+            self.sql_cache[key] = translated_sql
+            if len(self.sql_cache) > self.SQL_CACHE_SIZE:
+                self.sql_cache.popitem(last=False)
+
+        return translated_sql
+
+    def _acquire_connection(self):
+        state = self.thread_state
+        if state.conn:
+            return state.conn
 
-    def _execute_wrapper(self, sql, params, callback, log_query):
-        cur = self.get_cursor()
         start_time = time.time()
+        if self.type == self.MYSQL:
+            conn = self.pool.get()
+        else:
+            self.sqlite_lock.acquire()
+            conn = self.conn
+        self.connection_wait_times.observe(time.time() - start_time)
+        return conn
+
+    def _release_connection(self, conn):
+        if conn is self.thread_state.conn:
+            return
+
+        if self.type == self.MYSQL:
+            self.pool.put(conn)
+        else:
+            self.sqlite_lock.release()
+
+    def _discard_connection(self, conn):
+        if conn is self.thread_state.conn:
+            # the pinned connection is not returned to the pool when the transaction or connection() block ends
+            self.thread_state.conn_discarded = True
+        self.pool.discard(conn)
+
+    def _pin_connection(self):
+        state = self.thread_state
+        if state.pin_count == 0:
+            state.conn = self._acquire_connection()
+            state.conn_discarded = False
+        state.pin_count += 1
+
+    def _unpin_connection(self):
+        state = self.thread_state
+        state.pin_count -= 1
+        if state.pin_count == 0:
+            conn = state.conn
+            state.conn = None
+            if not state.conn_discarded:
+                self._release_connection(conn)
+
+    @contextmanager
+    def connection(self):
+        """Uses the same connection for all statements executed by the current thread within the `with` block"""
+
+        self._pin_connection()
         try:
-            cur.execute(sql if self.type == self.SQLITE else sql.replace("?", "%s"), params)
-            if log_query:
-                self.logger.info("'%s' [%s]" % (sql, ", ".join(map(lambda x: str(x), params))))
-        except Exception as e:
-            raise SqlException("SQL Error: '%s' for '%s' [%s]" % (str(e), sql, ", ".join(map(lambda x: str(x), params)))) from e
+            yield self
+        finally:
+            self._unpin_connection()
 
-        elapsed = time.time() - start_time
+    def _is_connection_lost(self, conn, e):
+        if self.type != self.MYSQL or not isinstance(e, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)):
+            return False
 
-        if elapsed > 0.5:
-            self.logger.warning("slow query (%fs) '%s' for params: %s" % (elapsed, sql, str(params)))
+        try:
+            return not conn.is_connected()
+        except Exception:
+            return True
+
+    def is_transient_error(self, e):
+        """
+        Returns True if `e`, raised by one of the query or exec methods, is an error that may not happen again
+        if the statement is retried later, such as a locked database or a lost connection
+
+        Args:
+            e: Exception
+        """
+
+        cause = e.__cause__ if isinstance(e, SqlException) else e
+        if isinstance(cause, sqlite3.OperationalError):
+            message = str(cause)
+            return "locked" in message or "busy" in message
+        elif isinstance(cause, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)):
+            return True
+        elif isinstance(cause, mysql.connector.errors.Error):
+            return cause.errno in self.TRANSIENT_MYSQL_ERRNOS
+        else:
+            return False
 
-        result = callback(cur)
-        cur.close()
-        return result
+    def _execute_wrapper(self, sql, params, callback, log_query, retry=False, many=False, template=None):
+        translated_sql = self.translate_sql(sql)
+        conn = self._acquire_connection()
+        try:
+            start_time = time.time()
+            cur = None
+            try:
+                cur = self.get_cursor(conn)
+                if many:
+                    cur.executemany(translated_sql, params)
+                else:
+                    cur.execute(translated_sql, params)
+                if log_query:
+                    self.logger.info("'%s' [%s]" % (sql, ", ".join(map(lambda x: str(x), params))))
+            except Exception as e:
+                if self._is_connection_lost(conn, e):
+                    self._discard_connection(conn)
+                    conn = None
+
+                    # reads can safely be run again on a new connection, unless the thread is pinned to the lost connection
+                    if retry and not self.thread_state.conn:
+                        self.logger.warning("Database connection lost, retrying query: %s" % str(e))
+                        self.reconnects.inc()
+                        return self._execute_wrapper(sql, params, callback, log_query, template=template)
+
+                raise SqlException("SQL Error: '%s' for '%s' [%s]" % (str(e), sql, ", ".join(map(lambda x: str(x), params)))) from e
+
+            elapsed = time.time() - start_time
+
+            if elapsed > 0.5:
+                self.logger.warning("slow query (%fs) '%s' for params: %s" % (elapsed, sql, str(params)))
+
+            result = callback(cur)
+            if self.type == self.SQLITE:
+                cur.close()
+            # queries with <EXTENDED_LIKE> are recorded under the statement they were generated from, so each search doesn't add a series
+            self.query_times.observe(time.time() - start_time, template or sql)
+            return result
+        finally:
+            if conn:
+                self._release_connection(conn)
 
     def query_single(self, sql, params=None, extended_like=False, log_query=False):
         if params is None:
             params = []
 
+        template = sql
         if extended_like:
             sql, params = self.handle_extended_like(sql, params)
 
-        sql, params = self.format_sql(sql, params)
-
         def map_result(cur):
             row = cur.fetchone()
             return DictObject(row) if row else None
 
-        return self._execute_wrapper(sql, params, map_result, log_query)
+        return self._execute_wrapper(sql, params, map_result, log_query, retry=True, template=template)
 
     def query(self, sql, params=None, extended_like=False, log_query=False):
         if params is None:
             params = []
 
+        template = sql
         if extended_like:
             sql, params = self.handle_extended_like(sql, params)
 
-        sql, params = self.format_sql(sql, params)
-
         def map_result(cur):
             return list(map(lambda row: DictObject(row), cur.fetchall()))
 
-        return self._execute_wrapper(sql, params, map_result, log_query)
+        return self._execute_wrapper(sql, params, map_result, log_query, retry=True, template=template)
 
     def exec(self, sql, params=None, extended_like=False, log_query=False):
         if params is None:
             params = []
 
+        template = sql
         if extended_like:
             sql, params = self.handle_extended_like(sql, params)
 
-        sql, params = self.format_sql(sql, params)
-
         def map_result(cur):
             return [cur.rowcount, cur.lastrowid]
 
-        row_count, lastrowid = self._execute_wrapper(sql, params, map_result, log_query)
-        self.lastrowid = lastrowid
+        row_count, lastrowid = self._execute_wrapper(sql, params, map_result, log_query, template=template)
+        self.thread_state.lastrowid = lastrowid
         return row_count
 
+    def exec_many(self, sql, params_list, log_query=False):
+        """
+        Executes `sql` once for each list of params, which is faster than calling exec() for each one
+
+        Args:
+            sql: str
+            params_list: list of lists of params
+            log_query: bool
+
+        Returns:
+            the number of affected rows
+        """
+
+        if not params_list:
+            return 0
+
+        return self._execute_wrapper(sql, params_list, lambda cur: cur.rowcount, log_query, many=True)
+
     def last_insert_id(self):
-        return self.lastrowid
+        return self.thread_state.lastrowid
 
     def format_sql(self, sql, params=None):
         if self.type == self.SQLITE:
@@ -127,36 +390,245 @@ class DB:
         return sql, params
 
     def handle_extended_like(self, sql, params):
-        original_params = params.copy()
-        params = list(map(lambda x: [x], params))
-
-        for match in self.enhanced_like_regex.finditer(sql):
-            field = match.group(2)
-            index = int(match.group(3))
-
-            extra_sql, vals = self._get_extended_params(field, original_params[index].split(" "))
-
-            sql = self.enhanced_like_regex.sub(match.group(1) + "(" + " AND ".join(extra_sql) + ")" + match.group(4), sql, 1)
-
-            # remove current param and add generated params in its place
-            del params[index]
-            params.insert(index, vals)
-
-        return sql, [item for sublist in params for item in sublist]
-
-    def _get_extended_params(self, field, params):
+        template = self._get_extended_like_template(sql)
+
+        sql_parts = [template.sql_parts[0]]
+        replaced_params = {}
+        for marker, sql_part in zip(template.markers, template.sql_parts[1:]):
+            extra_sql, vals = self._get_extended_params(marker.field, params[marker.index].split(" "), marker.search_index)
+            sql_parts.append(marker.prefix + "(" + " AND ".join(extra_sql) + ")" + marker.suffix)
+            sql_parts.append(sql_part)
+
+            # generated params take the place of the search param
+            replaced_params[marker.index] = vals
+
+        return "".join(sql_parts), [item for i, param in enumerate(params) for item in replaced_params.get(i, [param])]
+
+    def _get_extended_like_template(self, sql):
+        with self.sql_cache_lock:
+            template = self.extended_like_cache.get(sql)
+            if template:
+                self.extended_like_cache.move_to_end(sql)
+                return template
+
+        # split() returns the sql between the markers, followed by the groups of the marker after it
+        parts = self.enhanced_like_regex.split(sql)
+        markers = []
+        for i in range(1, len(parts), 5):
+            prefix, field, index, suffix = parts[i:i + 4]
+            markers.append(DictObject({"prefix": prefix,
+                                       "field": field,
+                                       "index": int(index),
+                                       "suffix": suffix,
+                                       "search_index": self._get_search_index(sql, field)}))
+
+        template = DictObject({"sql_parts": parts[::5], "markers": markers})
+        with self.sql_cache_lock:
+            self.extended_like_cache[sql] = template
+            if len(self.extended_like_cache) > self.SQL_CACHE_SIZE:
+                self.extended_like_cache.popitem(last=False)
+
+        return template
+
+    def _get_extended_params(self, field, params, search_index=None):
         extra_sql = []
         vals = []
+        index_sql = []
+        index_vals = []
+        index_terms = []
         for p in params:
             if p.startswith("-") and p != "-":
                 vals.append("%" + p[1:] + "%")
                 extra_sql.append(field + " NOT LIKE ?")
+            elif search_index and search_index.type == "fts" and self.search_index_term_regex.search(p):
+                index_vals.append("%" + p + "%")
+                index_sql.append(search_index.column + " LIKE ?")
+            elif search_index and search_index.type == "memory" and self.memory_search_index_term_regex.search(p):
+                index_terms.append(p)
             else:
                 vals.append("%" + p + "%")
                 extra_sql.append(field + " LIKE ?")
+
+        if index_sql:
+            extra_sql.insert(0, "%s.rowid IN (SELECT rowid FROM temp.%s WHERE %s)" % (search_index.qualifier, search_index.name, " AND ".join(index_sql)))
+            vals = index_vals + vals
+
+        if index_terms:
+            search_keys = self._search_memory_index(search_index, index_terms)
+            if not search_keys:
+                extra_sql.insert(0, "1 = 0")
+            elif len(search_keys) <= self.MAX_SEARCH_INDEX_VALUES:
+                # the IN list is padded to a power of two by repeating the last key, so that searches only generate a few
+                # distinct statements and don't push other statements out of the caches
+                num_keys = 1 << (len(search_keys) - 1).bit_length()
+                search_keys = search_keys + [search_keys[-1]] * (num_keys - len(search_keys))
+                key_field = "%s.%s" % (search_index.qualifier, search_index.key_column) if search_index.key_column else field
+                extra_sql.insert(0, "%s IN (%s)" % (key_field, ", ".join(["?"] * len(search_keys))))
+                vals = search_keys + vals
+            else:
+                # too many matches for an IN list to be faster than LIKE
+                for term in index_terms:
+                    vals.append("%" + term + "%")
+                    extra_sql.append(field + " LIKE ?")
+
         return extra_sql, vals
 
+    def create_search_index(self, table, column, key_column=None):
+        """
+        Builds an index of `column` that is used by <EXTENDED_LIKE> searches on that column instead of scanning the table.
+        The index is built from the current contents of the table and is not updated when the table changes, so it should only be
+        used for reference data and should be created after the data is loaded. On SQLite with FTS5 this is a trigram full-text
+        index, otherwise (such as on MySQL) it is an in-memory index of the words in the column, which finds the matching rows
+        by `key_column`, or by the value of `column` if there is no key column.
+
+        Args:
+            table: str
+            column: str
+            key_column: optional str, an indexed column which identifies the rows, for columns which are too long to be indexed
+
+        Returns:
+            True if the index was created
+        """
+
+        name = "search_%s_%s" % (table.lower(), column.lower())
+        start_time = time.time()
+        search_index = None
+        if self.type == self.SQLITE:
+            search_index = self._create_fts_search_index(name, table, column)
+
+        if not search_index:
+            search_index = self._create_memory_search_index(name, table, column, key_column)
+
+        self.search_indexes[(table.lower(), column.lower())] = search_index
+        # templates refer to the search indexes that existed when they were parsed
+        with self.sql_cache_lock:
+            self.extended_like_cache.clear()
+        self.logger.debug("Created %s search index for '%s.%s' in %.2fs" % (search_index.type, table, column, time.time() - start_time))
+        return True
+
+    def _create_fts_search_index(self, name, table, column):
+        try:
+            # indexes are created in the temp schema so they are always built from the data that is currently loaded
+            self.exec("DROP TABLE IF EXISTS temp.%s" % name)
+            self.exec("CREATE VIRTUAL TABLE temp.%s USING fts5(%s, tokenize='trigram')" % (name, column))
+        except SqlException as e:
+            self.logger.warning("Could not create full-text search index for '%s.%s', using an in-memory index instead: %s" % (table, column, str(e)))
+            return None
+
+        self.exec("INSERT INTO temp.%s (rowid, %s) SELECT rowid, %s FROM %s" % (name, column, column, table))
+        return DictObject({"type": "fts", "name": name})
+
+    def _create_memory_search_index(self, name, table, column, key_column):
+        if key_column:
+            rows = self.query("SELECT %s AS search_key, %s AS value FROM %s WHERE %s IS NOT NULL" % (key_column, column, table, column))
+        else:
+            # matching rows are found with `column IN (...)`, which is only faster than LIKE if the column is indexed
+            self._create_column_index(table, column)
+            rows = self.query("SELECT DISTINCT %s AS search_key, %s AS value FROM %s WHERE %s IS NOT NULL" % (column, column, table, column))
+
+        # lower case word -> ids of the keys of the rows containing that word
+        word_key_ids = {}
+        for key_id, row in enumerate(rows):
+            for word in set(str(row.value).lower().split()):
+                word_key_ids.setdefault(word, []).append(key_id)
+
+        # trigram -> ids of the words containing that trigram
+        words = tuple(word_key_ids.keys())
+        trigrams = DictObject()
+        for word_id, word in enumerate(words):
+            for trigram in set(word[i:i + 3] for i in range(len(word) - 2)):
+                trigrams.setdefault(trigram, []).append(word_id)
+
+        # tuples and DictObjects, since DictObject converts lists and dicts whenever they are accessed
+        search_keys = tuple(row.search_key for row in rows)
+        return DictObject({"type": "memory", "name": name, "key_column": key_column, "search_keys": search_keys,
+                           "words": words, "word_key_ids": tuple(word_key_ids.values()), "trigrams": trigrams})
+
+    def _create_column_index(self, table, column):
+        index_name = "idx_search_%s_%s" % (table.lower(), column.lower())
+        try:
+            if self.type == self.SQLITE:
+                self.exec("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (index_name, table, column))
+            elif not self.query("SHOW INDEX FROM %s WHERE Key_name = ?" % table, [index_name]):
+                self.exec("CREATE INDEX %s ON %s (%s)" % (index_name, table, column))
+        except SqlException as e:
+            self.logger.warning("Could not create index on '%s.%s', searches will be slower: %s" % (table, column, str(e)))
+
+    def _search_memory_index(self, search_index, terms):
+        # a term without whitespace or wildcards is contained in a value if and only if it is contained in one of its words
+        search_keys = search_index.search_keys
+        word_key_ids = search_index.word_key_ids
+        key_ids = None
+        for term in terms:
+            term_key_ids = set()
+            for word_id in self._find_memory_index_words(search_index, term.lower()):
+                term_key_ids.update(word_key_ids[word_id])
+
+            key_ids = term_key_ids if key_ids is None else key_ids & term_key_ids
+            if not key_ids:
+                return []
+
+        return [search_keys[key_id] for key_id in sorted(key_ids)]
+
+    def _find_memory_index_words(self, search_index, term):
+        words = search_index.words
+        if len(term) < 3:
+            # too short to be looked up by trigram
+            return [word_id for word_id, word in enumerate(words) if term in word]
+
+        trigrams = search_index.trigrams
+        word_ids = None
+        # starting with the rarest trigram keeps the intersections small
+        for word_ids_for_trigram in sorted((trigrams.get(term[i:i + 3], ()) for i in range(len(term) - 2)), key=len):
+            word_ids = set(word_ids_for_trigram) if word_ids is None else word_ids.intersection(word_ids_for_trigram)
+            if not word_ids:
+                return []
+
+        # a word can contain every trigram of the term without containing the term
+        return [word_id for word_id in word_ids if term in words[word_id]]
+
+    def _get_search_index(self, sql, field):
+        if not self.search_indexes:
+            return None
+
+        # maps the tables used in the query to the names they are referenced by (their alias, if they have one)
+        references = {}
+        for match in self.table_alias_regex.finditer(sql):
+            references.setdefault(match.group(1).lower(), set()).add((match.group(2) or match.group(1)).lower())
+
+        if "." in field:
+            qualifier, column = field.split(".", 1)
+            tables = [table for table, names in references.items() if qualifier.lower() in names]
+        else:
+            qualifier = None
+            column = field
+            tables = list(references.keys())
+
+        tables = [table for table in tables if (table, column.lower()) in self.search_indexes]
+        if len(tables) != 1:
+            return None
+
+        table = tables[0]
+        if not qualifier:
+            # the table must be referenced by a single name, otherwise it is not clear which reference to use for the rowid
+            if len(references[table]) != 1:
+                return None
+            qualifier = next(iter(references[table]))
+
+        search_index = self.search_indexes[(table, column.lower())]
+        return DictObject({"type": search_index.type,
+                           "name": search_index.name,
+                           "key_column": search_index.get("key_column"),
+                           "search_keys": search_index.get("search_keys"),
+                           "words": search_index.get("words"),
+                           "word_key_ids": search_index.get("word_key_ids"),
+                           "trigrams": search_index.get("trigrams"),
+                           "column": column,
+                           "qualifier": qualifier})
+
     def get_connection(self):
+        """Returns the SQLite connection, MySQL connections are pooled"""
+
         return self.conn
 
     def load_sql_file(self, sqlfile, force_update=False):
@@ -186,26 +658,82 @@ class DB:
             return None
 
     def _load_file(self, filename):
+        start_time = time.time()
         if self.type == self.MYSQL:
             self._load_file_mysql(filename)
         else:
             self._load_file_sqlite(filename)
+        self.logger.info("Loaded sql file '%s' in %.2fs" % (filename, time.time() - start_time))
 
     def _load_file_sqlite(self, filename):
-        with open(filename, mode="r", encoding="UTF-8") as f:
-            with self.transaction():
-                cur = self.conn.cursor()
-                line_num = 1
-                for line in f.readlines():
-                    try:
-                        sql, _ = self.format_sql(line)
-                        sql = sql.strip()
-                        if sql and not sql.startswith("--"):
-                            cur.execute(sql)
-                    except Exception as e:
-                        raise Exception("sql error in file '%s' on line %d: %s" % (filename, line_num, str(e)))
-                    line_num += 1
-                cur.close()
+        # journal_mode is left alone since a crash with the journal in memory or turned off can corrupt the database
+        pragmas = {"synchronous": "OFF", "temp_store": "MEMORY", "cache_size": "-65536"}
+        original_pragmas = {}
+
+        # other threads must not run statements while the pragmas are changed
+        with self.connection():
+            # pragmas can not be changed from within a transaction
+            if self.thread_state.transaction_level == 0:
+                for name, value in pragmas.items():
+                    original_pragmas[name] = list(self.query_single("PRAGMA %s" % name).values())[0]
+                    self.exec("PRAGMA %s = %s" % (name, value))
+
+            try:
+                with open(filename, mode="r", encoding="UTF-8") as f:
+                    with self.transaction():
+                        num_statements, num_rows = self._execute_sqlite_statements(filename, f)
+            finally:
+                for name, value in original_pragmas.items():
+                    self.exec("PRAGMA %s = %s" % (name, value))
+
+        self.logger.debug("Executed %d statements for %d rows from sql file '%s'" % (num_statements, num_rows, filename))
+
+    def _execute_sqlite_statements(self, filename, lines):
+        # consecutive single-row INSERTs into the same table are combined into multi-row INSERTs
+        max_batch_size = 500
+        cur = self.thread_state.conn.cursor()
+        current_insert = None
+        batches = []
+        batch_line_num = 0
+        num_statements = 0
+        num_rows = 0
+
+        def flush():
+            nonlocal batches
+            if batches:
+                try:
+                    cur.execute(current_insert + " " + ", ".join(batches))
+                except Exception as e:
+                    raise Exception("sql error in file '%s' on lines %d-%d: %s" % (filename, batch_line_num, batch_line_num + len(batches) - 1, str(e)))
+                batches = []
+
+        for line_num, line in enumerate(lines, 1):
+            sql, _ = self.format_sql(line)
+            sql = sql.strip()
+            if not sql or sql.startswith("--"):
+                continue
+
+            match = self.insert_statement_regex.match(sql)
+            if match:
+                if match.group(1) != current_insert or len(batches) >= max_batch_size:
+                    flush()
+                    num_statements += 1
+                    current_insert = match.group(1)
+                    batch_line_num = line_num
+
+                batches.append(match.group(2))
+                num_rows += 1
+            else:
+                flush()
+                num_statements += 1
+                try:
+                    cur.execute(sql)
+                except Exception as e:
+                    raise Exception("sql error in file '%s' on line %d: %s" % (filename, line_num, str(e)))
+
+        flush()
+        cur.close()
+        return num_statements, num_rows
 
     def _load_file_mysql(self, filename):
         insert_regexp = re.compile(r"^(INSERT INTO [^ ]+( \(.*?\))? VALUES\s*)(\(.*?\));?$")
@@ -218,12 +746,11 @@ class DB:
             except Exception as e:
                 raise Exception("sql error in file '%s': %s" % (filename, str(e)), e)
 
-        with open(filename, mode="r", encoding="UTF-8") as f:
-            with self.conn.cursor() as cur:
-                lines = f.readlines()
+        with open(filename, mode="r", encoding="UTF-8") as f, self.connection():
+            with self.thread_state.conn.cursor() as cur:
                 batches = []
                 current_table = None
-                for line in lines:
+                for line in f:
                     line = line.strip()
                     if not line or line.startswith("--"):
                         continue
@@ -270,20 +797,47 @@ class DB:
         # False here indicates that if there was an exception, it should not be suppressed but instead propagated
         return False
 
+    # transactions are tracked per thread, and the thread keeps the same connection until the outermost transaction ends,
+    # so other threads can not run statements inside of it
     def begin_transaction(self):
-        if self.transaction_level == 0:
-            self.exec("BEGIN;")
-        self.transaction_level += 1
+        state = self.thread_state
+        if state.transaction_level == 0:
+            self._pin_connection()
+            try:
+                self.exec("BEGIN;")
+            except Exception:
+                self._unpin_connection()
+                raise
+        state.transaction_level += 1
 
     def commit_transaction(self):
-        if self.transaction_level == 1:
-            self.exec("COMMIT;")
-        self.transaction_level -= 1
+        self._end_transaction("COMMIT;")
 
     def rollback_transaction(self):
-        if self.transaction_level == 1:
-            self.exec("ROLLBACK;")
-        self.transaction_level -= 1
+        self._end_transaction("ROLLBACK;")
+
+    def _end_transaction(self, sql):
+        state = self.thread_state
+        if state.transaction_level != 1:
+            state.transaction_level -= 1
+            return
+
+        try:
+            self.exec(sql)
+        except Exception:
+            if sql != "ROLLBACK;" and not state.conn_discarded:
+                # do not leave the failed transaction open on the connection
+                try:
+                    self.exec("ROLLBACK;")
+                except Exception:
+                    pass
+            raise
+        finally:
+            state.transaction_level = 0
+            self._unpin_connection()
+
+    def get_transaction_level(self):
+        return self.thread_state.transaction_level
 
 
 class SqlException(Exception):
@@ -29,14 +29,15 @@ def command(handler, command, params, access_level, description, sub_command=Non
 
 
 @parameterized
-def event(handler, event_type, description, is_system=False, is_enabled=True, is_hidden=False):
+def event(handler, event_type, description, is_system=False, is_enabled=True, is_hidden=False, async_ok=False):
     if is_hidden:
         log_deprecated_is_hidden(handler)
 
     handler.event = DictObject({"event_type": event_type,
                                 "description": description,
                                 "is_system": is_system or is_hidden,
-                                "is_enabled": is_enabled})
+                                "is_enabled": is_enabled,
+                                "async_ok": async_ok})
     return handler
 
 
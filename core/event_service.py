@@ -1,4 +1,8 @@
+import heapq
 import inspect
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import mysql
 
@@ -6,22 +10,43 @@ from core.bot_status import BotStatus
 from core.decorators import instance
 from core.registry import Registry
 from core.logger import Logger
+from core.metrics_service import Histogram
 from core.functions import get_attrs
 import time
 
 
 @instance()
 class EventService:
+    # how often changes to timer event next_run times are written to the database
+    TIMER_EVENT_SAVE_INTERVAL = 60
+
+    ASYNC_HANDLER_WORKERS = 4
+
     def __init__(self):
         self.handlers = {}
         self.logger = Logger(__name__)
         self.event_types = []
-        self.db_cache = {}
+        # event type key -> list of (handler name, handler, async_ok) for the enabled handlers, built on first fire
+        self.dispatch_lists = {}
+        # handler names which may be run on the async worker pool instead of the main thread
+        self.async_handlers = set()
+        self.handler_times = Histogram("event_handler_seconds", "Time spent in event handlers, per handler", ["handler"])
+        self.async_executor = ThreadPoolExecutor(max_workers=self.ASYNC_HANDLER_WORKERS, thread_name_prefix="event_handler")
+        # handler name -> deque of (event_type, event_data) waiting to be handled, so each async handler sees events in order
+        self.async_handler_queues = {}
+        self.async_handler_lock = threading.Lock()
+        # timer events are loaded into memory on first use, keyed by handler
+        self.timer_events = None
+        # heap of (next_run, handler); entries for disabled or rescheduled timer events are skipped when popped
+        self.timer_event_queue = []
+        self.dirty_timer_events = set()
+        self.last_timer_event_save = 0
 
     def inject(self, registry):
         self.bot = registry.get_instance("bot")
         self.db = registry.get_instance("db")
         self.util = registry.get_instance("util")
+        self.executor_service = registry.get_instance("executor_service")
 
     def pre_start(self):
         self.register_event_type("timer")
@@ -33,7 +58,7 @@ class EventService:
                 if hasattr(method, "event"):
                     attrs = getattr(method, "event")
                     handler = getattr(inst, name)
-                    self.register(handler, attrs.event_type, attrs.description, inst.module_name, attrs.is_system, attrs.is_enabled)
+                    self.register(handler, attrs.event_type, attrs.description, inst.module_name, attrs.is_system, attrs.is_enabled, attrs.get("async_ok", False))
 
     def register_event_type(self, event_type):
         """
@@ -55,7 +80,7 @@ class EventService:
     def is_event_type(self, event_base_type):
         return event_base_type in self.event_types
 
-    def register(self, handler, event_type, description, module, is_system, is_enabled):
+    def register(self, handler, event_type, description, module, is_system, is_enabled, async_ok=False):
         """
         Call during pre_start
 
@@ -66,6 +91,8 @@ class EventService:
             module: str
             is_system: bool
             is_enabled: bool
+            async_ok: bool, if True the handler is run on a worker thread instead of the main thread;
+                if it returns a callable, that is run afterwards on the main thread
         """
 
         if len(inspect.signature(handler).parameters) != 2:
@@ -106,8 +133,16 @@ class EventService:
                 self.db.exec("UPDATE timer_event SET event_sub_type = ? WHERE event_type = ? AND handler = ?",
                              [event_sub_type, event_base_type, handler_name])
 
+        if event_base_type == "timer" and self.timer_events is not None:
+            self.reload_timer_events()
+
         # load command handler
         self.handlers[handler_name] = handler
+        if async_ok:
+            self.async_handlers.add(handler_name)
+        else:
+            self.async_handlers.discard(handler_name)
+        self.dispatch_lists = {}
 
     def fire_event(self, event_type, event_data=None):
         event_base_type, event_sub_type = self.get_event_type_parts(event_type)
@@ -116,9 +151,11 @@ class EventService:
             self.logger.error("Could not fire event type '%s': event type does not exist" % event_type)
             return
 
-        data = self.get_handlers(event_base_type, event_sub_type)
-        for row in data:
-            self.call_handler(row.handler, event_type, event_data)
+        for handler_name, handler, async_ok in self.get_dispatch_list(event_base_type, event_sub_type):
+            if async_ok:
+                self.submit_async_handler(handler_name, handler, event_type, event_data)
+            else:
+                self.run_handler(handler_name, handler, event_type, event_data)
 
     def call_handler(self, handler_method, event_type, event_data):
         handler = self.handlers.get(handler_method, None)
@@ -126,10 +163,62 @@ class EventService:
             self.logger.error("Could not find handler callback for event type '%s' and handler '%s'" % (event_type, handler_method))
             return
 
+        self.run_handler(handler_method, handler, event_type, event_data)
+
+    def run_handler(self, handler_name, handler, event_type, event_data):
+        start_time = time.perf_counter()
         try:
-            handler(event_type, event_data)
+            return handler(event_type, event_data)
         except Exception as e:
             self.logger.error("error processing event '%s'" % event_type, e)
+        finally:
+            self.record_handler_time(handler_name, time.perf_counter() - start_time)
+
+    def submit_async_handler(self, handler_name, handler, event_type, event_data):
+        with self.async_handler_lock:
+            queue = self.async_handler_queues.setdefault(handler_name, deque())
+            queue.append((event_type, event_data))
+            # if there were already events queued, a worker is already handling events for this handler
+            if len(queue) > 1:
+                return
+
+        self.async_executor.submit(self.run_async_handler, handler_name, handler, queue)
+
+    def run_async_handler(self, handler_name, handler, queue):
+        while True:
+            with self.async_handler_lock:
+                event_type, event_data = queue[0]
+
+            start_time = time.perf_counter()
+            result = None
+            try:
+                result = handler(event_type, event_data)
+            except Exception as e:
+                self.logger.error("error processing event '%s'" % event_type, e)
+
+            self.executor_service.run_on_main_thread(self.finish_async_handler, handler_name, event_type, result, time.perf_counter() - start_time)
+
+            with self.async_handler_lock:
+                queue.popleft()
+                if not queue:
+                    return
+
+    def finish_async_handler(self, handler_name, event_type, result, elapsed):
+        self.record_handler_time(handler_name, elapsed)
+
+        if callable(result):
+            try:
+                result()
+            except Exception as e:
+                self.logger.error("error processing result of event '%s'" % event_type, e)
+
+    def record_handler_time(self, handler_name, elapsed):
+        self.handler_times.observe(elapsed, handler_name)
+
+    def get_handler_stats(self):
+        """Returns handler name -> call count, total and max time in seconds, and counts per handler_times bucket"""
+
+        return {labels[0]: sample for labels, sample in self.handler_times.get_samples().items()}
 
     def get_event_type_parts(self, event_type):
         parts = event_type.lower().split(":", 1)
@@ -143,11 +232,16 @@ class EventService:
 
     def check_for_timer_events(self, current_timestamp):
         try:
-            data = self.db.query("SELECT e.event_type, e.event_sub_type, e.handler, t.next_run FROM timer_event t "
-                                 "JOIN event_config e ON t.event_type = e.event_type AND t.handler = e.handler "
-                                 "WHERE t.next_run <= ? AND e.enabled = 1", [current_timestamp])
-            for row in data:
-                self.execute_timed_event(row, current_timestamp)
+            self.get_timer_events()
+
+            while self.timer_event_queue and self.timer_event_queue[0][0] <= current_timestamp:
+                next_run, handler = heapq.heappop(self.timer_event_queue)
+                row = self.timer_events.get(handler)
+                if row and row.enabled and row.next_run == next_run:
+                    self.execute_timed_event(row, current_timestamp)
+
+            if current_timestamp - self.last_timer_event_save >= self.TIMER_EVENT_SAVE_INTERVAL:
+                self.save_timer_events()
         except mysql.connector.errors.OperationalError as e:
             self.logger.error("MySQL connection lost", e)
             self.bot.status = BotStatus.ERROR
@@ -155,6 +249,9 @@ class EventService:
     def execute_timed_event(self, row, current_timestamp):
         event_type_key = self.get_event_type_key(row.event_type, row.event_sub_type)
 
+        # the in-memory copy has the latest next_run, since it is only written to the database periodically
+        row = self.get_timer_events().get(row.handler, row)
+
         # timer event run times should be consistent, so we base the next run time off the last run time,
         # instead of the current timestamp
         next_run = row.next_run + int(row.event_sub_type)
@@ -164,41 +261,92 @@ class EventService:
         if next_run < current_timestamp:
             next_run = current_timestamp + int(row.event_sub_type)
 
-        self.db.exec("UPDATE timer_event SET next_run = ? WHERE event_type = ? AND handler = ?",
-                     [next_run, row.event_type, row.handler])
+        if row.handler in self.timer_events:
+            row.next_run = next_run
+            self.dirty_timer_events.add(row.handler)
+            heapq.heappush(self.timer_event_queue, (next_run, row.handler))
+        else:
+            self.db.exec("UPDATE timer_event SET next_run = ? WHERE event_type = ? AND handler = ?",
+                         [next_run, row.event_type, row.handler])
 
         self.call_handler(row.handler, event_type_key, None)
 
+    def get_timer_events(self):
+        if self.timer_events is None:
+            self.load_timer_events()
+
+        return self.timer_events
+
+    def load_timer_events(self):
+        data = self.db.query("SELECT e.event_type, e.event_sub_type, e.handler, e.enabled, t.next_run FROM timer_event t "
+                             "JOIN event_config e ON t.event_type = e.event_type AND t.handler = e.handler "
+                             "WHERE e.event_type = ?", ["timer"])
+
+        self.timer_events = {row.handler: row for row in data}
+        self.timer_event_queue = [(row.next_run, row.handler) for row in data if row.enabled]
+        heapq.heapify(self.timer_event_queue)
+        self.dirty_timer_events = set()
+
+    def save_timer_events(self):
+        """Writes next_run times for timer events that have run since the last save to the database"""
+
+        self.last_timer_event_save = int(time.time())
+        if not self.dirty_timer_events:
+            return
+
+        with self.db.transaction():
+            for handler in self.dirty_timer_events:
+                row = self.timer_events[handler]
+                self.db.exec("UPDATE timer_event SET next_run = ? WHERE event_type = ? AND handler = ?",
+                             [row.next_run, row.event_type, row.handler])
+
+        self.dirty_timer_events = set()
+
+    def reload_timer_events(self):
+        self.save_timer_events()
+        self.load_timer_events()
+
     def update_event_status(self, event_base_type, event_sub_type, event_handler, enabled_status):
-        # clear cache
-        self.db_cache[event_base_type + ":" + event_sub_type] = None
+        # rebuild dispatch lists on next fire
+        self.dispatch_lists = {}
+
+        count = self.db.exec("UPDATE event_config SET enabled = ? WHERE event_type = ? AND event_sub_type = ? AND handler LIKE ?",
+                             [enabled_status, event_base_type, event_sub_type, event_handler])
+
+        if event_base_type == "timer" and self.timer_events is not None:
+            self.reload_timer_events()
 
-        return self.db.exec("UPDATE event_config SET enabled = ? WHERE event_type = ? AND event_sub_type = ? AND handler LIKE ?",
-                            [enabled_status, event_base_type, event_sub_type, event_handler])
+        return count
 
     def get_event_types(self):
         return self.event_types
 
     def get_handlers(self, event_base_type, event_sub_type):
-        # check first in cache
-        result = self.db_cache.get(event_base_type + ":" + event_sub_type, None)
-        if result is not None:
-            return result
-        else:
-            result = self.db.query("SELECT handler FROM event_config WHERE event_type = ? AND event_sub_type = ? AND enabled = 1",
-                                   [event_base_type, event_sub_type])
+        return self.db.query("SELECT handler FROM event_config WHERE event_type = ? AND event_sub_type = ? AND enabled = 1",
+                             [event_base_type, event_sub_type])
+
+    def get_dispatch_list(self, event_base_type, event_sub_type):
+        event_type_key = self.get_event_type_key(event_base_type, event_sub_type)
+        dispatch_list = self.dispatch_lists.get(event_type_key)
+        if dispatch_list is None:
+            dispatch_list = []
+            for row in self.get_handlers(event_base_type, event_sub_type):
+                handler = self.handlers.get(row.handler, None)
+                if handler:
+                    dispatch_list.append((row.handler, handler, row.handler in self.async_handlers))
+                else:
+                    self.logger.error("Could not find handler callback for event type '%s' and handler '%s'" % (event_type_key, row.handler))
 
-            # store result in cache
-            self.db_cache[event_base_type + ":" + event_sub_type] = result
+            self.dispatch_lists[event_type_key] = dispatch_list
 
-            return result
+        return dispatch_list
 
     def run_timer_events_at_startup(self):
         t = int(time.time())
-        data = self.db.query("SELECT e.event_type, e.event_sub_type, e.handler, t.next_run FROM timer_event t "
-                             "JOIN event_config e ON t.event_type = e.event_type AND t.handler = e.handler "
-                             "WHERE e.event_type = ? AND e.enabled = 1", ["timer"])
-        for row in data:
+        for row in list(self.get_timer_events().values()):
+            if not row.enabled:
+                continue
+
             handler = self.handlers[row.handler]
             attrs = getattr(handler, "event")
             if attrs.get("run_at_startup", False):
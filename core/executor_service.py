@@ -3,13 +3,17 @@ from concurrent.futures import ThreadPoolExecutor
 
 from core.decorators import instance
 from core.dict_object import DictObject
+from core.fifo_queue import FifoQueue
+from core.logger import Logger
 
 
 @instance()
 class ExecutorService:
     def __init__(self):
+        self.logger = Logger(__name__)
         self.jobs = []
         self.job_scheduler_id = None
+        self.main_thread_callbacks = FifoQueue()
 
     def inject(self, registry):
         self.job_scheduler = registry.get_instance("job_scheduler")
@@ -32,6 +36,30 @@ class ExecutorService:
         self.jobs.sort(key=lambda x: x.expires)
         self.update_next_expiration()
 
+    def run_on_main_thread(self, callback, *args, **kwargs):
+        """
+        Queues a callback to be run by the main bot loop. Safe to call from any thread.
+
+        Args:
+            callback: (*args, *kwargs) -> void
+            *args
+            **kwargs
+        """
+
+        self.main_thread_callbacks.put((callback, args, kwargs))
+
+    def run_main_thread_callbacks(self):
+        # only run callbacks which are already queued so that callbacks queueing other callbacks can't starve the main loop
+        for _ in range(self.main_thread_callbacks.qsize()):
+            callback, args, kwargs = self.main_thread_callbacks.get_or_default(block=False, default=(None, None, None))
+            if not callback:
+                break
+
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                self.logger.error("Error running main thread callback", e)
+
     def update_next_expiration(self):
         if self.jobs:
             job = self.jobs[0]
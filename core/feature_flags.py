@@ -5,3 +5,4 @@ class FeatureFlags:
     FORCE_LARGE_MESSAGES_FROM_SLAVES_THRESHOLD = 20000
     IGNORE_FAILED_BOTS_ON_LOGIN = False
     AUTO_UNFREEZE_ACCOUNTS = False
+    SINGLE_IO_LOOP = False
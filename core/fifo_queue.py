@@ -36,3 +36,24 @@ class FifoQueue(Queue):
             item = self._get()
             self.not_full.notify()
             return item
+
+
+class TimedFifoQueue(FifoQueue):
+    """FifoQueue that records how long each item waited in the queue"""
+
+    def __init__(self, wait_times, maxsize=0):
+        """
+        Args:
+            wait_times: Histogram that the wait time of each item is observed in, in seconds
+        """
+
+        super().__init__(maxsize)
+        self.wait_times = wait_times
+
+    def _put(self, item):
+        self.queue.append((time.time(), item))
+
+    def _get(self):
+        t, item = self.queue.popleft()
+        self.wait_times.observe(time.time() - t)
+        return item
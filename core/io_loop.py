@@ -0,0 +1,103 @@
+import selectors
+import socket
+import threading
+import time
+
+from core.logger import Logger
+
+
+class IOLoop:
+    """Reads and sends packets for every conn from a single thread, as an alternative to a reader and sender thread per conn"""
+
+    MAX_WAIT_TIME = 1
+
+    def __init__(self, incoming_queue, is_running, failure_callback):
+        self.logger = Logger(__name__)
+        self.incoming_queue = incoming_queue
+        self.is_running = is_running
+        self.failure_callback = failure_callback
+        self.selector = selectors.DefaultSelector()
+        # conn -> mass message queue the conn sends from when idle, or None
+        self.conns = {}
+        self.new_conns = []
+        self.new_conns_lock = threading.Lock()
+        self.last_connection_check = 0
+
+        # writing to wakeup_writer interrupts the select() call when there is something new to do
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+
+    def add_conn(self, conn, mass_message_queue=None):
+        # conns are registered by the loop thread since the selector is not thread-safe
+        with self.new_conns_lock:
+            self.new_conns.append((conn, mass_message_queue))
+        conn.wakeup = self.wakeup
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            self.wakeup_writer.send(b"\0")
+        except OSError:
+            # the socket buffer is full, so a wakeup is already pending
+            pass
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def run(self):
+        try:
+            while self.is_running():
+                self.register_new_conns()
+
+                wait_time = self.MAX_WAIT_TIME
+                for conn, mass_message_queue in self.conns.items():
+                    delay = conn.send_queued_packets(mass_message_queue)
+                    if delay is not None:
+                        wait_time = min(wait_time, delay)
+
+                for key, events in self.selector.select(wait_time):
+                    if key.data is None:
+                        self.clear_wakeups()
+                    else:
+                        conn = key.data
+                        conn.receive()
+                        for packet in conn.read_buffered_packets():
+                            self.incoming_queue.put((conn, packet))
+
+                # checks for conns which have not received anything recently
+                t = time.time()
+                if t - self.last_connection_check >= 1:
+                    self.last_connection_check = t
+                    for conn in self.conns:
+                        conn.check_connection()
+
+        except (EOFError, OSError) as e:
+            self.logger.error("", e)
+            self.failure_callback()
+        finally:
+            self.selector.close()
+            self.wakeup_reader.close()
+            self.wakeup_writer.close()
+
+    def register_new_conns(self):
+        with self.new_conns_lock:
+            new_conns = self.new_conns
+            self.new_conns = []
+
+        for conn, mass_message_queue in new_conns:
+            self.selector.register(conn.socket, selectors.EVENT_READ, conn)
+            self.conns[conn] = mass_message_queue
+
+            # packets may already have been received along with the login response
+            for packet in conn.read_buffered_packets():
+                self.incoming_queue.put((conn, packet))
+
+    def clear_wakeups(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except OSError:
+            pass
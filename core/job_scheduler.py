@@ -1,21 +1,41 @@
+import heapq
 import inspect
 
 from core.decorators import instance
+from core.dict_object import DictObject
 from core.logger import Logger
 import time
 
 
 @instance()
 class JobScheduler:
+    # allowance for float rounding when converting between the wall clock and the monotonic clock
+    CLOCK_TOLERANCE = 0.001
+
     def __init__(self):
         self.logger = Logger(__name__)
+        # heap of (deadline, job_id, job) where deadline is based on the monotonic clock
         self.jobs = []
+        self.jobs_by_id = {}
         self.job_id_index = 0
 
-    def check_for_scheduled_jobs(self, timestamp):
-        while self.jobs and self.jobs[0]["time"] <= timestamp:
+    def check_for_scheduled_jobs(self, timestamp=None):
+        """
+        Runs all jobs scheduled to run at or before `timestamp` (defaults to now)
+
+        Args:
+            timestamp: float
+        """
+
+        max_deadline = (self._to_deadline(timestamp) if timestamp is not None else time.monotonic()) + self.CLOCK_TOLERANCE
+        while self.jobs and self.jobs[0][0] <= max_deadline:
+            deadline, job_id, job = heapq.heappop(self.jobs)
+
+            # cancelled jobs are removed from the index but left in the heap until they reach the top
+            if self.jobs_by_id.pop(job_id, None) is None:
+                continue
+
             try:
-                job = self.jobs.pop(0)
                 job["callback"](job["time"], *job["args"], **job["kwargs"])
             except Exception as e:
                 self.logger.warning("Error processing scheduled job", e)
@@ -23,19 +43,19 @@ class JobScheduler:
     def delayed_job(self, callback, delay, *args, **kwargs):
         """
         Args:
-            callback: (time: Int, *args, *kwargs) -> void)
-            delay: int
+            callback: (time: float, *args, *kwargs) -> void)
+            delay: float
             *args
             **kwargs
         """
 
-        return self.scheduled_job(callback, int(time.time()) + delay, *args, **kwargs)
+        return self.scheduled_job(callback, time.time() + delay, *args, **kwargs)
 
     def scheduled_job(self, callback, scheduled_time, *args, **kwargs):
         """
         Args:
-            callback: (time: Int, *args, *kwargs) -> void)
-            scheduled_time: int
+            callback: (time: float, *args, *kwargs) -> void)
+            scheduled_time: float
             *args
             **kwargs
         """
@@ -49,24 +69,44 @@ class JobScheduler:
             "callback": callback,
             "args": args,
             "kwargs": kwargs,
-            "time": scheduled_time
+            "time": scheduled_time,
+            "deadline": self._to_deadline(scheduled_time)
         }
 
         self._insert_job(new_job)
         return job_id
 
     def cancel_job(self, job_id):
-        for index, job in enumerate(self.jobs):
-            if job["id"] == job_id:
-                return self.jobs.pop(index)
-        return None
+        job = self.jobs_by_id.pop(job_id, None)
+
+        # rebuild the heap once it is mostly made up of cancelled jobs
+        if job and len(self.jobs) > 2 * len(self.jobs_by_id) + 100:
+            self.jobs = [entry for entry in self.jobs if entry[1] in self.jobs_by_id]
+            heapq.heapify(self.jobs)
+
+        return job
+
+    def get_pending_jobs(self):
+        """Returns the jobs that have not run yet, ordered by when they are scheduled to run,
+        along with how late each job is (0 if it is not due yet)"""
+
+        now = time.monotonic()
+        pending = []
+        for job in sorted(self.jobs_by_id.values(), key=lambda x: (x["deadline"], x["id"])):
+            pending.append(DictObject({"id": job["id"],
+                                       "callback": "%s.%s" % (job["callback"].__module__, job["callback"].__qualname__),
+                                       "time": job["time"],
+                                       "time_left": max(job["deadline"] - now, 0),
+                                       "lateness": max(now - job["deadline"], 0)}))
+        return pending
 
     def _insert_job(self, new_job):
-        for index, job in enumerate(self.jobs):
-            if job["time"] > new_job["time"]:
-                self.jobs.insert(index, new_job)
-                return
-        self.jobs.append(new_job)
+        self.jobs_by_id[new_job["id"]] = new_job
+        heapq.heappush(self.jobs, (new_job["deadline"], new_job["id"], new_job))
+
+    def _to_deadline(self, timestamp):
+        # convert wall clock time to monotonic time so that changes to the system clock do not affect jobs already scheduled
+        return time.monotonic() + (timestamp - time.time())
 
     def _get_next_job_id(self):
         self.job_id_index += 1
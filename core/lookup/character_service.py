@@ -17,6 +17,7 @@ class CharacterService:
     def inject(self, registry):
         self.bot = registry.get_instance("bot")
         self.db = registry.get_instance("db")
+        self.write_behind_service = registry.get_instance("write_behind_service")
 
     def pre_start(self):
         self.bot.register_packet_handler(server_packets.CharacterLookup.id, self.update)
@@ -69,7 +70,7 @@ class CharacterService:
 
     def _update_name_history(self, char_name, char_id):
         params = [char_name, char_id, int(time.time())]
-        self.db.exec("INSERT IGNORE INTO name_history (name, char_id, created_at) VALUES (?, ?, ?)", params)
+        self.write_behind_service.add("INSERT IGNORE INTO name_history (name, char_id, created_at) VALUES (?, ?, ?)", params)
 
     def _send_lookup_if_needed(self, char_name):
         # char_name must be .capitalize()'ed
@@ -5,6 +5,7 @@ from requests import ReadTimeout
 from core.decorators import instance
 from core.dict_object import DictObject
 from core.logger import Logger
+from core.metrics_service import Histogram
 import requests
 import datetime
 import json
@@ -17,6 +18,7 @@ class OrgPorkService:
 
     def __init__(self):
         self.logger = Logger(__name__)
+        self.request_times = Histogram("org_pork_request_seconds", "Time spent requesting org rosters from PoRK", buckets=[0.1, 0.5, 1, 2, 5, 10, 30])
 
     def inject(self, registry):
         self.bot = registry.get_instance("bot")
@@ -43,6 +45,7 @@ class OrgPorkService:
         else:
             url = self.get_pork_url(self.bot.dimension, org_id)
 
+            start_time = time.time()
             try:
                 r = requests.get(url, timeout=10)
                 result = r.json()
@@ -56,6 +59,8 @@ class OrgPorkService:
             except ValueError as e:
                 self.logger.warning("Error marshalling value as json for url '%s': %s" % (url, r.text), e)
                 result = None
+            finally:
+                self.request_times.observe(time.time() - start_time)
 
             if result:
                 # store result in cache
@@ -118,40 +123,39 @@ class OrgPorkService:
             "faction_id": org_info["SIDE"],
         })
 
-        with self.db.transaction():
-            members = {}
-            for org_member in org_members:
-                char_info = DictObject({
-                    "name": org_member["NAME"],
-                    "char_id": org_member["CHAR_INSTANCE"],
-                    "first_name": org_member["FIRSTNAME"],
-                    "last_name": org_member["LASTNAME"],
-                    "level": org_member["LEVELX"],
-                    "breed": org_member["BREED"],
-                    "dimension": org_member["CHAR_DIMENSION"],
-                    "gender": org_member["SEX"],
-                    "faction": org_info["SIDE_NAME"],
-                    "profession": org_member["PROF"],
-                    "profession_title": org_member["PROF_TITLE"],
-                    "ai_rank": org_member["DEFENDER_RANK_TITLE"],
-                    "ai_level": org_member["ALIENLEVEL"],
-                    "pvp_rating": org_member["PVPRATING"],
-                    "pvp_title": org_member["PVPTITLE"] or "",
-                    "head_id": org_member["HEADID"],
-                    "org_id": org_info.get("ORG_INSTANCE", 0),
-                    "org_name": org_info.get("NAME", ""),
-                    "org_rank_name": org_member.get("RANK_TITLE", ""),
-                    "org_rank_id": org_member.get("RANK", 0),
-                    "source": "people.anarchy-online.com"
-                })
-
-                if not is_cache:
-                    self.pork_service.save_character_info(char_info)
-
-                # prefetch char ids from chat server
-                self.character_service._send_lookup_if_needed(char_info.name)
-
-                members[char_info.char_id] = char_info
+        members = {}
+        for org_member in org_members:
+            char_info = DictObject({
+                "name": org_member["NAME"],
+                "char_id": org_member["CHAR_INSTANCE"],
+                "first_name": org_member["FIRSTNAME"],
+                "last_name": org_member["LASTNAME"],
+                "level": org_member["LEVELX"],
+                "breed": org_member["BREED"],
+                "dimension": org_member["CHAR_DIMENSION"],
+                "gender": org_member["SEX"],
+                "faction": org_info["SIDE_NAME"],
+                "profession": org_member["PROF"],
+                "profession_title": org_member["PROF_TITLE"],
+                "ai_rank": org_member["DEFENDER_RANK_TITLE"],
+                "ai_level": org_member["ALIENLEVEL"],
+                "pvp_rating": org_member["PVPRATING"],
+                "pvp_title": org_member["PVPTITLE"] or "",
+                "head_id": org_member["HEADID"],
+                "org_id": org_info.get("ORG_INSTANCE", 0),
+                "org_name": org_info.get("NAME", ""),
+                "org_rank_name": org_member.get("RANK_TITLE", ""),
+                "org_rank_id": org_member.get("RANK", 0),
+                "source": "people.anarchy-online.com"
+            })
+
+            # prefetch char ids from chat server
+            self.character_service._send_lookup_if_needed(char_info.name)
+
+            members[char_info.char_id] = char_info
+
+        if not is_cache:
+            self.pork_service.save_character_infos(members.values())
 
         if len(members) == 0:
             return None
@@ -1,26 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 from requests import ReadTimeout
 
 from core.decorators import instance
 from core.dict_object import DictObject
 from core.aochat import server_packets
 from core.logger import Logger
+from core.metrics_service import Histogram
 import requests
+import threading
 import time
 
 
 @instance()
 class PorkService:
+    CHARACTER_INFO_UPDATED_EVENT = "character_info_updated"
+
+    MAX_WORKERS = 10
+    MAX_CONCURRENT_REQUESTS_PER_HOST = 4
+
     def __init__(self):
         self.logger = Logger(__name__)
+        self.fetch_executor = None
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        self.host_semaphores = {}
+        self.request_times = Histogram("pork_request_seconds", "Time spent requesting character info from PoRK, per host", ["host"])
 
     def inject(self, registry):
         self.bot = registry.get_instance("bot")
         self.db = registry.get_instance("db")
         self.character_service = registry.get_instance("character_service")
+        self.executor_service = registry.get_instance("executor_service")
+        self.event_service = registry.get_instance("event_service")
+        self.write_behind_service = registry.get_instance("write_behind_service")
 
     def pre_start(self):
         self.bot.register_packet_handler(server_packets.CharacterLookup.id, self.update)
         self.bot.register_packet_handler(server_packets.CharacterName.id, self.update)
+        self.event_service.register_event_type(self.CHARACTER_INFO_UPDATED_EVENT)
 
     def start(self):
         self.db.exec("CREATE TABLE IF NOT EXISTS player ( char_id BIGINT PRIMARY KEY, first_name VARCHAR(30) NOT NULL, name VARCHAR(20) NOT NULL, last_name VARCHAR(30) NOT NULL, "
@@ -29,12 +48,15 @@ class PorkService:
                      "org_rank_name VARCHAR(20) NOT NULL, org_rank_id SMALLINT NOT NULL, dimension SMALLINT NOT NULL, head_id INT NOT NULL, pvp_rating SMALLINT NOT NULL, "
                      "pvp_title VARCHAR(20) NOT NULL, source VARCHAR(50) NOT NULL, last_updated INT NOT NULL )")
 
+        self.fetch_executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="pork")
+
     # forces a lookup from remote PoRK server
     # this should not be called directly unless you are requesting info for a char on a different server
     # since cache will not be used and the result will not update the cache automatically
     def request_char_info(self, char_name, server_num):
         url = self.get_pork_url(server_num, char_name)
 
+        start_time = time.time()
         try:
             r = requests.get(url, timeout=5)
             result = r.json()
@@ -44,6 +66,8 @@ class PorkService:
         except ValueError as e:
             self.logger.debug("Error marshalling value as json for url '%s': %s" % (url, r.text), e)
             result = None
+        finally:
+            self.request_times.observe(time.time() - start_time, urlparse(url).netloc)
 
         char_info = None
         if result:
@@ -77,6 +101,40 @@ class PorkService:
 
         return char_info
 
+    # non-blocking version of request_char_info()
+    # concurrent requests for the same character are coalesced into a single request to the PoRK server
+    # the returned future is completed on a worker thread, so callers should not touch the database from its callbacks
+    def request_char_info_async(self, char_name, server_num):
+        key = (server_num, char_name.capitalize())
+        with self.in_flight_lock:
+            future = self.in_flight.get(key)
+            if not future:
+                future = self.fetch_executor.submit(self._request_char_info_worker, key, char_name, server_num)
+                self.in_flight[key] = future
+
+        return future
+
+    def _request_char_info_worker(self, key, char_name, server_num):
+        try:
+            with self.get_host_semaphore(self.get_pork_url(server_num, char_name)):
+                return self.request_char_info(char_name, server_num)
+        except Exception as e:
+            self.logger.error("Error requesting char info for '%s'" % char_name, e)
+            return None
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.pop(key, None)
+
+    def get_host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self.in_flight_lock:
+            semaphore = self.host_semaphores.get(host)
+            if not semaphore:
+                semaphore = threading.BoundedSemaphore(self.MAX_CONCURRENT_REQUESTS_PER_HOST)
+                self.host_semaphores[host] = semaphore
+
+        return semaphore
+
     # standard method to get character pork data when character is on the same server
     def get_character_info(self, char_name_or_id, max_cache_age=86400):
         char_id = self.character_service.resolve_char_to_id(char_name_or_id)
@@ -96,7 +154,8 @@ class PorkService:
         if not char_name:
             return db_char_info
 
-        char_info = self.request_char_info(char_name, self.bot.dimension)
+        # wait on the shared request so that a lookup already in flight for this character is reused
+        char_info = self.request_char_info_async(char_name, self.bot.dimension).result()
 
         if char_info and (char_id is None or char_info.char_id == char_id):
             self.save_character_info(char_info)
@@ -109,43 +168,108 @@ class PorkService:
 
             return db_char_info
 
+    # non-blocking version of get_character_info()
+    # returns the cached character info from the database straight away (which may be stale, or None), and requests
+    # updated info from PoRK in the background if the cached info is missing or too old
+    # unless fresh cached info was returned, `callback(char_info)` will be called from the main thread
+    # once the request finishes, with the updated info (which has already been saved), or the cached info if the request failed
+    def get_character_info_async(self, char_name_or_id, callback=None, max_cache_age=86400):
+        if isinstance(char_name_or_id, int) or char_name_or_id.isdigit():
+            char_id = int(char_name_or_id)
+            char_name = self.character_service.get_char_name(char_id)
+        else:
+            char_name = char_name_or_id.capitalize()
+            char_id = self.character_service.name_to_id.get(char_name)
+
+        t = int(time.time())
+
+        db_char_info = self.get_from_database(char_id=char_id, char_name=char_name)
+        if db_char_info:
+            db_char_info.cache_age = t - db_char_info.last_updated
+
+            if db_char_info.cache_age < max_cache_age and db_char_info.source != "chat_server":
+                return db_char_info
+
+        # if we can't resolve to a char_name, we can't make a call to pork
+        if not char_name:
+            if callback:
+                self.executor_service.run_on_main_thread(callback, db_char_info)
+            return db_char_info
+
+        def handle_result(future):
+            self.executor_service.run_on_main_thread(self._handle_char_info_result, future.result(), char_id, db_char_info, callback)
+
+        self.request_char_info_async(char_name, self.bot.dimension).add_done_callback(handle_result)
+
+        return db_char_info
+
+    def _handle_char_info_result(self, char_info, char_id, db_char_info, callback):
+        if char_info and (char_id is None or char_info.char_id == char_id):
+            self.save_character_info(char_info)
+        else:
+            char_info = db_char_info
+
+        if callback:
+            callback(char_info)
+
     # forces a skeleton object into the player table in the case that PoRK does not return any data
     # call this method if you don't need the data now but want to ensure there is a record in the database
-    def load_character_info(self, char_id, char_name=None):
-        char_info = self.get_character_info(char_id)
-        if not char_info and char_name:
-            char_info = self.get_character_info(char_name)
+    # this does not block; if there is no record yet, a skeleton record is saved immediately and replaced
+    # once PoRK returns data for the character
+    # if the record is not up to date, `callback()` is called from the main thread once it has been updated
+    def load_character_info(self, char_id, char_name=None, callback=None):
+        def load_by_name(char_info):
+            if not char_info and char_name:
+                self.get_character_info_async(char_name, save_stub_if_missing)
+            else:
+                save_stub_if_missing(char_info)
+
+        def save_stub_if_missing(char_info):
+            if not char_info:
+                self.save_character_info(self.get_stub_character_info(char_id))
+
+            if callback:
+                callback()
+
+        char_info = self.get_character_info_async(char_id, load_by_name)
         if not char_info:
-            char_info = DictObject({
-                "name": "Unknown:" + str(char_id),
-                "char_id": char_id,
-                "first_name": "",
-                "last_name": "",
-                "level": 0,
-                "breed": "",
-                "dimension": self.bot.dimension,
-                "gender": "",
-                "faction": "",
-                "profession": "",
-                "profession_title": "",
-                "ai_rank": "",
-                "ai_level": 0,
-                "pvp_rating": 0,
-                "pvp_title": "",
-                "head_id": 0,
-                "org_id": 0,
-                "org_name": "",
-                "org_rank_name": "",
-                "org_rank_id": 6,
-                "source": "stub"
-            })
-            self.save_character_info(char_info)
+            # placeholder record until the PoRK requests finish; "chat_server" records are never considered up to date
+            placeholder_name = char_name or self.character_service.get_char_name(char_id)
+            self.save_character_info(self.get_stub_character_info(char_id, placeholder_name, "chat_server"))
+
+    def get_stub_character_info(self, char_id, char_name=None, source="stub"):
+        return DictObject({
+            "name": char_name or "Unknown:" + str(char_id),
+            "char_id": char_id,
+            "first_name": "",
+            "last_name": "",
+            "level": 0,
+            "breed": "",
+            "dimension": self.bot.dimension,
+            "gender": "",
+            "faction": "",
+            "profession": "",
+            "profession_title": "",
+            "ai_rank": "",
+            "ai_level": 0,
+            "pvp_rating": 0,
+            "pvp_title": "",
+            "head_id": 0,
+            "org_id": 0,
+            "org_name": "",
+            "org_rank_name": "",
+            "org_rank_id": 6,
+            "source": source
+        })
 
     def save_character_info(self, char_info):
-        if char_info["dimension"] != self.bot.dimension:
-            return
+        self.save_character_infos([char_info])
 
-        self.db.exec("DELETE FROM player WHERE char_id = ?", [char_info["char_id"]])
+    # saves many records with one batched DELETE and INSERT
+    def save_character_infos(self, char_infos):
+        char_infos = [char_info for char_info in char_infos if char_info["dimension"] == self.bot.dimension]
+        if not char_infos:
+            return
 
         insert_sql = """
             INSERT IGNORE INTO player ( char_id, name, first_name, last_name, level, breed, gender, faction, profession,
@@ -154,10 +278,24 @@ class PorkService:
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
 
-        self.db.exec(insert_sql, [char_info["char_id"], char_info["name"], char_info["first_name"], char_info["last_name"], char_info["level"], char_info["breed"],
-                                  char_info["gender"], char_info["faction"], char_info["profession"], char_info["profession_title"], char_info["ai_rank"], char_info["ai_level"],
-                                  char_info["org_id"], char_info["org_name"], char_info["org_rank_name"], char_info["org_rank_id"], char_info["dimension"], char_info["head_id"],
-                                  char_info["pvp_rating"], char_info["pvp_title"], char_info["source"], int(time.time())])
+        t = int(time.time())
+        with self.db.transaction():
+            self.db.exec_many("DELETE FROM player WHERE char_id = ?", [[char_info["char_id"]] for char_info in char_infos])
+            self.db.exec_many(insert_sql, [[char_info["char_id"], char_info["name"], char_info["first_name"], char_info["last_name"], char_info["level"],
+                                            char_info["breed"], char_info["gender"], char_info["faction"], char_info["profession"], char_info["profession_title"],
+                                            char_info["ai_rank"], char_info["ai_level"], char_info["org_id"], char_info["org_name"], char_info["org_rank_name"],
+                                            char_info["org_rank_id"], char_info["dimension"], char_info["head_id"], char_info["pvp_rating"], char_info["pvp_title"],
+                                            char_info["source"], t] for char_info in char_infos])
+
+        self.fire_character_info_updated([char_info["char_id"] for char_info in char_infos])
+
+    def fire_character_info_updated(self, char_ids):
+        # events are handled on the main thread, but character info can also be saved from other threads
+        event_data = DictObject({"char_ids": char_ids})
+        if threading.current_thread() is threading.main_thread():
+            self.event_service.fire_event(self.CHARACTER_INFO_UPDATED_EVENT, event_data)
+        else:
+            self.executor_service.run_on_main_thread(self.event_service.fire_event, self.CHARACTER_INFO_UPDATED_EVENT, event_data)
 
     def get_from_database(self, char_id=None, char_name=None):
         if char_id:
@@ -178,21 +316,17 @@ class PorkService:
         if packet.char_id == 4294967295:
             return
 
-        character = self.get_from_database(char_id=packet.char_id)
-
-        if character:
-            if character.name != packet.name:
-                self.db.exec("UPDATE player SET name = ? WHERE char_id = ?", [packet.name, packet.char_id])
-        else:
-            insert_sql = """
-                INSERT IGNORE INTO player ( char_id, name, first_name, last_name, level, breed, gender, faction, profession,
-                profession_title, ai_rank, ai_level, org_id, org_name, org_rank_name, org_rank_id, dimension, head_id,
-                pvp_rating, pvp_title, source, last_updated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-
-            self.db.exec(insert_sql, [packet.char_id, packet.name, "", "", 0, "", "",
-                                      "", "", "", "", 0, 0, "", "", 6, self.bot.dimension, 0, 0, "",
-                                      "chat_server", int(time.time())])
+        # a stub record is inserted if there isn't one yet, then the name is updated, without reading the existing record first
+        insert_sql = """
+            INSERT IGNORE INTO player ( char_id, name, first_name, last_name, level, breed, gender, faction, profession,
+            profession_title, ai_rank, ai_level, org_id, org_name, org_rank_name, org_rank_id, dimension, head_id,
+            pvp_rating, pvp_title, source, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+        self.write_behind_service.add(insert_sql, [packet.char_id, packet.name, "", "", 0, "", "",
+                                                   "", "", "", "", 0, 0, "", "", 6, self.bot.dimension, 0, 0, "",
+                                                   "chat_server", int(time.time())])
+        self.write_behind_service.add("UPDATE player SET name = ? WHERE char_id = ? AND name <> ?", [packet.name, packet.char_id, packet.name])
 
     def find_orgs(self, search):
         return self.db.query("SELECT DISTINCT org_name, org_id FROM player WHERE org_name <EXTENDED_LIKE=0> ?", [search], extended_like=True)
@@ -0,0 +1,250 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.decorators import instance
+from core.dict_object import DictObject
+from core.logger import Logger
+from core.setting_types import NumberSettingType
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, description, label_names=(), collect=None):
+        """
+        Args:
+            name: str
+            description: str
+            label_names: list of str
+            collect: optional () -> dict of label values tuple -> value, called whenever the metric is read
+                instead of keeping values in the metric
+        """
+
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.collect = collect
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get_samples(self):
+        """Returns label values tuple -> value. Safe to call from any thread."""
+
+        if self.collect:
+            return self.collect()
+
+        with self.lock:
+            return dict(self.values)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, value=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    # upper bounds of the buckets, in seconds
+    DEFAULT_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+    def __init__(self, name, description, label_names=(), buckets=None, max_series=None):
+        """
+        Args:
+            name: str
+            description: str
+            label_names: list of str
+            buckets: list of bucket upper bounds, in ascending order
+            max_series: optional max number of distinct label values, further label values are counted as "other"
+        """
+
+        super().__init__(name, description, label_names)
+        self.buckets = buckets or self.DEFAULT_BUCKETS
+        self.max_series = max_series
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            sample = self.values.get(label_values)
+            if not sample:
+                if self.max_series and len(self.values) >= self.max_series:
+                    label_values = ("other",) * len(label_values)
+                    sample = self.values.get(label_values)
+
+                if not sample:
+                    sample = DictObject({"count": 0, "sum": 0, "max": 0, "buckets": [0] * (len(self.buckets) + 1)})
+                    self.values[label_values] = sample
+
+            sample["count"] += 1
+            sample["sum"] += value
+            if value > sample["max"]:
+                sample["max"] = value
+            sample["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+
+    def get_samples(self):
+        with self.lock:
+            return {k: DictObject({"count": v.count, "sum": v.sum, "max": v.max, "buckets": list(v.buckets)}) for k, v in self.values.items()}
+
+
+@instance()
+class MetricsService:
+    PREFIX = "tyrbot_"
+
+    def __init__(self):
+        self.logger = Logger(__name__)
+        self.metrics = {}
+        self.http_server = None
+
+    def inject(self, registry):
+        self.bot = registry.get_instance("bot")
+        self.db = registry.get_instance("db")
+        self.event_service = registry.get_instance("event_service")
+        self.command_service = registry.get_instance("command_service")
+        self.pork_service = registry.get_instance("pork_service")
+        self.org_pork_service = registry.get_instance("org_pork_service")
+        self.setting_service = registry.get_instance("setting_service")
+        self.write_behind_service = registry.get_instance("write_behind_service")
+
+    def start(self):
+        self.counter("packets_received_total", "Packets received, per conn and packet id", ["conn", "packet_id"],
+                     collect=lambda: self.collect_conn_packet_counts("packets_received"))
+        self.counter("packets_sent_total", "Packets sent, per conn and packet id", ["conn", "packet_id"],
+                     collect=lambda: self.collect_conn_packet_counts("packets_sent"))
+        self.gauge("outgoing_queue_size", "Packets waiting in the outgoing packet queue, per conn", ["conn"],
+                   collect=lambda: {(_id,): len(conn.packet_queue) for _id, conn in list(self.bot.get_conns())})
+        self.gauge("incoming_queue_size", "Packets waiting to be handled by the main thread",
+                   collect=lambda: {(): self.bot.incoming_queue.qsize()})
+        self.gauge("mass_message_queue_size", "Messages waiting to be sent by non-main conns",
+                   collect=lambda: {(): self.bot.mass_message_queue.qsize() if self.bot.mass_message_queue else 0})
+        self.register(self.bot.incoming_queue_wait_times)
+        self.register(self.db.query_times)
+        self.register(self.db.connection_wait_times)
+        self.register(self.db.reconnects)
+        self.register(self.db.sql_cache_lookups)
+        self.gauge("db_connections", "Pooled MySQL connections, per state", ["state"],
+                   collect=lambda: {("idle",): self.db.pool.get_num_idle(), ("in_use",): self.db.pool.get_num_in_use()} if self.db.pool else {})
+        self.gauge("write_behind_queue_size", "Rows waiting to be written to the database",
+                   collect=lambda: {(): self.write_behind_service.get_queue_size()})
+        self.register(self.write_behind_service.flush_times)
+        self.register(self.event_service.handler_times)
+        self.register(self.command_service.handler_times)
+        self.register(self.pork_service.request_times)
+        self.register(self.org_pork_service.request_times)
+
+        self.setting_service.register("core.system", "metrics_http_port", "", NumberSettingType(allow_empty=True),
+                                      "Port for serving metrics in the Prometheus text format on 127.0.0.1 (leave empty to disable)")
+        self.setting_service.register_change_listener("metrics_http_port", self.metrics_http_port_changed)
+        self.start_http_server(self.setting_service.get("metrics_http_port").get_value())
+
+    def counter(self, name, description, label_names=(), collect=None):
+        return self.metrics.get(name) or self.register(Counter(name, description, label_names, collect))
+
+    def gauge(self, name, description, label_names=(), collect=None):
+        return self.metrics.get(name) or self.register(Gauge(name, description, label_names, collect))
+
+    def histogram(self, name, description, label_names=(), buckets=None, max_series=None):
+        return self.metrics.get(name) or self.register(Histogram(name, description, label_names, buckets, max_series))
+
+    def register(self, metric):
+        """Adds a metric that was created elsewhere, so that it is included in !metrics and the metrics endpoint"""
+
+        self.metrics[metric.name] = metric
+        return metric
+
+    def get_metrics(self):
+        return list(self.metrics.values())
+
+    def get_metric(self, name):
+        return self.metrics.get(name)
+
+    def collect_conn_packet_counts(self, attr):
+        result = {}
+        for _id, conn in list(self.bot.get_conns()):
+            for packet_id, count in dict(getattr(conn, attr)).items():
+                result[(_id, packet_id)] = count
+        return result
+
+    def format_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format. Safe to call from any thread."""
+
+        lines = []
+        for metric in self.get_metrics():
+            name = self.PREFIX + metric.name
+            lines.append("# HELP %s %s" % (name, metric.description))
+            lines.append("# TYPE %s %s" % (name, metric.type))
+            for label_values, value in metric.get_samples().items():
+                labels = self.format_labels(metric.label_names, label_values)
+                if metric.type == "histogram":
+                    total = 0
+                    for upper_bound, count in zip(metric.buckets + ["+Inf"], value.buckets):
+                        total += count
+                        lines.append("%s_bucket%s %d" % (name, self.format_labels(metric.label_names + ("le",), label_values + (upper_bound,)), total))
+                    lines.append("%s_sum%s %f" % (name, labels, value.sum))
+                    lines.append("%s_count%s %d" % (name, labels, value.count))
+                else:
+                    lines.append("%s%s %s" % (name, labels, value))
+
+        return "\n".join(lines) + "\n"
+
+    def format_labels(self, label_names, label_values):
+        if not label_names:
+            return ""
+
+        labels = []
+        for label_name, label_value in zip(label_names, label_values):
+            label_value = str(label_value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            labels.append("%s=\"%s\"" % (label_name, label_value))
+        return "{" + ",".join(labels) + "}"
+
+    def metrics_http_port_changed(self, name, old_value, new_value):
+        self.stop_http_server()
+        self.start_http_server(self.setting_service.get("metrics_http_port").get_value())
+
+    def start_http_server(self, port):
+        if not port:
+            return
+
+        metrics_service = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics_service.format_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.http_server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+        except OSError as e:
+            self.logger.error("Could not start metrics http server on port %d" % port, e)
+            return
+
+        self.http_server.daemon_threads = True
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        self.logger.info("Serving metrics on http://127.0.0.1:%d/metrics" % port)
+
+    def stop_http_server(self):
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
@@ -66,6 +66,7 @@ class PrivateChannelService:
         else:
             self.logger.log_chat(conn, "Private Channel", None, f"{char_name} joined the channel.")
             conn.private_channel[packet.char_id] = packet
+            self.access_service.clear_access_level_cache(packet.char_id)
 
             if conn.is_main:
                 self.event_service.fire_event(self.JOINED_PRIVATE_CHANNEL_EVENT, DictObject({"char_id": packet.char_id,
@@ -81,6 +82,7 @@ class PrivateChannelService:
         else:
             self.logger.log_chat(conn, "Private Channel", None, f"{char_name} left the channel.")
             del conn.private_channel[packet.char_id]
+            self.access_service.clear_access_level_cache(packet.char_id)
 
             if conn.is_main:
                 self.event_service.fire_event(self.LEFT_PRIVATE_CHANNEL_EVENT, DictObject({"char_id": packet.char_id,
@@ -88,7 +90,8 @@ class PrivateChannelService:
                                                                                            "conn": conn}))
 
     def handle_private_channel_command(self, conn: Conn, packet: server_packets.PrivateChannelMessage):
-        if not self.setting_service.get("accept_commands_from_slave_bots").get_value() and not conn.is_main:
+        settings = self.setting_service.get_snapshot()
+        if not settings.accept_commands_from_slave_bots and not conn.is_main:
             return False
 
         # since the command symbol is required in the private channel,
@@ -105,7 +108,7 @@ class PrivateChannelService:
             self.event_service.fire_event(self.PRIVATE_CHANNEL_COMMAND_EVENT,
                                           DictObject({"char_id": None, "name": None, "message": msg, "conn": conn}))
 
-        if message.startswith(self.setting_service.get("symbol").get_value()) and packet.private_channel_id == conn.get_char_id():
+        if message.startswith(settings.symbol) and packet.private_channel_id == conn.get_char_id():
             char_name = self.character_service.get_char_name(packet.char_id)
             self.event_service.fire_event(self.PRIVATE_CHANNEL_COMMAND_EVENT,
                                           DictObject({"char_id": packet.char_id, "name": char_name, "message": packet.message, "conn": conn}))
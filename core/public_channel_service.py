@@ -113,7 +113,8 @@ class PublicChannelService:
                                                                           "conn": conn}))
 
     def handle_public_channel_command(self, conn: Conn, packet: server_packets.PublicChannelMessage):
-        if not self.setting_service.get("accept_commands_from_slave_bots").get_value() and not conn.is_main:
+        settings = self.setting_service.get_snapshot()
+        if not settings.accept_commands_from_slave_bots and not conn.is_main:
             return False
 
         # since the command symbol is required in the org channel,
@@ -134,7 +135,7 @@ class PublicChannelService:
                 self.event_service.fire_event(self.ORG_CHANNEL_COMMAND_EVENT,
                                               DictObject({"char_id": None, "name": None, "message": msg, "conn": conn}))
 
-        if message.startswith(self.setting_service.get("symbol").get_value()) and conn.org_channel_id == packet.channel_id:
+        if message.startswith(settings.symbol) and conn.org_channel_id == packet.channel_id:
             char_name = self.character_service.get_char_name(packet.char_id)
             self.event_service.fire_event(self.ORG_CHANNEL_COMMAND_EVENT,
                                           DictObject({"char_id": packet.char_id, "name": char_name, "message": packet.message, "conn": conn}))
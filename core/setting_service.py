@@ -7,13 +7,36 @@ from core.registry import Registry
 from core.functions import get_attrs
 
 
+class SettingsSnapshot:
+    """Immutable view of the typed setting values, settings can be read as attributes or with get()"""
+
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Settings snapshot is read-only")
+
+    def get(self, name):
+        return self.__dict__.get(name)
+
+    def with_value(self, name, value):
+        values = dict(self.__dict__)
+        values[name] = value
+        return SettingsSnapshot(values)
+
+
 @instance()
 class SettingService:
     def __init__(self):
         self.logger = Logger(__name__)
         self.settings = {}
-        self.db_cache = {}
+        # name -> value as stored in the database, loaded with a single query on first use
+        self.raw_values = None
+        # replaced instead of modified when a setting changes, so readers always see a consistent set of values
+        self.snapshot = SettingsSnapshot({})
         self.change_listeners = {}
+        # incremented whenever a setting value changes, so that values derived from settings can be cached
+        self.settings_version = 0
 
     def inject(self, registry):
         self.db = registry.get_instance("db")
@@ -41,14 +64,15 @@ class SettingService:
         if " " in name:
             raise Exception("One or more spaces found in setting name '%s' for module '%s'" % (name, module))
 
-        row = self.db.query_single("SELECT name, value, description FROM setting WHERE name = ?", [name])
+        self.settings[name] = setting
 
-        if row is None:
+        if name not in self.get_raw_values():
             self.logger.debug("Adding setting '%s'" % name)
 
             self.db.exec(
                 "INSERT INTO setting (name, value, description, module, verified) VALUES (?, ?, ?, ?, ?)",
                 [name, "", description, module, 1])
+            self.raw_values[name] = ""
 
             # verify default value is a valid value, and is formatted appropriately
             setting.set_value(value)
@@ -58,7 +82,7 @@ class SettingService:
                 "UPDATE setting SET description = ?, verified = ?, module = ? WHERE name = ?",
                 [description, 1, module, name])
 
-        self.settings[name] = setting
+            self.snapshot = self.snapshot.with_value(name, setting.parse_value(self.raw_values[name]))
 
     def register_change_listener(self, setting_name, handler):
         """
@@ -79,31 +103,44 @@ class SettingService:
         else:
             raise Exception("Could not register change_listener for setting '%s' since it does not exist" % setting_name)
 
+    def get_raw_values(self):
+        if self.raw_values is None:
+            self.raw_values = {row.name: row.value for row in self.db.query("SELECT name, value FROM setting")}
+        return self.raw_values
+
     def get_value(self, name):
-        # check cache first
-        result = self.db_cache.get(name, None)
-        if result:
-            return result.value
-        else:
-            row = self.db.query_single("SELECT value FROM setting WHERE name = ?", [name])
+        """Returns the value of a setting as stored in the database"""
+
+        return self.get_raw_values().get(name)
+
+    def get_typed_value(self, name):
+        return self.snapshot.get(name)
 
-            # store result in cache
-            self.db_cache[name] = row
+    def get_snapshot(self):
+        """Returns the typed values of all settings, for reading several settings at once without them changing in between"""
 
-            return row.value if row else None
+        return self.snapshot
 
     def set_value(self, name, value):
         old_value = self.get_value(name)
 
-        # clear cache
-        self.db_cache[name] = None
-
         self.db.exec("UPDATE setting SET value = ? WHERE name = ?", [value, name])
 
+        # values are read back from the database as strings
+        raw_value = str(value)
+        self.raw_values[name] = raw_value
+        setting = self.settings.get(name)
+        if setting:
+            self.snapshot = self.snapshot.with_value(name, setting.parse_value(raw_value))
+        self.settings_version += 1
+
         if name in self.change_listeners:
             for change_listener in self.change_listeners[name]:
                 change_listener(name, old_value, value)
 
+    def get_settings_version(self):
+        return self.settings_version
+
     def get(self, name):
         name = name.lower()
         setting = self.settings.get(name, None)
@@ -28,7 +28,11 @@ class SettingType:
 
     def get_value(self):
         """Get the processed/typed value"""
-        return self._get_raw_value()
+        return self.setting_service.get_typed_value(self.name)
+
+    def parse_value(self, value):
+        """Convert a value from the database to the processed/typed value"""
+        return value
 
     def get_display_value(self):
         """Get the value formatted for display"""
@@ -106,7 +110,10 @@ class DictionarySettingType(SettingType):
             raise Exception("Value must be a dictionary.")
 
     def get_value(self):
-        value = self._get_raw_value()
+        # copy so callers can modify the result without modifying the cached value
+        return DictObject(super().get_value())
+
+    def parse_value(self, value):
         if value:
             return DictObject(json.loads(value))
         else:
@@ -202,10 +209,9 @@ class NumberSettingType(SettingType):
         self.options = options
         self.allow_empty = allow_empty
 
-    def get_value(self):
-        v = self._get_raw_value()
-        if v != "":
-            return int(self._get_raw_value())
+    def parse_value(self, value):
+        if value != "":
+            return int(value)
         else:
             return ""
 
@@ -243,8 +249,8 @@ class TimeSettingType(SettingType):
         super().__init__()
         self.options = options
 
-    def get_value(self):
-        return int(self._get_raw_value())
+    def parse_value(self, value):
+        return int(value)
 
     def get_display_value(self):
         util = Registry.get_instance("util")
@@ -275,8 +281,8 @@ class BooleanSettingType(SettingType):
     def __init__(self):
         super().__init__()
 
-    def get_value(self):
-        return int(self._get_raw_value()) == 1
+    def parse_value(self, value):
+        return int(value) == 1
 
     def get_display_value(self):
         return "<highlight>%s</highlight>" % ("True" if self.get_value() else "False")
@@ -1,4 +1,5 @@
 import re
+from collections import OrderedDict
 from html.parser import HTMLParser
 
 from core.conn import Conn
@@ -151,6 +152,18 @@ class MLStripper(HTMLParser):
 
 @instance()
 class Text:
+    PAGE_CACHE_SIZE = 100
+
+    # markup tag -> static font color
+    MARKUP_COLORS = {"black": "#000000", "white": "#FFFFFF", "yellow": "#FFFF00", "blue": "#8CB5FF", "green": "#00DE42", "red": "#FF0000",
+                     "orange": "#FCA712", "grey": "#C3C3C3", "cyan": "#00FFFF", "violet": "#8F00FF"}
+
+    # markup tags whose font color comes from the "<tag>_color" setting
+    MARKUP_COLOR_SETTINGS = ["header", "header2", "highlight", "notice", "neutral", "omni", "clan", "unknown"]
+
+    # settings used when rendering markup, the markup tables are rebuilt when one of these changes
+    MARKUP_SETTINGS = ["symbol"] + [tag + "_color" for tag in MARKUP_COLOR_SETTINGS]
+
     separators = [{"symbol": "<pagebreak>", "include": False}, {"symbol": "\n", "include": True}, {"symbol": " ", "include": True}]
 
     # taken from IGN bot
@@ -165,6 +178,15 @@ class Text:
     def __init__(self):
         self.logger = Logger(__name__)
         self.items_regex = re.compile(r"<a href=\"itemref://(\d+)/(\d+)/(\d+)\">(.+?)</a>")
+        # recently paginated blobs, so the same blob sent to many recipients is only formatted and split once
+        self.page_cache = OrderedDict()
+
+        tags = list(self.MARKUP_COLORS) + self.MARKUP_COLOR_SETTINGS
+        self.markup_regex = re.compile("(</?(?:%s)>|<(?:myname|myorg|tab|end|symbol|br)>)" % "|".join(tags))
+        # markup tag -> replacement for tags that do not depend on the conn
+        self.markup_base_table = None
+        # (char name, org name) -> markup tag -> replacement
+        self.markup_tables = {}
 
     def inject(self, registry):
         self.setting_service: SettingService = registry.get_instance("setting_service")
@@ -235,6 +257,22 @@ class Text:
         return self.paginate(chatblob, conn, 8000)[0]
 
     def paginate(self, chatblob, conn: Conn, max_page_length=None, max_num_pages=None, footer=None):
+        # the formatted pages depend on the conn's name and org name and on the current settings (colors, symbol)
+        cache_key = (chatblob.title, chatblob.msg, chatblob.page_prefix, chatblob.page_postfix, max_page_length, max_num_pages, footer,
+                     conn.get_char_name(), conn.get_org_name(), self.setting_service.get_settings_version())
+
+        pages = self.page_cache.get(cache_key)
+        if pages is None:
+            pages = self.paginate_uncached(chatblob, conn, max_page_length, max_num_pages, footer)
+            self.page_cache[cache_key] = pages
+            if len(self.page_cache) > self.PAGE_CACHE_SIZE:
+                self.page_cache.popitem(last=False)
+        else:
+            self.page_cache.move_to_end(cache_key)
+
+        return list(pages)
+
+    def paginate_uncached(self, chatblob, conn: Conn, max_page_length=None, max_num_pages=None, footer=None):
         label = chatblob.title
         msg = chatblob.msg
 
@@ -251,7 +289,7 @@ class Text:
         msg = self.format_message(msg, conn)
 
         if footer:
-            footer = "\n\n" + self.format_message(footer.replace("\"", "&quot;", conn).strip(), conn)
+            footer = "\n\n" + self.format_message(footer.replace("\"", "&quot;").strip(), conn)
         else:
             footer = ""
 
@@ -259,60 +297,84 @@ class Text:
         if max_page_length:
             adjusted_max_page_length = max_page_length - len(footer)
         pages = self.split_by_separators(msg, adjusted_max_page_length, max_num_pages)
-        pages = list(map(lambda p: p + footer, pages))
 
         num_pages = len(pages)
+        formatted_label = self.format_message(label, conn)
 
-        def mapper(tup):
-            page, index = tup
+        result = []
+        for index, page in enumerate(pages, 1):
             if num_pages == 1:
-                label2 = self.format_message(label, conn)
+                page_label = formatted_label
             else:
-                label2 = self.format_message(label, conn) + " (Page " + str(index) + " / " + str(num_pages) + ")"
-            return chatblob.page_prefix + self.format_page(label2, page) + chatblob.page_postfix
+                page_label = formatted_label + " (Page " + str(index) + " / " + str(num_pages) + ")"
+            result.append(chatblob.page_prefix + self.format_page(page_label, page + footer) + chatblob.page_postfix)
 
-        return list(map(mapper, zip(pages, range(1, num_pages + 1))))
+        return result
 
     def split_by_separators(self, content, max_page_length=None, max_num_pages=None):
         separators = iter(self.separators)
 
         separator = next(separators)
-        rest = content
-        current_page = ""
+        # the remaining content is content[pos:], it is only copied when switching to the next separator
+        pos = 0
+        current_page = []
+        current_page_length = 0
         pages = []
 
-        while len(rest) > 0:
-            line, rest = self.get_next_line(rest, separator)
-            line_length = len(line)
+        while pos < len(content):
+            line_start = pos
+            line_end, pos, found = self.find_next_line(content, pos, separator)
+            line_length = line_end - line_start
+            if separator["include"]:
+                line_length += len(separator["symbol"])
 
             # if separator is not sufficient, try the next one
             if max_page_length and line_length > max_page_length:
                 try:
+                    if separator["include"] and found:
+                        pos = line_start
+                    elif separator["include"]:
+                        content = content[line_start:] + separator["symbol"]
+                        pos = 0
+                    else:
+                        content = content[line_start:line_end] + content[pos:]
+                        pos = 0
+
                     separator = next(separators)
-                    rest = line + rest
                     continue
                 except StopIteration:
                     # this is thrown when there are no more separators in the iterator
                     raise Exception("Could not paginate: page is too large")
 
             if max_num_pages == len(pages) + 1:
-                if max_page_length and (len(current_page) + line_length > max_page_length):
+                if max_page_length and (current_page_length + line_length > max_page_length):
                     break
             else:
-                if max_page_length and len(current_page) + line_length > max_page_length:
-                    pages.append(current_page.strip())
-                    current_page = ""
+                if max_page_length and current_page_length + line_length > max_page_length:
+                    pages.append("".join(current_page).strip())
+                    current_page = []
+                    current_page_length = 0
 
-            current_page += line
+            current_page.append(content[line_start:line_end])
+            if separator["include"]:
+                current_page.append(separator["symbol"])
+            current_page_length += line_length
 
-        current_page = current_page.strip()
-        if max_page_length and len(current_page) > max_page_length:
-            pages.append(current_page)
-        else:
-            pages.append(current_page)
+        pages.append("".join(current_page).strip())
 
         return pages
 
+    def find_next_line(self, content, pos, separator):
+        """Returns the end of the next line starting at `pos` (excluding the separator), the start of the line after it,
+        and whether the separator was found"""
+
+        symbol = separator["symbol"]
+        index = content.find(symbol, pos)
+        if index == -1:
+            return len(content), len(content), False
+        else:
+            return index, index + len(symbol), True
+
     def format_page(self, label, msg):
         return "<a href=\"text://%s\">%s</a>" % (msg, label)
 
@@ -415,35 +477,45 @@ class Text:
         return text_formatter.format_message(msg)
 
     def format_message_old(self, msg, conn: Conn):
-        for t in ["</header>", "</header2>", "</highlight>", "</notice>", "</black>", "</white>", "</yellow>", "</blue>", "</green>", "</red>", "</orange>", "</grey>", "</cyan>",
-                  "</violet>", "</neutral>", "</omni>", "</clan>", "</unknown>"]:
-            msg = msg.replace(t, "</font>")
-
-        return msg \
-            .replace("<header>", self.setting_service.get("header_color").get_font_color()) \
-            .replace("<header2>", self.setting_service.get("header2_color").get_font_color()) \
-            .replace("<highlight>", self.setting_service.get("highlight_color").get_font_color()) \
-            .replace("<notice>", self.setting_service.get("notice_color").get_font_color()) \
-            \
-            .replace("<black>", "<font color='#000000'>") \
-            .replace("<white>", "<font color='#FFFFFF'>") \
-            .replace("<yellow>", "<font color='#FFFF00'>") \
-            .replace("<blue>", "<font color='#8CB5FF'>") \
-            .replace("<green>", "<font color='#00DE42'>") \
-            .replace("<red>", "<font color='#FF0000'>") \
-            .replace("<orange>", "<font color='#FCA712'>") \
-            .replace("<grey>", "<font color='#C3C3C3'>") \
-            .replace("<cyan>", "<font color='#00FFFF'>") \
-            .replace("<violet>", "<font color='#8F00FF'>") \
-            \
-            .replace("<neutral>", self.setting_service.get("neutral_color").get_font_color()) \
-            .replace("<omni>", self.setting_service.get("omni_color").get_font_color()) \
-            .replace("<clan>", self.setting_service.get("clan_color").get_font_color()) \
-            .replace("<unknown>", self.setting_service.get("unknown_color").get_font_color()) \
-            \
-            .replace("<myname>", conn.get_char_name()) \
-            .replace("<myorg>", conn.get_org_name() or "Unknown Org") \
-            .replace("<tab>", "    ") \
-            .replace("<end>", "</font>") \
-            .replace("<symbol>", self.setting_service.get("symbol").get_value()) \
-            .replace("<br>", "\n")
+        # split() returns the text between tags at even indexes and the tags themselves at odd indexes
+        parts = self.markup_regex.split(msg)
+        if len(parts) == 1:
+            return msg
+
+        parts[1::2] = map(self.get_markup_table(conn).__getitem__, parts[1::2])
+        return "".join(parts)
+
+    def get_markup_table(self, conn: Conn):
+        char_name = conn.get_char_name()
+        org_name = conn.get_org_name()
+        table = self.markup_tables.get((char_name, org_name))
+        if table is None:
+            if self.markup_base_table is None:
+                self.markup_base_table = self.build_markup_base_table()
+
+            table = dict(self.markup_base_table)
+            table["<myname>"] = char_name
+            table["<myorg>"] = org_name or "Unknown Org"
+            self.markup_tables[(char_name, org_name)] = table
+
+        return table
+
+    def build_markup_base_table(self):
+        table = {}
+        for tag, color in self.MARKUP_COLORS.items():
+            table["<" + tag + ">"] = "<font color='%s'>" % color
+            table["</" + tag + ">"] = "</font>"
+
+        for tag in self.MARKUP_COLOR_SETTINGS:
+            table["<" + tag + ">"] = self.setting_service.get(tag + "_color").get_font_color()
+            table["</" + tag + ">"] = "</font>"
+
+        table["<tab>"] = "    "
+        table["<end>"] = "</font>"
+        table["<symbol>"] = self.setting_service.get("symbol").get_value()
+        table["<br>"] = "\n"
+        return table
+
+    def markup_setting_changed(self, name, old_value, new_value):
+        self.markup_base_table = None
+        self.markup_tables = {}
@@ -6,9 +6,11 @@ import requests
 
 from core.conn import Conn
 from core.feature_flags import FeatureFlags
-from core.fifo_queue import FifoQueue
+from core.fifo_queue import FifoQueue, TimedFifoQueue
+from core.io_loop import IOLoop
 from core.dict_object import DictObject
 from core.logger import Logger
+from core.metrics_service import Histogram
 from core.lookup.character_service import CharacterService
 from core.public_channel_service import PublicChannelService
 from core.setting_service import SettingService
@@ -39,8 +41,10 @@ class Tyrbot:
         self.last_timer_event = 0
         self.start_time = int(time.time())
         self.version = "unknown"
-        self.incoming_queue = FifoQueue()
+        self.incoming_queue_wait_times = Histogram("incoming_queue_wait_seconds", "Time packets wait before being handled by the main thread")
+        self.incoming_queue = TimedFifoQueue(self.incoming_queue_wait_times)
         self.mass_message_queue = None
+        self.io_loop = None
         self.conns = DictObject()
         self.primary_conn_id = None
 
@@ -53,6 +57,8 @@ class Tyrbot:
         self.access_service: AccessService = registry.get_instance("access_service")
         self.event_service = registry.get_instance("event_service")
         self.job_scheduler = registry.get_instance("job_scheduler")
+        self.executor_service = registry.get_instance("executor_service")
+        self.write_behind_service = registry.get_instance("write_behind_service")
 
     def init(self, config, registry, mmdb_parser):
         self.mmdb_parser = mmdb_parser
@@ -127,6 +133,9 @@ class Tyrbot:
         self.setting_service.register("core.colors", "private_message_color", "#89D2E8", ColorSettingType(), "Default private message color")
         self.setting_service.register("core.colors", "blob_color", "#FFFFFF", ColorSettingType(), "Default blob content color")
 
+        for setting_name in self.text.MARKUP_SETTINGS:
+            self.setting_service.register_change_listener(setting_name, self.text.markup_setting_changed)
+
         self.register_packet_handler(server_packets.PrivateMessage.id, self.handle_private_message, priority=40)
 
     def check_superadmin(self, char_id):
@@ -134,6 +143,10 @@ class Tyrbot:
         return char_name == self.superadmin
 
     def connect(self, config):
+        if FeatureFlags.SINGLE_IO_LOOP:
+            self.io_loop = IOLoop(self.incoming_queue, lambda: self.status == BotStatus.RUN, self.handle_io_loop_failure)
+            self.io_loop.start()
+
         for i, bot in enumerate(config.bots):
             if "id" in bot:
                 _id = bot.id
@@ -173,7 +186,14 @@ class Tyrbot:
 
                 self.conns[_id] = conn
 
-                self.create_conn_thread(conn, None if bot.is_main else self.mass_message_queue)
+                if self.io_loop:
+                    self.io_loop.add_conn(conn, None if bot.is_main else self.mass_message_queue)
+                else:
+                    self.create_conn_thread(conn, None if bot.is_main else self.mass_message_queue)
+
+        # tells that overflow the outgoing queue of a main conn are sent by the non-main bots instead
+        for _id, conn in self.get_conns(lambda x: x.is_main):
+            conn.overflow_queue = self.mass_message_queue
 
         return True
 
@@ -214,20 +234,6 @@ class Tyrbot:
                     if packet:
                         self.incoming_queue.put((conn, packet))
 
-                    if mass_message_queue:
-                        if FeatureFlags.FORCE_LARGE_MESSAGES_FROM_SLAVES:
-                            if conn.packet_queue.is_empty():
-                                packet = mass_message_queue.get_or_default(block=False)
-                                if packet:
-                                    conn.add_packets_to_queue([packet])
-                        else:
-                            while conn.packet_queue.is_empty():
-                                packet = mass_message_queue.get_or_default(block=False)
-                                if packet:
-                                    conn.add_packets_to_queue([packet])
-                                else:
-                                    break
-
             except (EOFError, OSError) as e:
                 self.status = BotStatus.ERROR
                 self.logger.error("", e)
@@ -236,6 +242,12 @@ class Tyrbot:
         dthread = threading.Thread(target=read_packets, daemon=True)
         dthread.start()
 
+        sender_thread = threading.Thread(target=conn.run_sender, args=(lambda: self.status == BotStatus.RUN, mass_message_queue), daemon=True)
+        sender_thread.start()
+
+    def handle_io_loop_failure(self):
+        self.status = BotStatus.ERROR
+
     def create_conn(self, _id):
         def failure_callback():
             self.status = BotStatus.ERROR
@@ -279,7 +291,7 @@ class Tyrbot:
 
         while self.status == BotStatus.RUN:
             try:
-                timestamp = int(time.time())
+                timestamp = time.time()
                 self.check_for_timer_events(timestamp)
 
                 self.iterate()
@@ -288,14 +300,19 @@ class Tyrbot:
 
         # run any pending jobs/events
         self.check_for_timer_events(timestamp + 1)
+        self.event_service.save_timer_events()
+        self.write_behind_service.shutdown()
 
         return self.status
 
     def check_for_timer_events(self, timestamp):
+        # scheduled jobs have sub-second precision, so they are checked on every iteration
+        self.job_scheduler.check_for_scheduled_jobs(timestamp)
+
         # timer events will execute no more often than once per second
+        timestamp = int(timestamp)
         if self.last_timer_event < timestamp:
             self.last_timer_event = timestamp
-            self.job_scheduler.check_for_scheduled_jobs(timestamp)
             self.event_service.check_for_timer_events(timestamp)
 
     def register_packet_handler(self, packet_id: int, handler, priority=50):
@@ -330,10 +347,13 @@ class Tyrbot:
             elif isinstance(packet, server_packets.PublicChannelMessage):
                 packet = self.public_channel_message_ext_msg_handling(packet)
             elif isinstance(packet, server_packets.BuddyAdded) and packet.char_id == 0:
-                return
+                packet = None
+
+            if packet:
+                for handler in self.packet_handlers.get(packet.id, []):
+                    handler.handler(conn, packet)
 
-            for handler in self.packet_handlers.get(packet.id, []):
-                handler.handler(conn, packet)
+        self.executor_service.run_main_thread_callbacks()
 
         return packet
 
@@ -421,6 +441,8 @@ class Tyrbot:
                 packet = client_packets.PrivateMessage(char_id, color + page, "\0")
                 if self.mass_message_queue:
                     self.mass_message_queue.put(packet)
+                    if self.io_loop:
+                        self.io_loop.wakeup()
                 else:
                     conn.add_packets_to_queue([packet])
 
@@ -10,6 +10,8 @@ class UsageService:
 
     def inject(self, registry):
         self.db = registry.get_instance("db")
+        self.write_behind_service = registry.get_instance("write_behind_service")
 
     def add_usage(self, command, handler, char_id, channel):
-        self.db.exec("INSERT INTO command_usage (command, handler, char_id, channel, created_at) VALUES (?, ?, ?, ?, ?)", [command, handler, char_id, channel, int(time.time())])
+        self.write_behind_service.add("INSERT INTO command_usage (command, handler, char_id, channel, created_at) VALUES (?, ?, ?, ?, ?)",
+                                      [command, handler, char_id, channel, int(time.time())])
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+
+from core.decorators import instance
+from core.logger import Logger
+from core.metrics_service import Histogram
+
+
+@instance()
+class WriteBehindService:
+    # queued rows are written once there are this many of them, or once the oldest has waited FLUSH_INTERVAL seconds
+    FLUSH_SIZE = 500
+    FLUSH_INTERVAL = 1
+    # rows which fail with a transient error, such as a locked database, are queued again up to this many times
+    MAX_RETRIES = 3
+
+    def __init__(self):
+        self.logger = Logger(__name__)
+        # sql -> list of [params, retries], in the order the statements were first queued
+        self.queue = OrderedDict()
+        self.queue_size = 0
+        self.condition = threading.Condition()
+        # only one flush can run at a time so that rows are written in the order they were queued
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.flush_times = Histogram("write_behind_flush_seconds", "Time spent writing queued rows to the database")
+
+    def inject(self, registry):
+        self.db = registry.get_instance("db")
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run_writer, daemon=True, name="write_behind")
+        self.thread.start()
+
+    def add(self, sql, params):
+        """
+        Queues a statement to be executed later, together with other queued rows, in a single transaction.
+        Only use this for writes that nothing reads back straight away, such as appending to log tables or idempotent upserts.
+        Rows for the same statement are written in the order they were queued, and statements are written in the order
+        they were first queued since the last flush. Safe to call from any thread.
+
+        Args:
+            sql: str
+            params: list
+        """
+
+        with self.condition:
+            self.queue.setdefault(sql, []).append([params, 0])
+            self.queue_size += 1
+            if self.queue_size >= self.FLUSH_SIZE:
+                self.condition.notify()
+
+    def get_queue_size(self):
+        return self.queue_size
+
+    def run_writer(self):
+        while self.running:
+            with self.condition:
+                if self.queue_size < self.FLUSH_SIZE:
+                    self.condition.wait(self.FLUSH_INTERVAL)
+
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error("Error in write-behind writer", e)
+
+    def flush(self):
+        """Writes all queued rows. Called automatically, but can be called to make sure queued rows have been written."""
+
+        with self.flush_lock:
+            with self.condition:
+                queue = self.queue
+                num_rows = self.queue_size
+                self.queue = OrderedDict()
+                self.queue_size = 0
+
+            if not queue:
+                return
+
+            start_time = time.time()
+            try:
+                with self.db.transaction():
+                    for sql, rows in queue.items():
+                        self.db.exec_many(sql, [params for params, retries in rows])
+            except Exception as e:
+                # write each statement on its own so that one bad row does not lose the rows for other statements
+                self.logger.warning("Could not write %d queued rows in a single transaction, writing them separately: %s" % (num_rows, str(e)))
+                retry_queue = OrderedDict()
+                for sql, rows in queue.items():
+                    if retry_queue:
+                        # the database is unavailable, so the remaining rows are queued again in order without trying them
+                        retry_queue.setdefault(sql, []).extend(rows)
+                    else:
+                        self.write_rows(sql, rows, retry_queue)
+                self.requeue(retry_queue)
+
+            self.flush_times.observe(time.time() - start_time)
+
+    def write_rows(self, sql, rows, retry_queue):
+        try:
+            with self.db.transaction():
+                self.db.exec_many(sql, [params for params, retries in rows])
+            return
+        except Exception:
+            pass
+
+        for i, (params, retries) in enumerate(rows):
+            try:
+                self.db.exec(sql, params)
+            except Exception as e:
+                if self.db.is_transient_error(e) and retries < self.MAX_RETRIES:
+                    retry_queue[sql] = [[params, retries + 1]] + rows[i + 1:]
+                    return
+                else:
+                    self.logger.error("Dropping queued row which could not be written: '%s' [%s]" % (sql, ", ".join(map(lambda x: str(x), params))), e)
+
+    def requeue(self, retry_queue):
+        if not retry_queue:
+            return
+
+        # rows being retried go ahead of rows queued since, so rows for the same statement are still written in order
+        with self.condition:
+            for sql, rows in self.queue.items():
+                retry_queue.setdefault(sql, []).extend(rows)
+            self.queue = retry_queue
+            self.queue_size = sum(len(rows) for rows in retry_queue.values())
+
+    def shutdown(self):
+        """Stops the writer and writes any remaining rows"""
+
+        self.running = False
+        with self.condition:
+            self.condition.notify()
+
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+        # rows which failed with a transient error are queued again, so keep going until they have been written or dropped
+        for _ in range(self.MAX_RETRIES + 1):
+            self.flush()
+            if not self.queue_size:
+                break
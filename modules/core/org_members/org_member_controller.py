@@ -23,6 +23,7 @@ class OrgMemberController:
 
     ORG_MEMBER_LOGON_EVENT = "org_member_logon"
     ORG_MEMBER_LOGOFF_EVENT = "org_member_logoff"
+    ORG_ROSTER_CHANGED_EVENT = "org_roster_changed"
 
     LEFT_ORG = [508, 45978487]
     KICKED_FROM_ORG = [508, 37093479]
@@ -51,6 +52,7 @@ class OrgMemberController:
     def pre_start(self):
         self.event_service.register_event_type(self.ORG_MEMBER_LOGON_EVENT)
         self.event_service.register_event_type(self.ORG_MEMBER_LOGOFF_EVENT)
+        self.event_service.register_event_type(self.ORG_ROSTER_CHANGED_EVENT)
 
         self.access_service.register_access_level(self.ORG_ACCESS_LEVEL, 60, self.check_org_member)
         self.bot.register_packet_handler(BuddyAdded.id, self.handle_buddy_added)
@@ -131,8 +133,9 @@ class OrgMemberController:
 
     @event(event_type="connect", description="Add members as buddies of the bot on startup", is_system=True)
     def handle_connect_event(self, event_type, event_data):
-        for row in self.get_all_org_members():
-            self.update_buddylist(row.char_id, row.mode)
+        data = self.get_all_org_members()
+        self.buddy_service.add_buddies([row.char_id for row in data if row.mode in [self.MODE_ADD_MANUAL, self.MODE_ADD_AUTO]], self.ORG_BUDDY_TYPE)
+        self.buddy_service.remove_buddies([row.char_id for row in data if row.mode not in [self.MODE_ADD_MANUAL, self.MODE_ADD_AUTO]], self.ORG_BUDDY_TYPE)
 
     @timerevent(budatime="24h", description="Download the org_members roster", is_system=True)
     def download_org_roster_event(self, event_type, event_data):
@@ -175,24 +178,69 @@ class OrgMemberController:
                 self.logger.warning("Skipping roster update due to old cache")
                 return
 
-            for char_id, roster_member in org_info.org_members.items():
-                db_member = db_members.get(char_id, None)
-
-                mode = None
-                if db_member:
-                    mode = db_member.mode
-                    del db_members[char_id]
-
-                self.process_update(char_id, mode, self.MODE_ADD_AUTO, conn)
+            roster_char_ids = set(org_info.org_members.keys())
+            removed_members = [db_member for char_id, db_member in db_members.items() if char_id not in roster_char_ids and db_member.org_id == org_id]
+            for char_id in roster_char_ids:
+                db_members.pop(char_id, None)
 
-            for char_id, db_member in db_members.items():
-                if db_member.org_id == org_id:
-                    self.process_update(char_id, db_member.mode, self.MODE_REM_AUTO, conn)
+            self.sync_org_roster(roster_char_ids, removed_members, conn)
 
         # remove org members who no longer have a corresponding conn
         for org_id in extra_org_ids:
-            # TODO remove from buddy list
+            self.buddy_service.remove_buddies([row.char_id for row in self.get_org_members_by_org_id(org_id)], self.ORG_BUDDY_TYPE)
             self.db.exec("DELETE FROM org_member WHERE org_id = ?", [org_id])
+            self.access_service.clear_access_level_cache()
+
+    def sync_org_roster(self, roster_char_ids, removed_members, conn):
+        """
+        Applies the changes between the org roster from PoRK and the org_member table in bulk, with the same result
+        as calling process_update() with MODE_ADD_AUTO for each character on the roster and with MODE_REM_AUTO for
+        each org member who is no longer on it
+
+        Args:
+            roster_char_ids: set of char_ids on the roster
+            removed_members: list of org_member rows for the org which are not on the roster
+            conn: the conn for the org
+        """
+
+        current_members = {}
+        if roster_char_ids:
+            for row in self.get_all_org_members():
+                if row.char_id in roster_char_ids:
+                    current_members[row.char_id] = row
+
+        added = [char_id for char_id in roster_char_ids if char_id not in current_members]
+        updated = [char_id for char_id, row in current_members.items() if row.mode == self.MODE_ADD_MANUAL]
+        deleted = [row for row in removed_members if row.mode in [self.MODE_ADD_AUTO, self.MODE_REM_MANUAL]]
+
+        if not added and not updated and not deleted:
+            return
+
+        with self.db.transaction():
+            self.db.exec_many("INSERT INTO org_member (char_id, mode, org_id) VALUES (?, ?, ?)",
+                              [[char_id, self.MODE_ADD_AUTO, conn.org_id] for char_id in added])
+            self.db.exec_many("UPDATE org_member SET mode = ?, org_id = ? WHERE char_id = ?",
+                              [[self.MODE_ADD_AUTO, conn.org_id, char_id] for char_id in updated])
+            self.db.exec_many("DELETE FROM org_member WHERE char_id = ?", [[row.char_id] for row in deleted])
+
+        # manual members who are updated to auto are already buddies
+        self.buddy_service.add_buddies(added, self.ORG_BUDDY_TYPE)
+        self.buddy_service.remove_buddies([row.char_id for row in deleted], self.ORG_BUDDY_TYPE)
+        self.access_service.clear_access_level_cache()
+
+        self.logger.info("Org roster changes for org_id '%d': %d added, %d updated, %d removed" % (conn.org_id, len(added), len(updated), len(deleted)))
+
+        for row in deleted:
+            if row.mode == self.MODE_ADD_AUTO:
+                self.event_service.fire_event(self.ORG_MEMBER_LOGOFF_EVENT, DictObject({"char_id": row.char_id,
+                                                                                        "name": self.character_service.get_char_name(row.char_id),
+                                                                                        "conn": conn}))
+
+        self.event_service.fire_event(self.ORG_ROSTER_CHANGED_EVENT, DictObject({"org_id": conn.org_id,
+                                                                                 "conn": conn,
+                                                                                 "added": added,
+                                                                                 "updated": updated,
+                                                                                 "removed": [row.char_id for row in deleted]}))
 
     @event(PublicChannelService.ORG_MSG_EVENT, "Update org roster when characters join or leave", is_system=True)
     def org_msg_event(self, event_type, event_data):
@@ -255,14 +303,17 @@ class OrgMemberController:
 
     def add_org_member(self, char_id, mode, org_id):
         self.update_buddylist(char_id, self.MODE_ADD_MANUAL)
+        self.access_service.clear_access_level_cache(char_id)
         return self.db.exec("INSERT INTO org_member (char_id, mode, org_id) VALUES (?, ?, ?)", [char_id, mode, org_id])
 
     def remove_org_member(self, char_id):
         self.update_buddylist(char_id, self.MODE_REM_MANUAL)
+        self.access_service.clear_access_level_cache(char_id)
         return self.db.exec("DELETE FROM org_member WHERE char_id = ?", [char_id])
 
     def update_org_member(self, char_id, mode, org_id):
         self.update_buddylist(char_id, mode)
+        self.access_service.clear_access_level_cache(char_id)
         return self.db.exec("UPDATE org_member SET mode = ?, org_id = ? WHERE char_id = ?", [mode, org_id, char_id])
 
     def check_org_member(self, char_id):
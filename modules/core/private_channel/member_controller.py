@@ -134,10 +134,12 @@ class MemberController:
         self.buddy_service.add_buddy(char_id, self.MEMBER_BUDDY_TYPE)
         if not self.get_member(char_id):
             self.db.exec("INSERT INTO `member` (char_id, auto_invite) VALUES (?, ?)", [char_id, auto_invite])
+            self.access_service.clear_access_level_cache(char_id)
 
     def remove_member(self, char_id):
         self.buddy_service.remove_buddy(char_id, self.MEMBER_BUDDY_TYPE)
         self.db.exec("DELETE FROM `member` WHERE char_id = ?", [char_id])
+        self.access_service.clear_access_level_cache(char_id)
 
     def update_auto_invite(self, char_id, auto_invite):
         self.db.exec("UPDATE `member` SET auto_invite = ? WHERE char_id = ?", [auto_invite, char_id])
@@ -0,0 +1,63 @@
+import html
+
+from core.chat_blob import ChatBlob
+from core.command_param_types import Any
+from core.decorators import instance, command
+
+
+@instance()
+class MetricsController:
+    # number of series shown per metric in the overview
+    OVERVIEW_SERIES = 5
+
+    def inject(self, registry):
+        self.text = registry.get_instance("text")
+        self.metrics_service = registry.get_instance("metrics_service")
+
+    @command(command="metrics", params=[], access_level="admin",
+             description="Show runtime metrics for packets, queues, the database and handlers")
+    def metrics_cmd(self, request):
+        blob = ""
+        for metric in self.metrics_service.get_metrics():
+            samples = metric.get_samples()
+            blob += "<header2>%s</header2> [%s]\n" % (metric.name, self.text.make_tellcmd("Details", "metrics %s" % metric.name))
+            blob += "<grey>%s</grey>\n" % metric.description
+            blob += self.format_samples(metric, samples, self.OVERVIEW_SERIES)
+            if len(samples) > self.OVERVIEW_SERIES:
+                blob += "<tab>... %d more\n" % (len(samples) - self.OVERVIEW_SERIES)
+            blob += "\n"
+
+        return ChatBlob("Metrics", blob)
+
+    @command(command="metrics", params=[Any("metric")], access_level="admin",
+             description="Show all values for a metric")
+    def metrics_detail_cmd(self, request, name):
+        metric = self.metrics_service.get_metric(name)
+        if not metric:
+            return "Could not find metric <highlight>%s</highlight>." % name
+
+        samples = metric.get_samples()
+        blob = "<grey>%s</grey>\n\n" % metric.description
+        blob += self.format_samples(metric, samples)
+
+        return ChatBlob("Metric %s (%d)" % (metric.name, len(samples)), blob)
+
+    def format_samples(self, metric, samples, limit=None):
+        if not samples:
+            return "<tab>No data\n"
+
+        if metric.type == "histogram":
+            # slowest in total first, since that is where time is being spent
+            rows = sorted(samples.items(), key=lambda x: x[1].sum, reverse=True)[:limit]
+            return "".join("<tab>%s <highlight>%d</highlight> calls, avg <highlight>%.1fms</highlight>, max <highlight>%.1fms</highlight>, total <highlight>%.1fs</highlight>\n" %
+                           (self.format_labels(metric, labels), sample.count, sample.sum / sample.count * 1000, sample.max * 1000, sample.sum)
+                           for labels, sample in rows)
+        else:
+            rows = sorted(samples.items(), key=lambda x: x[1], reverse=True)[:limit]
+            return "".join("<tab>%s <highlight>%s</highlight>\n" % (self.format_labels(metric, labels), value) for labels, value in rows)
+
+    def format_labels(self, metric, labels):
+        if not labels:
+            return "Value:"
+
+        return ", ".join("%s=%s" % (name, html.escape(str(value))) for name, value in zip(metric.label_names, labels)) + ":"
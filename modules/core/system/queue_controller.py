@@ -15,8 +15,7 @@ class QueueController:
     @command(command="queue", params=[Const("clear")], access_level="moderator",
              description="Clear the outgoing message queue")
     def queue_clear_cmd(self, request, _):
-        num_messages = len(request.conn.packet_queue)
-        request.conn.packet_queue.clear()
+        num_messages = request.conn.clear_packet_queue()
         return f"Cleared <highlight>{num_messages}</highlight> messages from the outgoing message queue."
 
     @command(command="massmsg", params=[Any("command")], access_level="moderator",
@@ -4,6 +4,11 @@ from core.decorators import instance
 
 @instance("command_alias_service", override=True)
 class CommandAliasServiceWithParams(CommandAliasService):
+    def can_resolve_without_args(self, command_str):
+        # the command args are substituted into the aliased command
+        row = self.get_alias(command_str)
+        return not row or not row.enabled
+
     def get_alias_command_str(self, command_str, command_args):
         row = self.get_alias(command_str)
         if row and row.enabled:
@@ -1,5 +1,4 @@
 import re
-import time
 
 from core.aochat import server_packets, client_packets
 from core.db import DB
@@ -37,7 +36,6 @@ class RelayGcrController:
         self.db: DB = registry.get_instance("db")
         self.character_service = registry.get_instance("character_service")
         self.online_controller = registry.get_instance("online_controller")
-        self.pork_service = registry.get_instance("pork_service")
 
     def start(self):
         self.setting_service.register(self.module_name, "relaygcr_type", "private_channel", TextSettingType(["tell", "private_channel"]), "Type of relay")
@@ -147,7 +145,6 @@ class RelayGcrController:
             others = self.setting_service.get_value("relaygcr_others")
             if len(others) > 0:
                 bots = others.split(";")
-                t = int(time.time())
                 for bot in bots:
                     if bot.capitalize() == sender:
                         self.online_controller.register_online_channel(sender)
@@ -156,18 +153,18 @@ class RelayGcrController:
                         elif message[:6] == "online":
                             message = message[7:]
                             onliners = message.split(";")
-                            self.db.exec("DELETE FROM online WHERE channel = ?", [sender])
+                            self.online_controller.clear_online_channel(sender)
                             for onliner in onliners:
                                 info = onliner.split(",")
-                                self.add_to_online(sender, info[0], t)
+                                self.add_to_online(sender, info[0])
                         elif message[:5] == "buddy":
                             message = message[6:]
                             info = message.split(" ")
                             if info[0] == "0":
                                 char_id = self.character_service.resolve_char_to_id(info[1])
-                                self.db.exec("DELETE FROM online WHERE char_id = ?", [char_id])
+                                self.online_controller.remove_online_char(char_id)
                             elif info[0] == "1":
-                                self.add_to_online(sender, info[1], t)
+                                self.add_to_online(sender, info[1])
         elif message[:4] == "!gcr":
             message = message[5:]
             message = message.replace("##relay_channel##", "")
@@ -234,11 +231,7 @@ class RelayGcrController:
         blob = blob[:-1]
         self.send(blob)
 
-    def add_to_online(self, sender, name, t):
+    def add_to_online(self, sender, name):
         char_id = self.character_service.resolve_char_to_id(name)
-        self.pork_service.load_character_info(char_id, name)
-
-        sql = "SELECT 1 FROM online WHERE char_id = ? LIMIT 1"
-        check = self.db.query_single(sql, [char_id])
-        if not check:
-            self.db.exec("INSERT INTO online (char_id, afk_dt, afk_reason, channel, dt) VALUES (?, ?, ?, ?, ?)", [char_id, 0, "", sender, t])
+        if not self.online_controller.is_online(char_id):
+            self.online_controller.add_online_char(char_id, sender, name)
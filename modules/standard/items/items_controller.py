@@ -19,6 +19,7 @@ class ItemsController:
 
     def pre_start(self):
         self.db.load_sql_file(self.module_dir + "/sql/" + "aodb.sql")
+        self.db.create_search_index("aodb", "name")
 
     def start(self):
         self.command_alias_service.add_alias("item", "items")
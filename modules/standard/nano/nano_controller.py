@@ -15,6 +15,7 @@ class NanoController:
         self.db.load_sql_file(self.module_dir + "/" + "nanos.sql")
         self.db.load_sql_file(self.module_dir + "/" + "nanolines.sql")
         self.db.load_sql_file(self.module_dir + "/" + "nanos_nanolines_ref.sql")
+        self.db.create_search_index("nanos", "name")
 
     def start(self):
         self.command_alias_service.add_alias("nl", "nanolines")
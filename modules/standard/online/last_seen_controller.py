@@ -16,6 +16,7 @@ class LastSeenController:
         self.db = registry.get_instance("db")
         self.util = registry.get_instance("util")
         self.buddy_service = registry.get_instance("buddy_service")
+        self.write_behind_service = registry.get_instance("write_behind_service")
 
     def start(self):
         self.db.exec("CREATE TABLE IF NOT EXISTS last_seen (char_id INT NOT NULL PRIMARY KEY, "
@@ -65,8 +66,9 @@ class LastSeenController:
 
     def update_last_seen(self, char_id):
         t = int(time.time())
-        if self.db.exec("UPDATE last_seen SET dt = ? WHERE char_id = ?", [t, char_id]) == 0:
-            self.db.exec("INSERT IGNORE INTO last_seen (char_id, dt) VALUES (?, ?)", [char_id, t])
+        # the insert is queued first so the row exists by the time the update runs
+        self.write_behind_service.add("INSERT IGNORE INTO last_seen (char_id, dt) VALUES (?, ?)", [char_id, t])
+        self.write_behind_service.add("UPDATE last_seen SET dt = ? WHERE char_id = ?", [t, char_id])
 
     def get_last_seen(self, char_id):
         return self.db.query_single("SELECT dt FROM last_seen WHERE char_id = ?", [char_id])
@@ -4,8 +4,11 @@ from core.db import DB
 from core.decorators import instance, command, event
 from core.alts_service import AltsService
 from core.chat_blob import ChatBlob
+from core.dict_object import DictObject
+from core.lookup.pork_service import PorkService
 from core.private_channel_service import PrivateChannelService
 from core.public_channel_service import PublicChannelService
+import bisect
 import time
 import re
 
@@ -20,6 +23,13 @@ class OnlineController:
     def __init__(self):
         self.afk_regex = re.compile("^(afk|brb) ?(.*)$", re.IGNORECASE)
         self.channels = [(self.ORG_CHANNEL, 0), (self.PRIVATE_CHANNEL, 1)]
+        # (char_id, channel) -> online entry, mirrors the online table
+        self.roster = {}
+        # char_id -> afk status, for online characters who are afk
+        # the afk columns of the online table are only a snapshot, which is written behind
+        self.afk_status = {}
+        # channel -> rows for the online list, sorted by main and name, which are updated as characters join and leave
+        self.online_rows = {}
 
     def inject(self, registry):
         self.bot = registry.get_instance("bot")
@@ -31,6 +41,7 @@ class OnlineController:
         self.command_alias_service = registry.get_instance("command_alias_service")
         self.alts_service = registry.get_instance("alts_service")
         self.alts_controller = registry.get_instance("alts_controller")
+        self.write_behind_service = registry.get_instance("write_behind_service")
 
     def start(self):
         self.db.exec("DROP TABLE IF EXISTS online")
@@ -119,11 +130,9 @@ class OnlineController:
 
         return ChatBlob("Count (%d)" % len(data), blob)
 
-    def get_online_characters(self, channel):
+    def get_online_characters(self, channel, char_id=None):
         sql = "SELECT " \
                 "p1.*, " \
-                "o.afk_dt, " \
-                "o.afk_reason, " \
                 "COALESCE(p2.name, p1.name, o.char_id) AS main, " \
                 "COALESCE(p1.name, o.char_id) AS name " \
               "FROM online o " \
@@ -131,32 +140,153 @@ class OnlineController:
               "LEFT JOIN player p1 ON o.char_id = p1.char_id " \
               "LEFT JOIN alts a2 ON a1.group_id = a2.group_id AND a2.status = ? " \
               "LEFT JOIN player p2 ON a2.char_id = p2.char_id " \
-              "WHERE channel = ? " \
-              "ORDER BY COALESCE(p2.name, p1.name, o.char_id) ASC, COALESCE(p1.name, o.char_id) ASC"
+              "WHERE channel = ? "
 
-        return self.db.query(sql, [AltsService.MAIN, channel])
+        params = [AltsService.MAIN, channel]
+        if char_id:
+            sql += "AND o.char_id = ? "
+            params.append(char_id)
+
+        sql += "ORDER BY COALESCE(p2.name, p1.name, o.char_id) ASC, COALESCE(p1.name, o.char_id) ASC"
+
+        return self.db.query(sql, params)
+
+    def add_online_char(self, char_id, channel, char_name=None):
+        """
+        Adds a character to the online list of a channel, if they are not already on it
+
+        Args:
+            char_id: int
+            channel: str
+            char_name: optional str, used to look up the character if they are not known by id
+        """
+
+        key = (char_id, channel)
+        if key in self.roster:
+            return
+
+        self.roster[key] = DictObject({"char_id": char_id, "channel": channel, "dt": int(time.time())})
+        self.db.exec("INSERT INTO online (char_id, afk_dt, afk_reason, channel, dt) VALUES (?, ?, ?, ?, ?)",
+                     [char_id, 0, "", channel, self.roster[key].dt])
+        self.update_online_row(char_id, channel)
+
+        # the row is updated again by character_info_updated_event() once updated character info has been saved
+        self.pork_service.load_character_info(char_id, char_name)
+
+    def remove_online_char(self, char_id, channel=None):
+        """
+        Removes a character from the online list of a channel, or from all channels if `channel` is None
+
+        Args:
+            char_id: int
+            channel: optional str
+        """
+
+        for key in [key for key in self.roster if key[0] == char_id and (channel is None or key[1] == channel)]:
+            del self.roster[key]
+            self.remove_online_row(char_id, key[1])
+
+        if char_id in self.afk_status and not self.is_online(char_id):
+            del self.afk_status[char_id]
+
+        if channel is None:
+            self.db.exec("DELETE FROM online WHERE char_id = ?", [char_id])
+        else:
+            self.db.exec("DELETE FROM online WHERE char_id = ? AND channel = ?", [char_id, channel])
+
+    def clear_online_channel(self, channel):
+        """Removes all characters from the online list of a channel"""
+
+        for key in [key for key in self.roster if key[1] == channel]:
+            del self.roster[key]
+            if key[0] in self.afk_status and not self.is_online(key[0]):
+                del self.afk_status[key[0]]
+
+        self.online_rows.pop(channel, None)
+        self.db.exec("DELETE FROM online WHERE channel = ?", [channel])
+
+    def is_online(self, char_id, channel=None):
+        if channel is not None:
+            return (char_id, channel) in self.roster
+
+        return any(key[0] == char_id for key in self.roster)
+
+    def get_online_rows(self, channel, show_org_info):
+        rows = self.online_rows.get(channel)
+        if rows is None or rows.show_org_info != show_org_info:
+            rows = DictObject({"show_org_info": show_org_info, "sort_keys": [], "rows": []})
+            for row in self.get_online_characters(channel):
+                self.add_online_row(rows, row)
+            self.online_rows[channel] = rows
+
+        return rows.rows
+
+    def update_online_row(self, char_id, channel):
+        # only channels which have been rendered are kept up to date, others are loaded when they are next shown
+        rows = self.online_rows.get(channel)
+        if rows is None:
+            return
+
+        self.remove_online_row(char_id, channel)
+        for row in self.get_online_characters(channel, char_id):
+            self.add_online_row(rows, row)
+
+    def add_online_row(self, rows, row):
+        org_info = ""
+        if rows.show_org_info and row.org_name:
+            org_info = ", %s (%s)" % (row.org_name, row.org_rank_name)
+
+        online_row = DictObject({"char_id": row.char_id or int(row.name),
+                                 "main": row.main,
+                                 "main_header": "\n<pagebreak>%s\n" % self.text.make_tellcmd(row.main, "alts %s" % row.main),
+                                 "line": "  %s (%d/<green>%d</green>) %s%s" % (row.name, row.level or 0, row.ai_level or 0, row.profession, org_info)})
+
+        # same order as the query
+        key = (str(row.main), str(row.name), online_row.char_id)
+        index = bisect.bisect(rows.sort_keys, key)
+        rows.sort_keys.insert(index, key)
+        rows.rows.insert(index, online_row)
+
+    def remove_online_row(self, char_id, channel):
+        rows = self.online_rows.get(channel)
+        if rows is None:
+            return
+
+        for index in reversed([i for i, row in enumerate(rows.rows) if row.char_id == char_id]):
+            del rows.sort_keys[index]
+            del rows.rows[index]
+
+    @event(AltsService.MAIN_CHANGED_EVENT_TYPE, "Update online lists when a main changes", is_system=True)
+    def main_changed_event(self, event_type, event_data):
+        # characters are grouped by main, so every channel could be affected
+        self.online_rows = {}
+
+    @event(AltsService.ALT_REMOVED_EVENT_TYPE, "Update online lists when an alt is removed", is_system=True)
+    def alt_removed_event(self, event_type, event_data):
+        self.online_rows = {}
+
+    @event(PorkService.CHARACTER_INFO_UPDATED_EVENT, "Update online lists when character info is updated", is_system=True)
+    def character_info_updated_event(self, event_type, event_data):
+        for channel in list(self.online_rows.keys()):
+            for char_id in event_data.char_ids:
+                if (char_id, channel) in self.roster:
+                    self.update_online_row(char_id, channel)
 
     @event(PrivateChannelService.JOINED_PRIVATE_CHANNEL_EVENT, "Record in database when someone joins private channel", is_system=True)
     def private_channel_joined_event(self, event_type, event_data):
-        self.pork_service.load_character_info(event_data.char_id)
-        self.db.exec("INSERT INTO online (char_id, afk_dt, afk_reason, channel, dt) VALUES (?, ?, ?, ?, ?)",
-                     [event_data.char_id, 0, "", self.PRIVATE_CHANNEL, int(time.time())])
+        self.add_online_char(event_data.char_id, self.PRIVATE_CHANNEL)
 
     @event(PrivateChannelService.LEFT_PRIVATE_CHANNEL_EVENT, "Record in database when someone leaves private channel", is_system=True)
     def private_channel_left_event(self, event_type, event_data):
-        self.db.exec("DELETE FROM online WHERE char_id = ? AND channel = ?",
-                     [event_data.char_id, self.PRIVATE_CHANNEL])
+        self.remove_online_char(event_data.char_id, self.PRIVATE_CHANNEL)
 
     @event(OrgMemberController.ORG_MEMBER_LOGON_EVENT, "Record in database when org member logs on", is_system=True)
     def org_member_logon_record_event(self, event_type, event_data):
-        self.pork_service.load_character_info(event_data.char_id)
-        self.db.exec("INSERT INTO online (char_id, afk_dt, afk_reason, channel, dt) VALUES (?, ?, ?, ?, ?)",
-                     [event_data.char_id, 0, "", self.ORG_CHANNEL, int(time.time())])
+        self.add_online_char(event_data.char_id, self.ORG_CHANNEL)
 
     @event(OrgMemberController.ORG_MEMBER_LOGOFF_EVENT, "Record in database when org member logs off", is_system=True)
     def org_member_logoff_record_event(self, event_type, event_data):
-        self.db.exec("DELETE FROM online WHERE char_id = ? AND channel = ?",
-                     [event_data.char_id, self.ORG_CHANNEL])
+        self.remove_online_char(event_data.char_id, self.ORG_CHANNEL)
 
     @event(PrivateChannelService.PRIVATE_CHANNEL_MESSAGE_EVENT, "Check for afk messages in private channel")
     def afk_check_private_channel_event(self, event_type, event_data):
@@ -184,24 +314,33 @@ class OnlineController:
             self.set_afk(char_id, int(time.time()), message)
             # channel_reply("<highlight>%s</highlight> is now afk." % char_name)
         else:
-            # will handle multiple rows since set_afk() will update multiple
-            row = self.db.query_single("SELECT * FROM online WHERE char_id = ? AND afk_dt > 0", [char_id])
-            if row:
+            afk_status = self.afk_status.get(char_id)
+            if afk_status:
                 self.set_afk(char_id, 0, "")
                 char_name = self.character_service.resolve_char_to_name(char_id)
-                time_string = self.util.time_to_readable(int(time.time()) - row.afk_dt)
+                time_string = self.util.time_to_readable(int(time.time()) - afk_status.afk_dt)
                 channel_reply("<highlight>%s</highlight> is back after %s." % (char_name, time_string))
 
     def set_afk(self, char_id, dt, reason):
-        self.db.exec("UPDATE online SET afk_dt = ?, afk_reason = ? WHERE char_id = ?", [dt, reason, char_id])
+        if dt > 0:
+            # like the online table, only characters who are online can be afk
+            if not self.is_online(char_id):
+                return
+
+            self.afk_status[char_id] = DictObject({"afk_dt": dt, "afk_reason": reason})
+        else:
+            self.afk_status.pop(char_id, None)
+
+        self.write_behind_service.add("UPDATE online SET afk_dt = ?, afk_reason = ? WHERE char_id = ?", [dt, reason, char_id])
 
     def get_online_output(self):
         num_org_bots = len(self.bot.get_conns(lambda x: x.is_main and x.org_id))
 
         blob = ""
         count = 0
+        t = int(time.time())
         for channel, _ in self.channels:
-            online_list = self.get_online_characters(channel)
+            online_list = self.get_online_rows(channel, channel == self.PRIVATE_CHANNEL or num_org_bots > 1)
             if len(online_list) == 0:
                 continue
 
@@ -211,25 +350,23 @@ class OnlineController:
             for row in online_list:
                 if current_main != row.main:
                     count += 1
-                    blob += "\n<pagebreak>%s\n" % self.text.make_tellcmd(row.main, "alts %s" % row.main)
+                    blob += row.main_header
                     current_main = row.main
 
+                # afk status changes too often to be part of the cached rows
                 afk = ""
-                if row.afk_dt > 0:
-                    afk = " - <highlight>%s (%s ago)</highlight>" % (row.afk_reason, self.util.time_to_readable(int(time.time()) - row.afk_dt))
-
-                org_info = ""
-                if channel == self.PRIVATE_CHANNEL or num_org_bots > 1:
-                    if row.org_name:
-                        org_info = ", %s (%s)" % (row.org_name, row.org_rank_name)
+                afk_status = self.afk_status.get(row.char_id)
+                if afk_status:
+                    afk = " - <highlight>%s (%s ago)</highlight>" % (afk_status.afk_reason, self.util.time_to_readable(t - afk_status.afk_dt))
 
-                blob += "  %s (%d/<green>%d</green>) %s%s%s\n" % (row.name, row.level or 0, row.ai_level or 0, row.profession, org_info, afk)
+                blob += row.line + afk + "\n"
             blob += "\n\n"
 
         return ChatBlob("Online (%d)" % count, blob)
 
     def get_char_info_display(self, char_id, conn: Conn):
-        char_info = self.pork_service.get_character_info(char_id)
+        # don't wait on PoRK here, cached info (even if it is outdated) is good enough for display purposes
+        char_info = self.pork_service.get_character_info_async(char_id)
         if char_info:
             name = self.text.format_char_info(char_info)
         else:
@@ -284,7 +421,7 @@ class OnlineController:
         self.channels.sort(key=self.sort_channels)
 
     def deregister_online_channel(self, channel):
-        self.db.query("DELETE FROM online WHERE channel = ?", [channel])
+        self.clear_online_channel(channel)
         for i, obj in enumerate(self.channels):
             if obj[0] == channel:
                 del self.channels[i]
@@ -51,6 +51,8 @@ class RecipeController:
             else:
                 raise Exception("Unknown recipe format for '%s'" % file)
 
+        self.db.create_search_index("recipe", "recipe", key_column="id")
+
     @command(command="recipe", params=[Int("recipe_id")], access_level="all", description="Show a recipe")
     def recipe_show_cmd(self, request, recipe_id):
         recipe = self.get_recipe(recipe_id)
@@ -2,7 +2,6 @@ import hashlib
 import json
 import threading
 import base64
-import time
 
 from core.decorators import instance, timerevent, event
 from core.logger import Logger
@@ -34,7 +33,6 @@ class WebsocketRelayController:
         self.setting_service = registry.get_instance("setting_service")
         self.event_service = registry.get_instance("event_service")
         self.character_service = registry.get_instance("character_service")
-        self.pork_service = registry.get_instance("pork_service")
         self.online_controller = registry.get_instance("online_controller")
         self.public_channel_service = registry.get_instance("public_channel_service")
         self.message_hub_service = registry.get_instance("message_hub_service")
@@ -97,19 +95,19 @@ class WebsocketRelayController:
                 for channel in channels:
                     self.online_controller.deregister_online_channel(channel)
 
-    @event(PrivateChannelService.JOINED_PRIVATE_CHANNEL_EVENT, "Send to websocket relay when someone joins private channel", is_system=True, is_enabled=False)
+    @event(PrivateChannelService.JOINED_PRIVATE_CHANNEL_EVENT, "Send to websocket relay when someone joins private channel", is_system=True, is_enabled=False, async_ok=True)
     def private_channel_joined_event(self, event_type, event_data):
         self.send_relay_event(event_data.char_id, "logon", "private_channel")
 
-    @event(PrivateChannelService.LEFT_PRIVATE_CHANNEL_EVENT, "Send to websocket relay when someone joins private channel", is_system=True, is_enabled=False)
+    @event(PrivateChannelService.LEFT_PRIVATE_CHANNEL_EVENT, "Send to websocket relay when someone joins private channel", is_system=True, is_enabled=False, async_ok=True)
     def private_channel_left_event(self, event_type, event_data):
         self.send_relay_event(event_data.char_id, "logoff", "private_channel")
 
-    @event(OrgMemberController.ORG_MEMBER_LOGON_EVENT, "Send to websocket relay when org member logs on", is_system=True, is_enabled=False)
+    @event(OrgMemberController.ORG_MEMBER_LOGON_EVENT, "Send to websocket relay when org member logs on", is_system=True, is_enabled=False, async_ok=True)
     def org_member_logon_event(self, event_type, event_data):
         self.send_relay_event(event_data.char_id, "logon", "org_channel")
 
-    @event(OrgMemberController.ORG_MEMBER_LOGOFF_EVENT, "Send to websocket relay when org member logs off", is_system=True, is_enabled=False)
+    @event(OrgMemberController.ORG_MEMBER_LOGOFF_EVENT, "Send to websocket relay when org member logs off", is_system=True, is_enabled=False, async_ok=True)
     def org_member_logoff_event(self, event_type, event_data):
         self.send_relay_event(event_data.char_id, "logoff", "org_channel")
 
@@ -146,7 +144,7 @@ class WebsocketRelayController:
                     continue
 
                 channel = self.get_channel_name(online_obj.source)
-                self.db.exec("DELETE FROM online WHERE channel = ?", [channel])
+                self.online_controller.clear_online_channel(channel)
                 for user in online_obj.users:
                     self.add_online_char(user.id, user.name, online_obj.source, client_id)
         elif obj_type == "online_list_request":
@@ -195,7 +193,6 @@ class WebsocketRelayController:
         if not char_id or (source.server and source.server != self.bot.dimension):
             return
 
-        self.pork_service.load_character_info(char_id, name)
         channel = self.get_channel_name(source)
         if client_id not in self.channels:
             self.channels[client_id] = []
@@ -203,12 +200,10 @@ class WebsocketRelayController:
             self.online_controller.register_online_channel(channel)
             self.channels[client_id].append(channel)
 
-        self.db.exec("INSERT INTO online (char_id, afk_dt, afk_reason, channel, dt) VALUES (?, ?, ?, ?, ?)",
-                     [char_id, 0, "", channel, int(time.time())])
+        self.online_controller.add_online_char(char_id, channel, name)
 
     def rem_online_char(self, char_id, source):
-        channel = self.get_channel_name(source)
-        self.db.exec("DELETE FROM online WHERE char_id = ? AND channel = ?", [char_id, channel])
+        self.online_controller.remove_online_char(char_id, self.get_channel_name(source))
 
     def send_relay_message(self, message):
         if self.highway_websocket_controller.worker:
@@ -250,11 +250,19 @@ class TowerMessagesController:
         obj.location.playfield = self.playfield_controller.get_playfield_by_name(playfield_name) or DictObject()
         obj.location.playfield.long_name = playfield_name
 
-        # lookup attacker
+        # lookup attacker, using cached info if there is any so that PoRK requests don't hold up the bot
+        def on_char_info(char_info):
+            if not cached_char_info:
+                self.process_attack_event(obj, char_info)
+
+        cached_char_info = self.pork_service.get_character_info_async(obj.attacker.name, on_char_info)
+        if cached_char_info:
+            self.process_attack_event(obj, cached_char_info)
+
+    def process_attack_event(self, obj, char_info):
         name = obj.attacker.name
         faction = obj.attacker.faction
         org_name = obj.attacker.org_name
-        char_info = self.pork_service.get_character_info(name)
         obj.attacker = char_info or DictObject()
         obj.attacker.name = name
         obj.attacker.faction = faction or obj.attacker.get("faction", "Unknown")
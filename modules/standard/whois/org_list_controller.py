@@ -11,6 +11,14 @@ from core.dict_object import DictObject
 class OrgListController:
     ORGLIST_BUDDY_TYPE = "orglist"
 
+    # members are checked in batches of at most this many, limited by the free buddy slots over all conns
+    ORGLIST_BATCH_SIZE = 200
+    # seconds to wait for the statuses of a batch once its buddy packets have been sent
+    ORGLIST_BATCH_TIMEOUT = 10
+    # seconds to wait before checking for free buddy slots again
+    ORGLIST_RETRY_INTERVAL = 1
+    ORGLIST_MAX_DURATION = 60 * 10
+
     DEFAULT_OFFLINE_MEMBER_DISPLAY_THRESHOLD = 200
     SHOW_ALL_OFFLINE_MEMBERS = 10000
 
@@ -35,6 +43,7 @@ class OrgListController:
         self.pork_service = registry.get_instance("pork_service")
         self.buddy_service: BuddyService = registry.get_instance("buddy_service")
         self.character_service = registry.get_instance("character_service")
+        self.job_scheduler = registry.get_instance("job_scheduler")
 
     @command(command="orglist", params=[Int("org_id"), NamedFlagParameters(["show_all_offline"])], access_level="all",
              description="Show online status of characters in an org")
@@ -75,64 +84,143 @@ class OrgListController:
     def start_orglist_lookup(self, reply, org_id, offline_member_display_threshold):
         if self.orglist:
             elapsed = int(time.time()) - self.orglist.get("started_at")
-            if elapsed > 60 * 10:
+            if elapsed > self.ORGLIST_MAX_DURATION:
                 reply("Automatically ending orglist which has been running for %s (%d remaining, %d waiting, %d finished)." %
                       (self.util.time_to_readable(elapsed), len(self.orglist.org_members), len(self.orglist.waiting_org_members),
                        len(self.orglist.finished_org_members)))
-                self.orglist = None
-                self.buddy_service.remove_all_buddies_by_type(self.ORGLIST_BUDDY_TYPE)
+                self.end_orglist()
             else:
                 reply("There is an orglist already in progress. Elapsed time: " + self.util.time_to_readable(elapsed))
                 return
 
         reply("Downloading org roster for org id %d..." % org_id)
 
-        self.orglist = self.org_pork_service.get_org_info(org_id)
+        orglist = self.org_pork_service.get_org_info(org_id)
 
-        if not self.orglist:
+        if not orglist:
             reply("Could not find org with ID <highlight>%d</highlight>." % org_id)
             return
 
-        self.orglist.started_at = int(time.time())
-        self.orglist.org_members = list(self.orglist.org_members.values())
-        self.orglist.reply = reply
-        self.orglist.waiting_org_members = {}
-        self.orglist.finished_org_members = {}
-        self.orglist.offline_member_display_threshold = offline_member_display_threshold
-
-        reply("Checking online status for %d members of <highlight>%s</highlight>..." % (len(self.orglist.org_members), self.orglist.org_info.name))
+        orglist.started_at = int(time.time())
+        orglist.org_members = list(orglist.org_members.values())
+        orglist.num_org_members = len(orglist.org_members)
+        orglist.reply = reply
+        orglist.waiting_org_members = {}
+        orglist.finished_org_members = {}
+        orglist.offline_member_display_threshold = offline_member_display_threshold
+        orglist.batch_char_ids = []
+        orglist.job_id = None
+        self.orglist = orglist
 
-        # process all name lookups
-        while self.bot.iterate(1):
-            pass
+        reply("Checking online status for %d members of <highlight>%s</highlight>..." % (orglist.num_org_members, orglist.org_info.name))
 
-        self.check_for_orglist_end()
+        # online statuses are collected by the buddy events, so the command returns straight away
+        self.check_next_batch()
 
     @event(event_type=BuddyService.BUDDY_LOGON_EVENT, description="Detect online buddies for orglist command", is_system=True)
     def buddy_logon_event(self, event_type, event_data):
         if self.orglist and event_data.char_id in self.orglist.waiting_org_members:
             self.update_online_status(event_data.char_id, True)
-            self.check_for_orglist_end()
+            self.check_for_batch_end()
 
     @event(event_type=BuddyService.BUDDY_LOGOFF_EVENT, description="Detect offline buddies for orglist command", is_system=True)
     def buddy_logoff_event(self, event_type, event_data):
         if self.orglist and event_data.char_id in self.orglist.waiting_org_members:
             self.update_online_status(event_data.char_id, False)
-            self.check_for_orglist_end()
+            self.check_for_batch_end()
 
     def update_online_status(self, char_id, status):
         self.orglist.finished_org_members[char_id] = self.orglist.waiting_org_members[char_id]
         self.orglist.finished_org_members[char_id].online = status
         del self.orglist.waiting_org_members[char_id]
 
-    def check_for_orglist_end(self):
-        if self.orglist.org_members:
-            self.iterate_org_members()
+    def check_next_batch(self, t=None):
+        self.orglist.job_id = None
+        if self.check_for_orglist_timeout():
+            return
+
+        # add org_members that we don't have online status for as buddies, on whichever conns have free slots
+        char_ids = []
+        num_slots = min(self.ORGLIST_BATCH_SIZE, self.buddy_service.get_free_buddy_slots())
+        while self.orglist.org_members and len(char_ids) < num_slots:
+            org_member = self.orglist.org_members.pop()
+            char_id = org_member.char_id
+            self.orglist.waiting_org_members[char_id] = org_member
+            is_online = self.buddy_service.is_online(char_id)
+            if is_online is not None:
+                self.update_online_status(char_id, is_online)
+            elif org_member.name in self.character_service.name_to_id and not self.character_service.name_to_id[org_member.name]:
+                # character is inactive, set as offline
+                self.update_online_status(char_id, 2)
+            else:
+                char_ids.append(char_id)
+
+        self.orglist.batch_char_ids = char_ids
+        if char_ids:
+            self.buddy_service.add_buddies(char_ids, self.ORGLIST_BUDDY_TYPE)
+            # allow for the time it takes for the queued buddy packets to be sent
+            delay = self.ORGLIST_BATCH_TIMEOUT + self.buddy_service.get_pending_packets_delay()
+            self.orglist.job_id = self.job_scheduler.delayed_job(self.batch_timeout, delay)
+        elif self.orglist.org_members:
+            # no free buddy slots, try again once buddies from the previous batch have been removed
+            self.orglist.job_id = self.job_scheduler.delayed_job(self.check_next_batch, self.ORGLIST_RETRY_INTERVAL)
+        else:
+            self.check_for_batch_end()
+
+    def batch_timeout(self, t):
+        self.orglist.job_id = None
+
+        # characters that have not responded by now are most likely inactive
+        for char_id in list(self.orglist.waiting_org_members.keys()):
+            self.update_online_status(char_id, 2)
+
+        if self.check_for_orglist_timeout():
+            return
+
+        self.check_for_batch_end()
+
+    def check_for_orglist_timeout(self):
+        # otherwise the scan could wait for free buddy slots forever
+        elapsed = int(time.time()) - self.orglist.started_at
+        if elapsed <= self.ORGLIST_MAX_DURATION:
+            return False
+
+        self.orglist.reply("Automatically ending orglist which has been running for %s (%d remaining, %d waiting, %d finished)." %
+                           (self.util.time_to_readable(elapsed), len(self.orglist.org_members), len(self.orglist.waiting_org_members),
+                            len(self.orglist.finished_org_members)))
+        self.orglist.reply(self.format_result())
+        self.end_orglist()
+        return True
 
-        if not self.orglist.waiting_org_members:
+    def check_for_batch_end(self):
+        if self.orglist.waiting_org_members:
+            return
+
+        if self.orglist.job_id:
+            self.job_scheduler.cancel_job(self.orglist.job_id)
+            self.orglist.job_id = None
+
+        # the orglist buddies are no longer needed, freeing up slots for the next batch
+        self.buddy_service.remove_buddies(self.orglist.batch_char_ids, self.ORGLIST_BUDDY_TYPE)
+        self.orglist.batch_char_ids = []
+
+        if self.orglist.org_members:
+            num_online = len([org_member for org_member in self.orglist.finished_org_members.values() if org_member.online == 1])
+            self.orglist.reply("Checked %d / %d members of <highlight>%s</highlight>, %d online so far..." %
+                               (len(self.orglist.finished_org_members), self.orglist.num_org_members, self.orglist.org_info.name, num_online))
+            self.check_next_batch()
+        else:
             self.orglist.reply(self.format_result())
             self.orglist = None
 
+    def end_orglist(self):
+        if self.orglist.job_id:
+            self.job_scheduler.cancel_job(self.orglist.job_id)
+
+        # queued behind any buddy packets for the batch which have not been sent yet
+        self.buddy_service.remove_buddies(self.orglist.batch_char_ids, self.ORGLIST_BUDDY_TYPE)
+        self.orglist = None
+
     def format_result(self):
         org_ranks = {}
         for rank_name in self.governing_types[self.orglist.org_info.governing_type]:
@@ -186,23 +274,3 @@ class OrgListController:
             blob += "\n"
 
         return ChatBlob("Orglist for '%s' (%d / %d)" % (self.orglist.org_info.name, num_online, num_total), blob)
-
-    def iterate_org_members(self):
-        # add org_members that we don't have online status for as buddies
-        while self.orglist.org_members and self.buddy_list_has_available_slots():
-            org_member = self.orglist.org_members.pop()
-            char_id = org_member.char_id
-            self.orglist.waiting_org_members[char_id] = org_member
-            is_online = self.buddy_service.is_online(char_id)
-            if is_online is None:
-                if self.character_service.resolve_char_to_id(org_member.name):
-                    self.buddy_service.add_buddy(char_id, self.ORGLIST_BUDDY_TYPE)
-                    self.buddy_service.remove_buddy(char_id, self.ORGLIST_BUDDY_TYPE)
-                else:
-                    # character is inactive, set as offline
-                    self.update_online_status(char_id, 2)
-            else:
-                self.update_online_status(char_id, is_online)
-
-    def buddy_list_has_available_slots(self):
-        return self.buddy_service.buddy_list_size - self.buddy_service.get_buddy_list_size() > 0
@@ -0,0 +1,48 @@
+import unittest
+
+from core.access_service import AccessService
+from core.dict_object import DictObject
+
+
+class FakeAltsService:
+    def __init__(self, alts):
+        self.alts = alts
+        self.calls = 0
+
+    def get_alts(self, char_id):
+        self.calls += 1
+        return self.alts.get(char_id, [])
+
+
+class AccessServiceTest(unittest.TestCase):
+    def test_get_access_level_uses_main_and_cache(self):
+        admins = {1}
+        main = DictObject({"char_id": 1})
+        alt = DictObject({"char_id": 2})
+
+        access_service = AccessService()
+        access_service.alts_service = FakeAltsService({1: [main, alt], 2: [main, alt]})
+        access_service.register_access_level("admin", 20, lambda char_id: char_id in admins)
+
+        self.assertEqual("admin", access_service.get_access_level(2)["label"])
+        self.assertEqual("admin", access_service.get_access_level(2)["label"])
+        self.assertEqual(1, access_service.alts_service.calls)
+        self.assertEqual(1, access_service.get_cache_stats().hits)
+
+        # clearing the main also clears alts that inherit its access level
+        admins.remove(1)
+        access_service.get_access_level(1)
+        access_service.clear_access_level_cache(1)
+        self.assertEqual(0, access_service.get_cache_stats().size)
+        self.assertEqual("all", access_service.get_access_level(2)["label"])
+
+    def test_has_sufficient_access_level(self):
+        admins = {1}
+
+        access_service = AccessService()
+        access_service.alts_service = FakeAltsService({})
+        access_service.register_access_level("admin", 20, lambda char_id: char_id in admins)
+
+        self.assertTrue(access_service.has_sufficient_access_level(1, 2))
+        self.assertFalse(access_service.has_sufficient_access_level(2, 1))
+        self.assertTrue(access_service.has_sufficient_access_level(2, 2))
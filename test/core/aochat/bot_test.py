@@ -0,0 +1,48 @@
+import socket
+import unittest
+
+from core.aochat import server_packets
+from core.aochat.bot import Bot
+from core.aochat.packets import encode_args
+
+
+class BotTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = Bot()
+        self.bot.socket, self.server_socket = socket.socketpair()
+
+    def tearDown(self):
+        self.bot.socket.close()
+        self.server_socket.close()
+
+    def packet_bytes(self, packet_id, types, args):
+        data = encode_args(types, args)
+        return Bot.PACKET_HEADER.pack(packet_id, len(data)) + data
+
+    def test_read_multiple_packets_from_one_receive(self):
+        data = b"".join(self.packet_bytes(server_packets.BuddyAdded.id, "IIS", [i, 1, "\1"]) for i in range(3))
+        self.server_socket.sendall(data)
+
+        self.assertEqual(0, self.bot.read_packet(1).char_id)
+        self.assertEqual(len(data), self.bot.receive_end)
+        self.assertEqual(1, self.bot.read_packet(0).char_id)
+        self.assertEqual(2, self.bot.read_packet(0).char_id)
+        self.assertEqual(0, self.bot.receive_end)
+        self.assertIsNone(self.bot.read_packet(0))
+
+    def test_read_partial_packet(self):
+        data = self.packet_bytes(server_packets.PrivateMessage.id, "ISS", [5, "x" * 60000, "\0"])
+        self.server_socket.sendall(data[:10])
+        self.assertIsNone(self.bot.read_packet(0.1))
+
+        self.server_socket.sendall(data[10:])
+        packet = self.bot.read_packet(1)
+        self.assertEqual(5, packet.char_id)
+        self.assertEqual("x" * 60000, packet.message)
+
+    def test_send_packets(self):
+        packets = [server_packets.BuddyRemoved(1), server_packets.BuddyRemoved(2)]
+        self.bot.send_packets(packets)
+
+        expected = b"".join(self.packet_bytes(server_packets.BuddyRemoved.id, "I", [i]) for i in [1, 2])
+        self.assertEqual(expected, self.server_socket.recv(1024))
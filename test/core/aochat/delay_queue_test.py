@@ -39,3 +39,47 @@ class DelayQueueTest(unittest.TestCase):
         self.assertEqual("C", delay_queue.dequeue())
         self.assertEqual("A", delay_queue.dequeue())
         self.assertEqual("B", delay_queue.dequeue())
+
+    def test_rate_limit(self):
+        # burst allowance is used up first, then items are released once per recovery period
+        delay_queue = DelayQueue(2, 2.5)
+
+        for item in ["A", "B", "C", "D"]:
+            delay_queue.enqueue(item)
+
+        self.assertEqual("A", delay_queue.dequeue())
+        self.assertEqual("B", delay_queue.dequeue())
+        self.assertEqual("C", delay_queue.dequeue())
+        self.assertIsNone(delay_queue.dequeue())
+        self.assertTrue(0 < delay_queue.get_delay() <= 2)
+        self.assertEqual(1, len(delay_queue))
+
+    def test_coalesce_and_remove(self):
+        delay_queue = DelayQueue(1, 100, lambda prev, item: prev + item if prev[0] == item[0] else None)
+
+        delay_queue.enqueue("a1")
+        delay_queue.enqueue("a2")
+        delay_queue.enqueue("b1")
+        delay_queue.enqueue("a3", 1)
+        delay_queue.enqueue("b2")
+
+        self.assertEqual(["a3", "a1a2", "b1b2"], list(delay_queue))
+        self.assertEqual(["a3", "a1a2"], delay_queue.remove(lambda x: x.startswith("a")))
+        self.assertEqual(1, len(delay_queue))
+        self.assertEqual("b1b2", delay_queue.dequeue())
+        self.assertIsNone(delay_queue.get_delay())
+
+    def test_drop(self):
+        # the oldest items with the lowest priority are dropped first
+        delay_queue = DelayQueue(1, 100)
+
+        delay_queue.enqueue("A", 1)
+        delay_queue.enqueue("B")
+        delay_queue.enqueue("C")
+        delay_queue.enqueue("D", 1)
+        delay_queue.enqueue("E")
+
+        self.assertEqual(4, delay_queue.drop(4))
+        self.assertEqual(["D"], list(delay_queue))
+        self.assertEqual(1, delay_queue.drop(5))
+        self.assertTrue(delay_queue.is_empty())
@@ -36,6 +36,14 @@ class MMDBParserTest(unittest.TestCase):
         params = mmdb_parser.parse_params(b'R!!!8S!!!!#s\x09TestOrg1s\x09TestCharR!!!8S!!!!"s\x09TestOrg2s\x05Testi!!!Dui!!!Eu')
         self.assertEqual(['omni', 'TestOrg1', 'TestChar', 'clan', 'TestOrg2', 'Test', 3059, 3144], params)
 
+    def test_get_message_string(self):
+        mmdb_parser = MMDBParser("./text.mdb")
+
+        self.assertEqual("omni", mmdb_parser.get_message_string(2005, 2))
+        self.assertEqual("You can't attack this target.", mmdb_parser.get_message_string(100, 1))
+        self.assertIsNone(mmdb_parser.get_message_string(100, 999999))
+        self.assertIsNone(mmdb_parser.get_message_string(999999, 1))
+
     def test_write_param(self):
         mmdb_parser = MMDBParser("./text.mdb")
 
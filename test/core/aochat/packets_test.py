@@ -0,0 +1,34 @@
+import unittest
+
+from core.aochat import server_packets
+from core.aochat.packets import decode_args, encode_args, PacketMissingArgument
+
+
+class PacketsTest(unittest.TestCase):
+    def test_encode_decode(self):
+        args = [123, "tyrbot", (5 << 32) + 7, ["a", "bc"]]
+        data = encode_args("ISGs", args)
+
+        self.assertEqual(args, decode_args("ISGs", data))
+        self.assertEqual([123, "tyrbot", (5 << 32) + 7, ["a", "bc"]], args)
+        self.assertEqual([1, 2, 3, "x"], decode_args("IIIS", encode_args("IIIS", [1, 2, 3, "x"])))
+        self.assertRaises(PacketMissingArgument, encode_args, "IS", [1])
+
+    def test_server_packet_decodes_lazily(self):
+        data = encode_args("IIS", [1234, 1, "\1"])
+        packet = server_packets.ServerPacket.get_instance(server_packets.BuddyAdded.id, data)
+
+        self.assertIsInstance(packet, server_packets.BuddyAdded)
+        self.assertIsNone(packet._args)
+        self.assertEqual(1234, packet.char_id)
+        self.assertEqual(1, packet.online)
+        self.assertEqual(data, packet.to_bytes())
+        self.assertIsNone(server_packets.ServerPacket.get_instance(999, data))
+
+    def test_server_packet_fields(self):
+        packet = server_packets.PublicChannelMessage(1, 2, "message", "")
+        packet.message = "changed"
+
+        self.assertEqual([1, 2, "changed", ""], packet.args)
+        self.assertIsNone(packet.extended_message)
+        self.assertRaises(AttributeError, setattr, packet, "other", 1)
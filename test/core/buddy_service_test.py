@@ -0,0 +1,119 @@
+import unittest
+
+from core.aochat import client_packets, server_packets
+from core.buddy_service import BuddyService
+from core.dict_object import DictObject
+from core.job_scheduler import JobScheduler
+
+
+class FakeConn:
+    def __init__(self, _id, char_id):
+        self.id = _id
+        self.char_id = char_id
+        self.buddy_list = {}
+        self.packets = []
+
+    def send_packet(self, packet):
+        self.packets.append(packet)
+
+    def send_packets(self, packets):
+        self.packets.extend(packets)
+
+
+class FakeBot:
+    def __init__(self, conns):
+        self.conns = DictObject({conn.id: conn for conn in conns})
+
+    def get_conns(self):
+        return self.conns.items()
+
+
+class FakeEventService:
+    def fire_event(self, event_type, event_data):
+        pass
+
+
+class BuddyServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.conn1 = FakeConn("bot0", 100)
+        self.conn2 = FakeConn("bot1", 200)
+
+        self.buddy_service = BuddyService()
+        self.buddy_service.bot = FakeBot([self.conn1, self.conn2])
+        self.buddy_service.event_service = FakeEventService()
+        self.buddy_service.job_scheduler = JobScheduler()
+        self.buddy_service.handle_login_ok(self.conn1, None)
+        self.buddy_service.handle_login_ok(self.conn2, None)
+
+    def test_add_buddy_uses_least_loaded_conn(self):
+        self.assertTrue(self.buddy_service.add_buddy(1, "member"))
+        self.assertTrue(self.buddy_service.add_buddy(2, "member"))
+        self.assertTrue(self.buddy_service.add_buddy(2, "org_member"))
+        self.assertFalse(self.buddy_service.add_buddy(200, "member"))
+
+        self.assertEqual("bot0", self.buddy_service.get_buddy(1)["conn_id"])
+        self.assertEqual("bot1", self.buddy_service.get_buddy(2)["conn_id"])
+        self.assertEqual(["member", "org_member"], self.buddy_service.get_buddy(2)["types"])
+        self.assertEqual(1, self.buddy_service.get_buddy(200)["online"])
+        self.assertEqual(2, self.buddy_service.get_buddy_list_size())
+        self.assertEqual({1, 2}, set(self.buddy_service.get_buddies_by_type("member").keys()))
+
+    def test_handle_add_moves_buddy_between_conns(self):
+        self.buddy_service.add_buddy(1, "member")
+        self.buddy_service.handle_add(self.conn2, server_packets.BuddyAdded(1, 1, "\0"))
+
+        buddy = self.buddy_service.get_buddy(1)
+        self.assertEqual("bot1", buddy["conn_id"])
+        self.assertEqual(["member"], buddy["types"])
+        self.assertEqual(1, self.buddy_service.is_online(1))
+        self.assertNotIn(1, self.conn1.buddy_list)
+        self.assertIs(buddy, self.conn2.buddy_list[1])
+
+        # a late BuddyRemoved from the old conn does not remove the buddy from the index
+        self.buddy_service.handle_remove(self.conn1, server_packets.BuddyRemoved(1))
+        self.assertIsNotNone(self.buddy_service.get_buddy(1))
+
+    def test_remove_all_buddies_by_type(self):
+        self.buddy_service.add_buddy(1, "orglist")
+        self.buddy_service.add_buddy(2, "orglist")
+        self.buddy_service.add_buddy(2, "member")
+
+        self.buddy_service.remove_all_buddies_by_type("orglist")
+
+        self.assertEqual([], self.buddy_service.get_buddy(1)["types"])
+        self.assertEqual(["member"], self.buddy_service.get_buddy(2)["types"])
+        self.assertEqual({}, self.buddy_service.get_buddies_by_type("orglist"))
+        removed = [p.char_id for p in self.conn1.packets + self.conn2.packets if p.id == client_packets.BuddyRemove.id]
+        self.assertEqual([1], removed)
+
+        self.buddy_service.handle_remove(self.conn1, server_packets.BuddyRemoved(1))
+        self.assertIsNone(self.buddy_service.get_buddy(1))
+        self.assertEqual(1, self.buddy_service.get_buddy_list_size())
+
+    def test_add_buddies(self):
+        num_buddies = BuddyService.BUDDY_BATCH_SIZE * 3
+        self.buddy_service.add_buddies(range(1000, 1000 + num_buddies), "org_member")
+
+        # the buddy list is updated straight away and the buddies are spread over the conns
+        self.assertEqual(num_buddies, len(self.buddy_service.get_buddies_by_type("org_member")))
+        self.assertEqual(num_buddies // 2, len(self.conn1.buddy_list))
+        self.assertEqual([], self.conn1.packets)
+
+        # packets are sent in batches
+        job_scheduler = self.buddy_service.job_scheduler
+        job_scheduler.check_for_scheduled_jobs()
+        self.assertEqual(BuddyService.BUDDY_BATCH_SIZE, len(self.conn1.packets))
+        self.assertEqual(BuddyService.BUDDY_BATCH_SIZE, len(self.conn2.packets))
+
+        # a single change is not sent ahead of the packets still waiting for the conn
+        self.buddy_service.remove_buddy(1000, "org_member")
+        self.assertEqual(BuddyService.BUDDY_BATCH_SIZE, len(self.conn1.packets))
+
+        job_scheduler.check_for_scheduled_jobs(job_scheduler.jobs[0][2]["time"])
+        self.assertEqual(0, self.buddy_service.get_num_pending_packets())
+        self.assertEqual(num_buddies // 2 + 1, len(self.conn1.packets))
+        self.assertEqual(client_packets.BuddyRemove.id, self.conn1.packets[-1].id)
+
+        self.buddy_service.remove_buddies(range(1001, 1000 + num_buddies), "org_member")
+        self.assertEqual({}, self.buddy_service.get_buddies_by_type("org_member"))
+        self.assertEqual(num_buddies - 1, self.buddy_service.get_num_pending_packets())
@@ -0,0 +1,137 @@
+import unittest
+from unittest.mock import Mock
+
+from core.command_alias_service import CommandAliasService
+from core.command_param_types import Any
+from core.command_service import CommandService
+from core.db import DB
+from core.util import Util
+from modules.extra.alias_params.command_alias_with_params_service import CommandAliasServiceWithParams
+
+
+class CommandServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.db.connect_sqlite(":memory:")
+        self.db.exec("CREATE TABLE command_config (command VARCHAR(50) NOT NULL, sub_command VARCHAR(50) NOT NULL, access_level VARCHAR(50) NOT NULL, channel VARCHAR(50) NOT NULL, "
+                     "module VARCHAR(50) NOT NULL, enabled SMALLINT NOT NULL, verified SMALLINT NOT NULL)")
+        self.db.exec("CREATE TABLE command_alias (alias VARCHAR(50) NOT NULL, command VARCHAR(1024) NOT NULL, enabled SMALLINT NOT NULL)")
+
+        self.command_service = CommandService()
+        self.command_service.db = self.db
+        self.command_service.util = Util()
+        self.command_service.access_service = Mock()
+        self.command_service.access_service.check_access.side_effect = lambda char_id, access_level: access_level == "all"
+        self.command_service.character_service = Mock()
+        self.command_service.character_service.resolve_char_to_name.return_value = "Tester"
+        self.command_service.usage_service = Mock()
+        self.set_command_alias_service(CommandAliasService())
+
+        self.command_service.register_command_channel("Private Message", "msg")
+        self.command_service.register_command_channel("Private Channel", "priv")
+        self.command_service.register(self.handle_test_cmd, "test", [], "all", "Test command", "test")
+        self.command_service.register(self.handle_echo_cmd, "echo", [Any("text")], "all", "Echo command", "test")
+
+        self.calls = []
+
+    def set_command_alias_service(self, command_alias_service):
+        command_alias_service.db = self.db
+        command_alias_service.command_service = self.command_service
+        self.command_service.command_alias_service = command_alias_service
+
+    def handle_test_cmd(self, request):
+        self.calls.append(("test", request.channel))
+
+    def handle_echo_cmd(self, request, text):
+        self.calls.append(("echo", text))
+
+    def process_command(self, message, channel="msg"):
+        replies = []
+        self.command_service.process_command(message, channel, 1, replies.append, None)
+        return replies
+
+    def test_routing(self):
+        self.assertEqual([], self.process_command("test"))
+        self.assertEqual([], self.process_command("TEST", "priv"))
+        self.assertEqual([], self.process_command("echo hello world"))
+        self.assertEqual([("test", "msg"), ("test", "priv"), ("echo", "hello world")], self.calls)
+
+        self.assertEqual(["Error! Unknown command <highlight>unknown</highlight>."], self.process_command("unknown"))
+
+    def test_routing_after_enable_disable(self):
+        self.process_command("test")
+        self.assertEqual([("test", "msg")], self.calls)
+
+        # same updates as `config cmd test disable priv`
+        self.db.exec("UPDATE command_config SET enabled = 0 WHERE command = ? AND sub_command = ? AND channel = ?", ["test", "", "priv"])
+        self.command_service.invalidate_routing_table()
+
+        self.assertEqual(["Error! Unknown command <highlight>test</highlight>."], self.process_command("test", "priv"))
+        self.process_command("test")
+        self.assertEqual([("test", "msg"), ("test", "msg")], self.calls)
+
+        # same updates as `config cmd test enable all`
+        self.db.exec("UPDATE command_config SET enabled = 1 WHERE command = ? AND sub_command = ?", ["test", ""])
+        self.command_service.invalidate_routing_table()
+
+        self.assertEqual([], self.process_command("test", "priv"))
+        self.assertEqual([("test", "msg"), ("test", "msg"), ("test", "priv")], self.calls)
+
+    def test_routing_after_access_level_change(self):
+        self.assertEqual([], self.process_command("test"))
+
+        # same updates as `config cmd test access_level msg admin`
+        self.db.exec("UPDATE command_config SET access_level = ? WHERE command = ? AND sub_command = ? AND channel = ?", ["admin", "test", "", "msg"])
+        self.command_service.invalidate_routing_table()
+
+        self.assertEqual(["Access denied."], self.process_command("test"))
+        self.assertEqual([], self.process_command("test", "priv"))
+        self.assertEqual([("test", "msg"), ("test", "priv")], self.calls)
+
+    def test_alias_add_remove(self):
+        self.assertEqual(["Error! Unknown command <highlight>t</highlight>."], self.process_command("t"))
+
+        self.command_service.command_alias_service.add_alias("t", "test")
+        self.command_service.command_alias_service.add_alias("say", "echo hello")
+        self.command_service.command_alias_service.add_alias("s", "say")
+
+        self.assertEqual([], self.process_command("t", "priv"))
+        self.assertEqual([], self.process_command("say"))
+        self.assertEqual([], self.process_command("S World"))
+        self.assertEqual([("test", "priv"), ("echo", "hello"), ("echo", "hello World")], self.calls)
+
+        self.command_service.command_alias_service.remove_alias("t")
+        self.command_service.command_alias_service.remove_alias("say")
+
+        self.assertEqual(["Error! Unknown command <highlight>t</highlight>."], self.process_command("t"))
+        self.assertEqual(["Error! Unknown command <highlight>say</highlight>."], self.process_command("s"))
+
+    def test_alias_routing_after_enable_disable(self):
+        self.command_service.command_alias_service.add_alias("t", "test")
+        self.assertEqual([], self.process_command("t"))
+
+        self.db.exec("UPDATE command_config SET enabled = 0 WHERE command = ? AND sub_command = ?", ["test", ""])
+        self.command_service.invalidate_routing_table()
+
+        self.assertEqual(["Error! Unknown command <highlight>test</highlight>."], self.process_command("t"))
+        self.assertEqual([("test", "msg")], self.calls)
+
+    def test_alias_takes_precedence_over_command(self):
+        self.command_service.command_alias_service.add_alias("test", "echo alias")
+
+        self.process_command("test")
+        self.assertEqual([("echo", "alias")], self.calls)
+
+    def test_alias_recursion(self):
+        self.command_service.command_alias_service.add_alias("a", "b")
+        self.command_service.command_alias_service.add_alias("b", "a")
+
+        self.assertEqual(["There was an error processing your request."], self.process_command("a"))
+
+    def test_alias_with_params(self):
+        self.set_command_alias_service(CommandAliasServiceWithParams())
+        self.command_service.command_alias_service.add_alias("greet", "echo hi {1}, bye {0}")
+        self.command_service.command_alias_service.add_alias("g", "greet")
+
+        self.process_command("g Bob")
+        self.assertEqual([("echo", "hi Bob, bye Bob")], self.calls)
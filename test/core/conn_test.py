@@ -0,0 +1,59 @@
+import unittest
+
+from core.aochat.client_packets import PrivateMessage, PublicChannelMessage
+from core.conn import Conn
+from core.fifo_queue import FifoQueue
+
+
+class ConnTest(unittest.TestCase):
+    def test_coalesce_packets(self):
+        conn = Conn("bot0", lambda: None)
+
+        conn.add_packets_to_queue([PrivateMessage(1, "one", "\0"),
+                                   PrivateMessage(1, "two", "\0"),
+                                   PrivateMessage(2, "three", "\0"),
+                                   PublicChannelMessage(5, "four", ""),
+                                   PrivateMessage(2, "x" * Conn.MAX_COALESCED_MESSAGE_LENGTH, "\0")])
+
+        self.assertEqual([(1, "one\ntwo"), (2, "three"), (5, "four"), (2, "x" * Conn.MAX_COALESCED_MESSAGE_LENGTH)],
+                         [(p.channel_id if isinstance(p, PublicChannelMessage) else p.char_id, p.message) for p in conn.packet_queue])
+
+    def test_overflow_moves_private_messages(self):
+        conn = Conn("bot0", lambda: None)
+        conn.overflow_queue = FifoQueue()
+
+        packets = [PublicChannelMessage(5, "org %d" % i, "") if i % 2 else PrivateMessage(i, "tell %d" % i, "\0")
+                   for i in range(Conn.MAX_QUEUED_MESSAGES + 10)]
+        conn.add_packets_to_queue(packets)
+
+        # nothing is discarded, tells to the most recent recipients are sent by other conns instead
+        moved = []
+        while not conn.overflow_queue.empty():
+            moved.append(conn.overflow_queue.get())
+
+        self.assertEqual(Conn.MAX_QUEUED_MESSAGES + 10, len(conn.packet_queue) + len(moved))
+        self.assertEqual(10, len(moved))
+        self.assertTrue(all(isinstance(p, PrivateMessage) for p in moved))
+        self.assertEqual(list(range(20, Conn.MAX_QUEUED_MESSAGES + 10, 2)), [p.char_id for p in moved])
+
+    def test_overflow_drops_messages_without_overflow_queue(self):
+        conn = Conn("bot0", lambda: None)
+
+        conn.add_packets_to_queue([PrivateMessage(i, "tell %d" % i, "\0") for i in range(Conn.MAX_QUEUED_MESSAGES + 10)])
+
+        # the oldest messages are dropped
+        self.assertEqual(list(range(10, Conn.MAX_QUEUED_MESSAGES + 10)), [p.char_id for p in conn.packet_queue])
+
+    def test_overflow_drops_channel_messages(self):
+        conn = Conn("bot0", lambda: None)
+        conn.overflow_queue = FifoQueue()
+
+        packets = [PublicChannelMessage(i % 2, "org %d" % i, "x") for i in range(Conn.MAX_QUEUED_MESSAGES + 10)]
+        conn.add_packets_to_queue(packets[:5])
+        conn.packet_queue.enqueue(PublicChannelMessage(2, "priority", "x"), 10)
+        conn.add_packets_to_queue(packets[5:])
+
+        # channel messages can't be sent by other conns, so the oldest ones are dropped, starting with the lowest priority
+        self.assertTrue(conn.overflow_queue.empty())
+        self.assertEqual(Conn.MAX_QUEUED_MESSAGES, len(conn.packet_queue))
+        self.assertEqual(["priority"] + [p.message for p in packets[11:]], [p.message for p in conn.packet_queue])
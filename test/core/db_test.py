@@ -1,6 +1,8 @@
-from core.db import DB
+from core.db import ConnectionPool, DB
+import threading
 import unittest
 import os
+from unittest.mock import Mock
 
 
 class DbTest(unittest.TestCase):
@@ -132,6 +134,209 @@ class DbTest(unittest.TestCase):
         db.get_connection().close()
         self.delete_db_file()
 
+    def test_sqlite_load_file(self):
+        self.delete_db_file()
+
+        sql_file = "./test.sql"
+        with open(sql_file, mode="w", encoding="UTF-8") as f:
+            f.write("DROP TABLE IF EXISTS test1;\n"
+                    "CREATE TABLE test1 (id INT NOT NULL, name VARCHAR(50));\n"
+                    "-- comment\n"
+                    "INSERT INTO test1 VALUES (1, 'tyr''s bot');\n"
+                    "INSERT INTO test1 (id, name) VALUES(2, 'a), (b');\n"
+                    "INSERT INTO test1 (id, name) VALUES (3, NULL);\n"
+                    "\n"
+                    "UPDATE test1 SET name = 'updated' WHERE id = 1;\n"
+                    "INSERT INTO test1 VALUES (4, 'four');\n")
+
+        db = DB()
+        db.connect_sqlite(self.DB_FILE)
+        db.load_sql_file(sql_file)
+
+        self.assertEqual([{"id": 1, "name": "updated"}, {"id": 2, "name": "a), (b"}, {"id": 3, "name": None}, {"id": 4, "name": "four"}],
+                         db.query("SELECT * FROM test1 ORDER BY id"))
+        self.assertEqual(2, db.query_single("PRAGMA synchronous").synchronous)
+
+        db.get_connection().close()
+        os.remove(sql_file)
+        self.delete_db_file()
+
+    def test_sqlite_search_index(self):
+        self.delete_db_file()
+
+        db = DB()
+        db.connect_sqlite(self.DB_FILE)
+        db.exec("CREATE TABLE items (id INT NOT NULL, name VARCHAR(50) NOT NULL)")
+        for i, name in enumerate(["Sword of Fire", "Fire Sword", "Ice Sword", "Shield of Fire", "Ax"]):
+            db.exec("INSERT INTO items (id, name) VALUES (?, ?)", [i, name])
+
+        self.assertTrue(db.create_search_index("items", "name"))
+        if db.search_indexes[("items", "name")].type != "fts":
+            self.skipTest("FTS5 trigram tokenizer is not available")
+
+        sql, params = db.handle_extended_like("SELECT * FROM items i WHERE i.name <EXTENDED_LIKE=0> ?", ["fire -shield ax"])
+        self.assertEqual("SELECT * FROM items i WHERE (i.rowid IN (SELECT rowid FROM temp.search_items_name WHERE name LIKE ?) "
+                         "AND i.name NOT LIKE ? AND i.name LIKE ?)", sql)
+        self.assertEqual(["%fire%", "%shield%", "%ax%"], params)
+
+        self.assertEqual(["Fire Sword", "Sword of Fire"], [row.name for row in db.query("SELECT * FROM items WHERE name <EXTENDED_LIKE=0> ? ORDER BY name", ["SWORD fire"], extended_like=True)])
+        self.assertEqual(["Ice Sword"], [row.name for row in db.query("SELECT * FROM items WHERE name <EXTENDED_LIKE=0> ? ORDER BY name", ["sword -fire"], extended_like=True)])
+        self.assertEqual(["Ax"], [row.name for row in db.query("SELECT * FROM items WHERE name <EXTENDED_LIKE=0> ? ORDER BY name", ["ax"], extended_like=True)])
+
+        db.get_connection().close()
+        self.delete_db_file()
+
+    def test_memory_search_index(self):
+        db = DB()
+        db.connect_sqlite(":memory:")
+        db.exec("CREATE TABLE items (id INT NOT NULL, name VARCHAR(50))")
+        names = ["Sword of Fire", "Fire Sword", "Ice Sword", "Shield of Fire", "Ax", "Ax", "Flame-Sword", "Fire  Ax", None]
+        for i, name in enumerate(names):
+            db.exec("INSERT INTO items (id, name) VALUES (?, ?)", [i, name])
+
+        searches = ["fire", "SWORD fire", "sword -fire", "ax", "e s", "of_f", "ire%ax", "-sword", "missing", "fire missing", "-", "e-s",
+                    "ord", "ame-sw", "swords", "rof"]
+        sql = "SELECT id FROM items i WHERE i.name <EXTENDED_LIKE=0> ? ORDER BY id"
+        expected = [db.query(sql, [search], extended_like=True) for search in searches]
+
+        # used when SQLite does not have FTS5 and on MySQL
+        db._create_fts_search_index = lambda name, table, column: None
+        self.assertTrue(db.create_search_index("items", "name"))
+        self.assertEqual("memory", db.search_indexes[("items", "name")].type)
+
+        sql_with_index, params = db.handle_extended_like(sql, ["fire -shield ax"])
+        self.assertEqual("SELECT id FROM items i WHERE (i.name IN (?) AND i.name NOT LIKE ?) ORDER BY id", sql_with_index)
+        self.assertEqual(["Fire  Ax", "%shield%"], params)
+
+        # matches the same rows as the LIKE expansion
+        self.assertEqual(expected, [db.query(sql, [search], extended_like=True) for search in searches])
+
+        # IN lists are padded to a power of two, so searches only generate a few distinct statements
+        padded_sql, padded_params = db.handle_extended_like(sql, ["s"])
+        self.assertEqual("SELECT id FROM items i WHERE (i.name IN (%s)) ORDER BY id" % ", ".join(["?"] * 8), padded_sql)
+        self.assertEqual(5, len(set(padded_params)))
+        self.assertEqual([padded_params[4]] * 3, padded_params[5:])
+        self.assertEqual(expected[0], db.query(sql, ["fire"], extended_like=True))
+
+        # and query times are recorded under the statement the search was generated from
+        self.assertIn((sql,), db.query_times.get_samples())
+        self.assertNotIn((padded_sql,), db.query_times.get_samples())
+
+        # searches matching many values use LIKE instead of a long IN list
+        db.MAX_SEARCH_INDEX_VALUES = 2
+        self.assertEqual("SELECT id FROM items i WHERE (i.name LIKE ?) ORDER BY id", db.handle_extended_like(sql, ["fire"])[0])
+        self.assertEqual(expected[0], db.query(sql, ["fire"], extended_like=True))
+        db.MAX_SEARCH_INDEX_VALUES = DB.MAX_SEARCH_INDEX_VALUES
+
+        # the IN list is looked up through an index on the column
+        plan = db.query("EXPLAIN QUERY PLAN " + sql_with_index, params)
+        self.assertIn("USING INDEX idx_search_items_name", plan[0].detail)
+
+        # rows can be found by a key column instead, for columns that are too long to be compared by value
+        db.exec("CREATE TABLE recipe (id INT NOT NULL PRIMARY KEY, recipe TEXT NOT NULL)")
+        db.exec_many("INSERT INTO recipe (id, recipe) VALUES (?, ?)", [[1, "Combine the Sword with Fire"], [2, "Ice"], [3, "fire and ice"]])
+        db.create_search_index("recipe", "recipe", key_column="id")
+        self.assertEqual(("SELECT * FROM recipe WHERE (recipe.id IN (?, ?)) ORDER BY id", [1, 3]),
+                         db.handle_extended_like("SELECT * FROM recipe WHERE recipe <EXTENDED_LIKE=0> ? ORDER BY id", ["FIRE"]))
+        self.assertEqual([2, 3], [row.id for row in db.query("SELECT * FROM recipe WHERE recipe <EXTENDED_LIKE=0> ? ORDER BY id", ["ice -sword"], extended_like=True)])
+
+    def test_transaction_threads(self):
+        db = DB()
+        db.connect_sqlite(":memory:")
+        db.exec("CREATE TABLE test (id INT NOT NULL)")
+
+        results = []
+
+        def worker():
+            results.append(db.get_transaction_level())
+            results.append(len(db.query("SELECT * FROM test")))
+
+        with db.transaction():
+            with db.transaction():
+                db.exec("INSERT INTO test (id) VALUES (1)")
+                self.assertEqual(2, db.get_transaction_level())
+
+                # other threads wait for the transaction to finish and are not part of it
+                thread = threading.Thread(target=worker)
+                thread.start()
+                thread.join(0.1)
+                self.assertTrue(thread.is_alive())
+                self.assertEqual([0], results)
+
+            db.exec("INSERT INTO test (id) VALUES (2)")
+
+        thread.join(5)
+        self.assertEqual([0, 2], results)
+        self.assertEqual(0, db.get_transaction_level())
+
+        # the connection is released when a transaction is rolled back
+        try:
+            with db.transaction():
+                db.exec("INSERT INTO test (id) VALUES (3)")
+                raise ValueError()
+        except ValueError:
+            pass
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join(5)
+        self.assertEqual([0, 2, 0, 2], results)
+
+    def test_translate_sql(self):
+        db = DB()
+        db.connect_sqlite(":memory:")
+        db.exec("CREATE TABLE test (id INT NOT NULL PRIMARY KEY AUTO_INCREMENT, name VARCHAR(50) NOT NULL)")
+        for name in ["a", "b", "c"]:
+            db.exec("INSERT IGNORE INTO test (name) VALUES (?)", [name])
+        self.assertEqual(3, len(db.query("SELECT * FROM test")))
+
+        translated_sql = db.translate_sql("INSERT IGNORE INTO test (name) VALUES (?)")
+        self.assertEqual("INSERT OR IGNORE INTO test (name) VALUES (?)", translated_sql)
+        self.assertIs(translated_sql, db.translate_sql("INSERT IGNORE INTO test (name) VALUES (?)"))
+        self.assertEqual({("hit",): 4, ("miss",): 4}, db.sql_cache_lookups.get_samples())
+
+        db.type = DB.MYSQL
+        translated_sql = db.translate_sql("SELECT * FROM test WHERE name = ?")
+        self.assertEqual("SELECT * FROM test WHERE name = %s", translated_sql)
+
+    def test_mysql_cursor_reuse(self):
+        db = DB()
+        db.type = DB.MYSQL
+        conn1 = Mock()
+        conn2 = Mock()
+
+        self.assertIs(db.get_cursor(conn1), db.get_cursor(conn1))
+        self.assertIsNot(db.get_cursor(conn1), db.get_cursor(conn2))
+        conn1.cursor.assert_called_once_with(dictionary=True, buffered=True)
+
+    def test_connection_pool(self):
+        created = []
+
+        def connect():
+            created.append(object())
+            return created[-1]
+
+        pool = ConnectionPool(connect, 2)
+        conn1 = pool.get()
+        conn2 = pool.get()
+        self.assertEqual(2, pool.get_num_in_use())
+
+        # waits for a connection to be returned when the pool is full
+        results = []
+        thread = threading.Thread(target=lambda: results.append(pool.get()))
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual([], results)
+
+        pool.put(conn1)
+        thread.join(5)
+        self.assertEqual([conn1], results)
+
+        # discarded connections are replaced by new ones
+        pool.discard(conn2)
+        self.assertIsNot(conn2, pool.get())
+        self.assertEqual(3, len(created))
+
     def delete_db_file(self):
         try:
             os.remove(self.DB_FILE)
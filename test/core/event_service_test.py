@@ -0,0 +1,163 @@
+import threading
+import time
+import unittest
+
+from core.db import DB
+from core.event_service import EventService
+from core.executor_service import ExecutorService
+from core.util import Util
+
+
+class EventServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.db.connect_sqlite(":memory:")
+        self.db.exec("CREATE TABLE event_config (event_type VARCHAR(50) NOT NULL, event_sub_type VARCHAR(50) NOT NULL, handler VARCHAR(255) NOT NULL, description VARCHAR(255) NOT NULL, "
+                     "module VARCHAR(50) NOT NULL, enabled SMALLINT NOT NULL, verified SMALLINT NOT NULL, is_hidden SMALLINT NOT NULL)")
+        self.db.exec("CREATE TABLE timer_event (event_type VARCHAR(50) NOT NULL, event_sub_type VARCHAR(50) NOT NULL, handler VARCHAR(255) NOT NULL, next_run INT NOT NULL)")
+
+        self.event_service = EventService()
+        self.event_service.db = self.db
+        self.event_service.util = Util()
+        self.event_service.executor_service = ExecutorService()
+        self.event_service.register_event_type("test")
+        self.event_service.register_event_type("timer")
+
+        self.calls = []
+
+    def handler1(self, event_type, event_data):
+        self.calls.append(("handler1", event_data))
+
+    def handler2(self, event_type, event_data):
+        self.calls.append(("handler2", event_data))
+
+    def timer1(self, event_type, event_data):
+        self.calls.append(("timer1", event_type))
+
+    def timer2(self, event_type, event_data):
+        self.calls.append(("timer2", event_type))
+
+    def timer3(self, event_type, event_data):
+        self.calls.append(("timer3", event_type))
+
+    def register_timer_event(self, handler, interval, next_run):
+        self.event_service.register(handler, "timer:%d" % interval, "Timer", "test", False, True)
+        handler_name = self.event_service.util.get_handler_name(handler)
+        self.db.exec("UPDATE timer_event SET next_run = ? WHERE handler = ?", [next_run, handler_name])
+        return handler_name
+
+    def get_next_run(self, handler_name):
+        return self.db.query_single("SELECT next_run FROM timer_event WHERE handler = ?", [handler_name]).next_run
+
+    def test_timer_events_order(self):
+        self.register_timer_event(self.timer1, 60, 1000)
+        self.register_timer_event(self.timer2, 30, 900)
+        self.register_timer_event(self.timer3, 10, 1100)
+
+        # due events run in next_run order
+        self.event_service.check_for_timer_events(1000)
+        self.assertEqual([("timer2", "timer:30"), ("timer1", "timer:60")], self.calls)
+
+        # timer2 was behind, so it is next run one interval from now instead of catching up
+        self.calls = []
+        self.event_service.check_for_timer_events(1100)
+        self.assertEqual([("timer2", "timer:30"), ("timer1", "timer:60"), ("timer3", "timer:10")], self.calls)
+
+    def test_timer_event_run_manually(self):
+        handler_name = self.register_timer_event(self.timer1, 60, 1000)
+        self.event_service.check_for_timer_events(900)
+
+        # like "config event ... run", which passes the row from the database
+        row = self.db.query_single("SELECT e.event_type, e.event_sub_type, e.handler, t.next_run FROM timer_event t "
+                                   "JOIN event_config e ON t.event_type = e.event_type AND t.handler = e.handler WHERE e.handler = ?", [handler_name])
+        self.event_service.execute_timed_event(row, 950)
+        self.assertEqual([("timer1", "timer:60")], self.calls)
+        self.assertEqual(1060, self.event_service.timer_events[handler_name].next_run)
+
+        # the heap entry for the old next_run is skipped
+        self.event_service.check_for_timer_events(1000)
+        self.assertEqual(1, len(self.calls))
+
+        self.event_service.check_for_timer_events(1060)
+        self.assertEqual(2, len(self.calls))
+
+    def test_timer_event_status(self):
+        handler_name = self.register_timer_event(self.timer1, 60, 1000)
+        self.event_service.check_for_timer_events(900)
+
+        # disabling takes effect straight away, not when the heap entry is next popped
+        self.event_service.update_event_status("timer", "60", handler_name, 0)
+        self.event_service.check_for_timer_events(1000)
+        self.assertEqual([], self.calls)
+
+        self.event_service.update_event_status("timer", "60", handler_name, 1)
+        self.event_service.check_for_timer_events(1000)
+        self.assertEqual([("timer1", "timer:60")], self.calls)
+
+    def test_save_timer_events(self):
+        handler_name1 = self.register_timer_event(self.timer1, 60, 1000)
+        handler_name2 = self.register_timer_event(self.timer2, 60, 2000)
+
+        # next_run times are only written to the database periodically
+        self.event_service.last_timer_event_save = 1000
+        self.event_service.check_for_timer_events(1000)
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(1000, self.get_next_run(handler_name1))
+        self.assertEqual({handler_name1}, self.event_service.dirty_timer_events)
+
+        self.event_service.save_timer_events()
+        self.assertEqual(1060, self.get_next_run(handler_name1))
+        self.assertEqual(2000, self.get_next_run(handler_name2))
+        self.assertEqual(set(), self.event_service.dirty_timer_events)
+
+        # and are saved by check_for_timer_events() once the save interval has passed
+        self.event_service.last_timer_event_save = 1060 - EventService.TIMER_EVENT_SAVE_INTERVAL
+        self.event_service.check_for_timer_events(1060)
+        self.assertEqual(1120, self.get_next_run(handler_name1))
+
+    def test_dispatch_list(self):
+        self.event_service.register(self.handler1, "test", "Handler 1", "test", False, True)
+        self.event_service.register(self.handler2, "test", "Handler 2", "test", False, False)
+
+        self.event_service.fire_event("test", 1)
+        self.assertEqual([("handler1", 1)], self.calls)
+        self.assertEqual(1, len(self.event_service.dispatch_lists))
+
+        # dispatch list is rebuilt when an event is enabled
+        handler2_name = self.event_service.util.get_handler_name(self.handler2)
+        self.event_service.update_event_status("test", "", handler2_name, 1)
+        self.event_service.fire_event("test", 2)
+        self.assertEqual([("handler1", 1), ("handler1", 2), ("handler2", 2)], self.calls)
+
+        stats = self.event_service.get_handler_stats()
+        self.assertEqual(2, stats[self.event_service.util.get_handler_name(self.handler1)].count)
+        self.assertEqual(1, stats[handler2_name].count)
+        self.assertEqual(1, sum(stats[handler2_name].buckets))
+
+    def test_async_handler(self):
+        main_thread = threading.current_thread()
+        results = []
+
+        def async_handler(event_type, event_data):
+            self.assertIsNot(main_thread, threading.current_thread())
+            time.sleep(0.01 if event_data == 1 else 0)
+            return lambda: results.append((event_data, threading.current_thread()))
+
+        self.event_service.register(async_handler, "test", "Async handler", "test", False, True, async_ok=True)
+        self.event_service.register(self.handler1, "test", "Handler 1", "test", False, True)
+
+        for i in range(1, 4):
+            self.event_service.fire_event("test", i)
+
+        # synchronous handlers are not delayed by the async handler
+        self.assertEqual([("handler1", 1), ("handler1", 2), ("handler1", 3)], self.calls)
+
+        # results are run on the main thread, in the order the events were fired
+        executor_service = self.event_service.executor_service
+        deadline = time.time() + 5
+        while len(results) < 3 and time.time() < deadline:
+            executor_service.run_main_thread_callbacks()
+            time.sleep(0.001)
+
+        self.assertEqual([(1, main_thread), (2, main_thread), (3, main_thread)], results)
+        self.assertEqual(3, self.event_service.get_handler_stats()[self.event_service.util.get_handler_name(async_handler)].count)
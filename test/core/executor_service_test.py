@@ -0,0 +1,36 @@
+import threading
+import unittest
+
+from core.executor_service import ExecutorService
+
+
+class ExecutorServiceTest(unittest.TestCase):
+    def test_run_on_main_thread(self):
+        executor_service = ExecutorService()
+        main_thread = threading.current_thread()
+        results = []
+
+        def callback(i):
+            results.append((i, threading.current_thread()))
+            if i == 2:
+                executor_service.run_on_main_thread(callback, 4)
+
+        def fail():
+            raise Exception("error in callback")
+
+        thread = threading.Thread(target=lambda: [executor_service.run_on_main_thread(callback, i) for i in range(3)])
+        thread.start()
+        thread.join()
+        executor_service.run_on_main_thread(fail)
+        executor_service.run_on_main_thread(callback, 3)
+
+        # nothing runs until the main loop drains the queue
+        self.assertEqual([], results)
+
+        # callbacks run in order, an error does not stop the others, and callbacks queued by callbacks wait for the next drain
+        executor_service.run_main_thread_callbacks()
+        self.assertEqual([(0, main_thread), (1, main_thread), (2, main_thread), (3, main_thread)], results)
+
+        executor_service.run_main_thread_callbacks()
+        self.assertEqual((4, main_thread), results[-1])
+        self.assertEqual(0, executor_service.main_thread_callbacks.qsize())
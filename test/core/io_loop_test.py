@@ -0,0 +1,66 @@
+import socket
+import time
+import unittest
+
+from core.aochat import client_packets, server_packets
+from core.aochat.bot import Bot
+from core.conn import Conn
+from core.fifo_queue import FifoQueue
+from core.io_loop import IOLoop
+
+
+class IOLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.running = True
+        self.failed = False
+        self.incoming_queue = FifoQueue()
+        self.mass_message_queue = FifoQueue()
+        self.io_loop = IOLoop(self.incoming_queue, lambda: self.running, self.set_failed)
+        self.io_loop.start()
+
+        self.conns = []
+        self.server_sockets = []
+        for i in range(2):
+            conn = Conn("bot%d" % i, self.set_failed)
+            conn.socket, server_socket = socket.socketpair()
+            server_socket.settimeout(5)
+            self.conns.append(conn)
+            self.server_sockets.append(server_socket)
+
+        self.io_loop.add_conn(self.conns[0])
+        self.io_loop.add_conn(self.conns[1], self.mass_message_queue)
+
+    def tearDown(self):
+        self.running = False
+        self.io_loop.wakeup()
+        for conn, server_socket in zip(self.conns, self.server_sockets):
+            conn.socket.close()
+            server_socket.close()
+
+    def set_failed(self):
+        self.failed = True
+
+    def read_server_packet(self, server_socket):
+        packet_id, length = Bot.PACKET_HEADER.unpack(server_socket.recv(4))
+        return client_packets.ClientPacket.get_instance(packet_id, server_socket.recv(length))
+
+    def test_receive_packets(self):
+        for i, server_socket in enumerate(self.server_sockets):
+            packet = server_packets.BuddyAdded(i, 1, "\1")
+            data = packet.to_bytes()
+            server_socket.sendall(Bot.PACKET_HEADER.pack(packet.id, len(data)) + data)
+
+        received = sorted([self.incoming_queue.get(timeout=5) for _ in range(2)], key=lambda x: x[1].char_id)
+        self.assertEqual([(self.conns[0], 0), (self.conns[1], 1)], [(conn, packet.char_id) for conn, packet in received])
+        self.assertFalse(self.failed)
+
+    def test_send_packets(self):
+        self.conns[0].add_packets_to_queue([client_packets.PrivateMessage(1, "hello", "\0")])
+        self.assertEqual("hello", self.read_server_packet(self.server_sockets[0]).message)
+
+        # packets on the mass message queue are sent by the conn that was given the queue
+        start = time.time()
+        self.mass_message_queue.put(client_packets.PrivateMessage(2, "mass", "\0"))
+        self.io_loop.wakeup()
+        self.assertEqual("mass", self.read_server_packet(self.server_sockets[1]).message)
+        self.assertLess(time.time() - start, 0.5)
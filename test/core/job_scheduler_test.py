@@ -0,0 +1,59 @@
+import time
+import unittest
+
+from core.job_scheduler import JobScheduler
+
+
+class JobSchedulerTest(unittest.TestCase):
+    def test_jobs_run_in_order(self):
+        job_scheduler = JobScheduler()
+        results = []
+
+        def callback(t, name):
+            results.append(name)
+
+        t = time.time()
+        job_scheduler.scheduled_job(callback, t + 3, "third")
+        job_scheduler.scheduled_job(callback, t + 1, "first")
+        job_scheduler.scheduled_job(callback, t + 2, "second")
+        job_scheduler.scheduled_job(callback, t + 10, "later")
+
+        job_scheduler.check_for_scheduled_jobs(t + 0.5)
+        self.assertEqual([], results)
+
+        job_scheduler.check_for_scheduled_jobs(t + 3)
+        self.assertEqual(["first", "second", "third"], results)
+        self.assertEqual(1, len(job_scheduler.get_pending_jobs()))
+
+    def test_cancel_job(self):
+        job_scheduler = JobScheduler()
+        results = []
+
+        def callback(t, name):
+            results.append(name)
+
+        t = time.time()
+        job_id1 = job_scheduler.scheduled_job(callback, t + 1, "first")
+        job_scheduler.scheduled_job(callback, t + 1.5, "second")
+
+        self.assertEqual(job_id1, job_scheduler.cancel_job(job_id1)["id"])
+        self.assertIsNone(job_scheduler.cancel_job(job_id1))
+
+        job_scheduler.check_for_scheduled_jobs(t + 2)
+        self.assertEqual(["second"], results)
+        self.assertEqual([], job_scheduler.get_pending_jobs())
+
+    def test_get_pending_jobs_lateness(self):
+        job_scheduler = JobScheduler()
+
+        def callback(t):
+            pass
+
+        job_id = job_scheduler.scheduled_job(callback, time.time() - 5)
+        job_scheduler.delayed_job(callback, 60)
+
+        pending = job_scheduler.get_pending_jobs()
+        self.assertEqual(job_id, pending[0].id)
+        self.assertAlmostEqual(5, pending[0].lateness, delta=1)
+        self.assertEqual(0, pending[1].lateness)
+        self.assertAlmostEqual(60, pending[1].time_left, delta=1)
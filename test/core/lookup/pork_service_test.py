@@ -0,0 +1,146 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from core.db import DB
+from core.executor_service import ExecutorService
+from core.lookup.character_service import CharacterService
+from core.lookup.pork_service import PorkService
+
+
+class FakeResponse:
+    def __init__(self, char_name):
+        self.char_name = char_name
+        self.text = ""
+
+    def json(self):
+        char_id = int(self.char_name[4:])
+        return [{"NAME": self.char_name, "CHAR_INSTANCE": char_id, "FIRSTNAME": "", "LASTNAME": "", "LEVELX": 220, "BREED": "Solitus",
+                 "CHAR_DIMENSION": 5, "SEX": "Female", "SIDE": "Clan", "PROF": "Doctor", "PROFNAME": "", "RANK_name": "", "ALIENLEVEL": 30,
+                 "PVPRATING": 0, "PVPTITLE": None, "HEADID": 0},
+                {"ORG_INSTANCE": 1, "NAME": "Org", "RANK_TITLE": "Member", "RANK": 5}]
+
+
+class PorkServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.db.connect_sqlite(":memory:")
+
+        self.character_service = CharacterService()
+        for char_id in range(1, 10):
+            self.character_service.id_to_name[char_id] = "Char%d" % char_id
+            self.character_service.name_to_id["Char%d" % char_id] = char_id
+
+        self.pork_service = PorkService()
+        self.pork_service.bot = Mock(dimension=5)
+        self.pork_service.db = self.db
+        self.pork_service.character_service = self.character_service
+        self.pork_service.executor_service = ExecutorService()
+        self.pork_service.event_service = Mock()
+        self.pork_service.start()
+
+        # requests are held until released, so tests can control when they finish
+        self.release = threading.Event()
+        self.requests = []
+        self.num_concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+        patcher = patch("core.lookup.pork_service.requests.get", side_effect=self.get)
+        patcher.start()
+        # cleanups run in reverse order, so requests still running finish before the patch is removed
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.pork_service.fetch_executor.shutdown)
+        self.addCleanup(self.release.set)
+
+    def get(self, url, timeout):
+        with self.lock:
+            self.requests.append(url)
+            self.num_concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.num_concurrent)
+
+        try:
+            self.release.wait(5)
+            return FakeResponse(url.split("/name/")[1].split("/")[0])
+        finally:
+            with self.lock:
+                self.num_concurrent -= 1
+
+    def wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.001)
+        self.assertTrue(condition())
+
+    def run_main_thread_callbacks_until(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            self.pork_service.executor_service.run_main_thread_callbacks()
+            time.sleep(0.001)
+        self.assertTrue(condition())
+
+    def test_request_coalescing(self):
+        futures = [self.pork_service.request_char_info_async(name, 5) for name in ["Char1", "char1", "CHAR1"]]
+        self.assertIs(futures[0], futures[1])
+        self.assertIs(futures[0], futures[2])
+
+        self.release.set()
+        self.assertEqual(1, futures[0].result(5).char_id)
+        self.assertEqual(1, len(self.requests))
+
+        # once finished, a new request is made
+        self.wait_for(lambda: not self.pork_service.in_flight)
+        self.assertIsNot(futures[0], self.pork_service.request_char_info_async("Char1", 5))
+
+    def test_max_concurrent_requests_per_host(self):
+        futures = [self.pork_service.request_char_info_async("Char%d" % char_id, 5) for char_id in range(1, 9)]
+
+        self.wait_for(lambda: len(self.requests) == PorkService.MAX_CONCURRENT_REQUESTS_PER_HOST)
+        time.sleep(0.05)
+        self.assertEqual(PorkService.MAX_CONCURRENT_REQUESTS_PER_HOST, len(self.requests))
+
+        self.release.set()
+        self.assertEqual(list(range(1, 9)), [future.result(5).char_id for future in futures])
+        self.assertEqual(8, len(self.requests))
+        self.assertEqual(PorkService.MAX_CONCURRENT_REQUESTS_PER_HOST, self.max_concurrent)
+
+    def test_get_character_info_async_callback(self):
+        results = []
+        main_thread = threading.current_thread()
+
+        self.assertIsNone(self.pork_service.get_character_info_async(1, lambda char_info: results.append((char_info, threading.current_thread()))))
+
+        self.release.set()
+        self.wait_for(lambda: not self.pork_service.in_flight)
+        time.sleep(0.01)
+
+        # the callback is only run, and the result only saved, by the main loop
+        self.assertEqual([], results)
+        self.assertIsNone(self.pork_service.get_from_database(char_id=1))
+
+        self.run_main_thread_callbacks_until(lambda: results)
+        self.assertEqual(1, results[0][0].char_id)
+        self.assertIs(main_thread, results[0][1])
+        self.assertEqual(220, self.pork_service.get_from_database(char_id=1).level)
+
+        # fresh info is returned straight away, without a request or a callback
+        self.assertEqual(220, self.pork_service.get_character_info_async(1, results.append).level)
+        self.assertEqual(1, len(self.requests))
+
+    def test_load_character_info(self):
+        callbacks = []
+        self.pork_service.load_character_info(2, callback=lambda: callbacks.append(True))
+
+        # a placeholder record is saved straight away
+        char_info = self.pork_service.get_from_database(char_id=2)
+        self.assertEqual("chat_server", char_info.source)
+        self.assertEqual("Char2", char_info.name)
+
+        # and replaced once the request finishes
+        self.release.set()
+        self.run_main_thread_callbacks_until(lambda: callbacks)
+        char_info = self.pork_service.get_from_database(char_id=2)
+        self.assertEqual("people.anarchy-online.com", char_info.source)
+        self.assertEqual(220, char_info.level)
+        self.assertEqual("Org", char_info.org_name)
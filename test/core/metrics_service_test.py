@@ -0,0 +1,57 @@
+import unittest
+
+from core.fifo_queue import TimedFifoQueue
+from core.metrics_service import MetricsService, Histogram
+
+
+class MetricsServiceTest(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test", ["sql"], buckets=[0.1, 1], max_series=2)
+        histogram.observe(0.05, "a")
+        histogram.observe(0.5, "a")
+        histogram.observe(2, "b")
+        histogram.observe(0.1, "c")
+        histogram.observe(0.2, "d")
+
+        samples = histogram.get_samples()
+        self.assertEqual({("a",), ("b",), ("other",)}, set(samples.keys()))
+        self.assertEqual(2, samples[("a",)].count)
+        self.assertEqual(0.55, samples[("a",)].sum)
+        self.assertEqual(0.5, samples[("a",)].max)
+        self.assertEqual([1, 1, 0], samples[("a",)].buckets)
+        self.assertEqual([0, 0, 1], samples[("b",)].buckets)
+        self.assertEqual([1, 1, 0], samples[("other",)].buckets)
+
+    def test_format_prometheus(self):
+        metrics_service = MetricsService()
+        counter = metrics_service.counter("packets_total", "Packets", ["conn"])
+        counter.inc("bot\"0")
+        counter.inc("bot\"0", value=2)
+        metrics_service.gauge("queue_size", "Queue size", collect=lambda: {(): 3})
+        histogram = metrics_service.register(Histogram("wait_seconds", "Wait time", buckets=[0.1, 1]))
+        histogram.observe(0.5)
+        self.assertIs(counter, metrics_service.counter("packets_total", "Packets", ["conn"]))
+
+        self.assertEqual("# HELP tyrbot_packets_total Packets\n"
+                         "# TYPE tyrbot_packets_total counter\n"
+                         "tyrbot_packets_total{conn=\"bot\\\"0\"} 3\n"
+                         "# HELP tyrbot_queue_size Queue size\n"
+                         "# TYPE tyrbot_queue_size gauge\n"
+                         "tyrbot_queue_size 3\n"
+                         "# HELP tyrbot_wait_seconds Wait time\n"
+                         "# TYPE tyrbot_wait_seconds histogram\n"
+                         "tyrbot_wait_seconds_bucket{le=\"0.1\"} 0\n"
+                         "tyrbot_wait_seconds_bucket{le=\"1\"} 1\n"
+                         "tyrbot_wait_seconds_bucket{le=\"+Inf\"} 1\n"
+                         "tyrbot_wait_seconds_sum 0.500000\n"
+                         "tyrbot_wait_seconds_count 1\n", metrics_service.format_prometheus())
+
+    def test_timed_fifo_queue(self):
+        wait_times = Histogram("wait_seconds", "Wait time")
+        queue = TimedFifoQueue(wait_times)
+        queue.put("a")
+        queue.put("b")
+        self.assertEqual("a", queue.get_or_default(block=False))
+        self.assertEqual("b", queue.get())
+        self.assertIsNone(queue.get_or_default(block=False))
+        self.assertEqual(2, wait_times.get_samples()[()].count)
@@ -0,0 +1,55 @@
+from core.db import DB
+from core.registry import Registry
+from core.setting_service import SettingService
+from core.setting_types import BooleanSettingType, DictionarySettingType, NumberSettingType, TextSettingType
+import unittest
+
+
+class SettingServiceTest(unittest.TestCase):
+    def create_setting_service(self, db):
+        setting_service = SettingService()
+        setting_service.db = db
+        Registry.clear()
+        Registry.add_instance("setting_service", setting_service)
+        return setting_service
+
+    def test_snapshot(self):
+        db = DB()
+        db.connect_sqlite(":memory:")
+        db.exec("CREATE TABLE setting (name VARCHAR(50) NOT NULL, value VARCHAR(255) NOT NULL, description VARCHAR(255) NOT NULL, module VARCHAR(50) NOT NULL, verified SMALLINT NOT NULL)")
+        db.exec("INSERT INTO setting (name, value, description, module, verified) VALUES (?, ?, ?, ?, ?)", ["existing", "5", "", "test", 0])
+
+        setting_service = self.create_setting_service(db)
+        setting_service.register("test", "existing", 10, NumberSettingType(), "Existing setting")
+        setting_service.register("test", "flag", True, BooleanSettingType(), "New setting")
+        setting_service.register("test", "abbreviations", {"1": "a"}, DictionarySettingType(), "Dictionary setting")
+
+        self.assertEqual(5, setting_service.get("existing").get_value())
+        self.assertTrue(setting_service.get("flag").get_value())
+        self.assertEqual({"1": "a"}, setting_service.get("abbreviations").get_value())
+        self.assertEqual("1", setting_service.get_value("flag"))
+
+        # snapshots are not affected by later changes
+        snapshot = setting_service.get_snapshot()
+        changes = []
+        setting_service.register_change_listener("flag", lambda name, old_value, new_value: changes.append((name, old_value, new_value)))
+        setting_service.get("flag").set_value(False)
+        self.assertTrue(snapshot.flag)
+        self.assertFalse(setting_service.get_snapshot().flag)
+        self.assertEqual([("flag", "1", 0)], changes)
+        self.assertEqual([{"value": "0"}], db.query("SELECT value FROM setting WHERE name = ?", ["flag"]))
+        self.assertRaises(AttributeError, lambda: setattr(snapshot, "flag", False))
+
+        # dictionary values can be modified by the caller without changing the setting
+        setting_service.get("abbreviations").get_value()["2"] = "b"
+        self.assertEqual({"1": "a"}, setting_service.get("abbreviations").get_value())
+
+        # values are loaded from the database with a single query
+        setting_service = self.create_setting_service(db)
+        setting_service.register("test", "existing", 10, NumberSettingType(), "Existing setting")
+        setting_service.register("test", "flag", True, BooleanSettingType(), "New setting")
+        setting_service.register("test", "text", "", TextSettingType(allow_empty=True), "Text setting")
+        self.assertEqual(5, setting_service.get_snapshot().existing)
+        self.assertFalse(setting_service.get_snapshot().flag)
+        self.assertEqual("", setting_service.get_snapshot().text)
+        self.assertIsNone(setting_service.get_value("missing"))
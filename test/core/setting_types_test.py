@@ -6,6 +6,7 @@ import unittest
 class MockSettingService:
     def __init__(self):
         self.vals = {}
+        self.settings = {}
 
     def set_value(self, name, value):
         self.vals[name] = value
@@ -13,12 +14,18 @@ class MockSettingService:
     def get_value(self, name):
         return self.vals[name]
 
+    def get_typed_value(self, name):
+        return self.settings[name].parse_value(str(self.vals[name]))
+
 
 class SettingTypesTest(unittest.TestCase):
     def test_boolean_setting_type(self):
         Registry.clear()
-        Registry.add_instance("setting_service", MockSettingService())
+        setting_service = MockSettingService()
+        Registry.add_instance("setting_service", setting_service)
         setting = BooleanSettingType()
+        setting.set_name("test")
+        setting_service.settings["test"] = setting
 
         setting.set_value("true")
         self.assertTrue(setting.get_value())
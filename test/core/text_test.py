@@ -54,6 +54,38 @@ class TextTest(unittest.TestCase):
         pages2 = text.paginate(chatblob, conn)
         self.assertEqual(1, len(pages2))
 
+    def test_paginate_cache(self):
+        setting = Mock()
+        setting.get_value = MagicMock(return_value="test")
+        setting.get_font_color = MagicMock(return_value="<font>")
+        setting_service = Mock()
+        setting_service.get = MagicMock(return_value=setting)
+        setting_service.get_settings_version = MagicMock(return_value=1)
+
+        text = Text()
+        text.setting_service = setting_service
+        text.public_channel_service = Mock()
+
+        conn = Mock()
+        conn.get_char_name = MagicMock(return_value="char_name")
+        conn.get_org_name = MagicMock(return_value="org_name")
+
+        msg = "\n".join("line %d" % i for i in range(100))
+        pages = text.paginate(ChatBlob("label", msg), conn, max_page_length=200)
+        self.assertEqual(pages, text.paginate_uncached(ChatBlob("label", msg), conn, max_page_length=200))
+
+        # same blob is served from the cache, and callers get their own copy of the pages
+        setting.get_font_color = MagicMock(return_value="<changed>")
+        pages2 = text.paginate(ChatBlob("label", msg), conn, max_page_length=200)
+        self.assertEqual(pages, pages2)
+        self.assertIsNot(pages, pages2)
+
+        # a settings change invalidates cached pages
+        setting_service.get_settings_version = MagicMock(return_value=2)
+        pages3 = text.paginate(ChatBlob("label", msg), conn, max_page_length=200)
+        self.assertNotEqual(pages, pages3)
+        self.assertTrue("<changed>" in pages3[0])
+
     def test_get_formatted_faction(self):
         text = Text()
         self.assertEqual("<omni>Omni</omni>", text.get_formatted_faction("omni"))
@@ -95,6 +127,30 @@ class TextTest(unittest.TestCase):
         for message in messages:
             self.text_formatter_tester(text, message, conn)
 
+    def test_format_message(self):
+        colors = {"header_color": "#FFFF00", "highlight_color": "#00BFFF"}
+        setting_service = Mock()
+        setting_service.get = lambda name: Mock(get_value=MagicMock(return_value="!"),
+                                                get_font_color=MagicMock(return_value="<font color='%s'>" % colors.get(name)))
+
+        conn = Mock()
+        conn.get_char_name = MagicMock(return_value="char_name")
+        conn.get_org_name = MagicMock(return_value=None)
+
+        text = Text()
+        text.setting_service = setting_service
+
+        self.assertEqual("no markup", text.format_message_old("no markup", conn))
+        self.assertEqual("<font color='#FFFF00'>Title</font>\n<font color='#00DE42'>char_name</font> in Unknown Org: !help    <b>bold</b></font>",
+                         text.format_message_old("<header>Title</header><br><green><myname></green> in <myorg>: <symbol>help<tab><b>bold</b><end>", conn))
+        self.assertEqual("<header3><header2</header2", text.format_message_old("<header3><header2</header2", conn))
+
+        # tables are only rebuilt when a markup setting changes
+        colors["highlight_color"] = "#FF0000"
+        self.assertEqual("<font color='#00BFFF'>x</font>", text.format_message_old("<highlight>x</highlight>", conn))
+        text.markup_setting_changed("highlight_color", "#00BFFF", "#FF0000")
+        self.assertEqual("<font color='#FF0000'>x</font>", text.format_message_old("<highlight>x</highlight>", conn))
+
     def text_formatter_tester(self, text, message, conn):
         output1 = text.format_message_old(message, conn)
         output2 = text.format_message_new(message, conn)
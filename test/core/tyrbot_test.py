@@ -1,7 +1,8 @@
 import unittest
 
 from core.aochat.mmdb_parser import MMDBParser
-from core.aochat.server_packets import SystemMessage, PublicChannelMessage
+from core.aochat.server_packets import SystemMessage, PublicChannelMessage, BuddyAdded
+from core.executor_service import ExecutorService
 from core.tyrbot import Tyrbot
 
 
@@ -66,3 +67,15 @@ class TyrbotTest(unittest.TestCase):
         self.assertEqual(
             [{'priority': 10, 'handler': callback}, {'priority': 50, 'handler': callback}, {'priority': 50, 'handler': callback}],
             bot.packet_handlers.get(packet_id))
+
+    def test_iterate_ignored_packet_runs_main_thread_callbacks(self):
+        bot = Tyrbot()
+        bot.executor_service = ExecutorService()
+        calls = []
+
+        bot.register_packet_handler(BuddyAdded.id, lambda conn, packet: calls.append("handler"))
+        bot.executor_service.run_on_main_thread(calls.append, "callback")
+        bot.incoming_queue.put((None, BuddyAdded(0, 0, "\x00")))
+
+        self.assertIsNone(bot.iterate(timeout=0))
+        self.assertEqual(["callback"], calls)
@@ -0,0 +1,107 @@
+import sqlite3
+import time
+import unittest
+
+from core.db import DB, SqlException
+from core.write_behind_service import WriteBehindService
+
+
+class WriteBehindServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.db.connect_sqlite(":memory:")
+        self.db.exec("CREATE TABLE last_seen (char_id INT NOT NULL PRIMARY KEY, dt INT NOT NULL DEFAULT 0)")
+
+        self.write_behind_service = WriteBehindService()
+        self.write_behind_service.db = self.db
+
+    def add_last_seen(self, char_id, t):
+        self.write_behind_service.add("INSERT IGNORE INTO last_seen (char_id, dt) VALUES (?, ?)", [char_id, t])
+        self.write_behind_service.add("UPDATE last_seen SET dt = ? WHERE char_id = ?", [t, char_id])
+
+    def test_flush(self):
+        self.add_last_seen(1, 100)
+        self.add_last_seen(2, 100)
+        self.add_last_seen(1, 200)
+        self.assertEqual(6, self.write_behind_service.get_queue_size())
+        self.assertEqual([], self.db.query("SELECT * FROM last_seen"))
+
+        self.write_behind_service.flush()
+        self.assertEqual(0, self.write_behind_service.get_queue_size())
+        self.assertEqual([{"char_id": 1, "dt": 200}, {"char_id": 2, "dt": 100}], self.db.query("SELECT * FROM last_seen ORDER BY char_id"))
+
+    def test_flush_failed_rows(self):
+        self.db.exec("CREATE TABLE command_usage (command VARCHAR(20) NOT NULL UNIQUE)")
+        self.add_last_seen(1, 100)
+        self.write_behind_service.add("INSERT INTO command_usage (command) VALUES (?)", ["help"])
+        self.write_behind_service.add("INSERT INTO command_usage (command) VALUES (?)", ["help"])
+        self.write_behind_service.add("INSERT INTO command_usage (command) VALUES (?)", ["online"])
+        self.write_behind_service.add("INSERT INTO missing_table (id) VALUES (?)", [1])
+
+        # only the rows which fail on their own are dropped, not the rest of the batch
+        self.write_behind_service.flush()
+        self.assertEqual(0, self.write_behind_service.get_queue_size())
+        self.assertEqual([{"char_id": 1, "dt": 100}], self.db.query("SELECT * FROM last_seen"))
+        self.assertEqual(["help", "online"], [row.command for row in self.db.query("SELECT * FROM command_usage ORDER BY command")])
+
+    def test_flush_transient_error(self):
+        exec_many = self.db.exec_many
+        exec = self.db.exec
+        num_failures = [0]
+
+        def fail_while_locked(f):
+            def wrapper(sql, *args, **kwargs):
+                if num_failures[0] and "last_seen" in sql:
+                    num_failures[0] -= 1
+                    try:
+                        raise sqlite3.OperationalError("database is locked")
+                    except sqlite3.OperationalError as e:
+                        raise SqlException("SQL Error: '%s'" % str(e)) from e
+                return f(sql, *args, **kwargs)
+            return wrapper
+
+        self.db.exec_many = fail_while_locked(exec_many)
+        self.db.exec = fail_while_locked(exec)
+
+        # after a transient error the remaining rows are queued again in order, ahead of rows queued since
+        num_failures[0] = 4
+        self.add_last_seen(1, 100)
+        self.write_behind_service.flush()
+        self.assertEqual(2, self.write_behind_service.get_queue_size())
+        self.assertEqual([], self.db.query("SELECT * FROM last_seen"))
+
+        self.write_behind_service.add("UPDATE last_seen SET dt = ? WHERE char_id = ?", [200, 1])
+        self.write_behind_service.flush()
+        self.assertEqual(0, self.write_behind_service.get_queue_size())
+        self.assertEqual([{"char_id": 1, "dt": 200}], self.db.query("SELECT * FROM last_seen"))
+
+        # rows are dropped once they have been retried MAX_RETRIES times
+        num_failures[0] = 1000
+        self.add_last_seen(2, 100)
+        for _ in range(WriteBehindService.MAX_RETRIES):
+            self.write_behind_service.flush()
+            self.assertEqual(2, self.write_behind_service.get_queue_size())
+
+        self.write_behind_service.flush()
+        self.assertEqual(1, self.write_behind_service.get_queue_size())
+
+        for _ in range(WriteBehindService.MAX_RETRIES + 1):
+            self.write_behind_service.flush()
+        self.assertEqual(0, self.write_behind_service.get_queue_size())
+
+    def test_writer_thread(self):
+        self.write_behind_service.start()
+        for i in range(WriteBehindService.FLUSH_SIZE // 2):
+            self.add_last_seen(i, 100)
+
+        # flushed straight away once the queue is full, without waiting for the flush interval
+        deadline = time.time() + WriteBehindService.FLUSH_INTERVAL / 2
+        while self.write_behind_service.get_queue_size() and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(0, self.write_behind_service.get_queue_size())
+
+        # remaining rows are written on shutdown
+        self.add_last_seen(1000, 100)
+        self.write_behind_service.shutdown()
+        self.assertEqual(WriteBehindService.FLUSH_SIZE // 2 + 1, self.db.query_single("SELECT COUNT(1) AS count FROM last_seen").count)
@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import Mock
+
+from core.db import DB
+from core.dict_object import DictObject
+from modules.core.org_members.org_member_controller import OrgMemberController
+
+
+class OrgMemberControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.db.connect_sqlite(":memory:")
+        self.db.exec("CREATE TABLE org_member (char_id INT NOT NULL PRIMARY KEY, mode VARCHAR(20) NOT NULL, org_id INT NOT NULL)")
+
+        self.events = []
+        self.org_member_controller = OrgMemberController()
+        self.org_member_controller.db = self.db
+        self.org_member_controller.buddy_service = Mock()
+        self.org_member_controller.access_service = Mock()
+        self.org_member_controller.character_service = Mock(get_char_name=lambda char_id: "Char%d" % char_id)
+        self.org_member_controller.event_service = Mock(fire_event=lambda event_type, event_data: self.events.append((event_type, event_data)))
+
+    def add_member(self, char_id, mode, org_id=1):
+        self.db.exec("INSERT INTO org_member (char_id, mode, org_id) VALUES (?, ?, ?)", [char_id, mode, org_id])
+
+    def test_sync_org_roster(self):
+        self.add_member(1, OrgMemberController.MODE_ADD_AUTO)
+        self.add_member(2, OrgMemberController.MODE_ADD_MANUAL)
+        self.add_member(3, OrgMemberController.MODE_REM_MANUAL)
+        self.add_member(4, OrgMemberController.MODE_ADD_AUTO)
+        self.add_member(5, OrgMemberController.MODE_ADD_MANUAL)
+        self.add_member(6, OrgMemberController.MODE_REM_MANUAL)
+
+        conn = DictObject({"org_id": 1})
+        removed_members = [row for row in self.org_member_controller.get_all_org_members() if row.char_id in [4, 5, 6]]
+        self.org_member_controller.sync_org_roster({1, 2, 3, 7}, removed_members, conn)
+
+        self.assertEqual({1: OrgMemberController.MODE_ADD_AUTO,
+                          2: OrgMemberController.MODE_ADD_AUTO,
+                          3: OrgMemberController.MODE_REM_MANUAL,
+                          5: OrgMemberController.MODE_ADD_MANUAL,
+                          7: OrgMemberController.MODE_ADD_AUTO},
+                         {row.char_id: row.mode for row in self.org_member_controller.get_all_org_members()})
+
+        buddy_service = self.org_member_controller.buddy_service
+        buddy_service.add_buddies.assert_called_once_with([7], OrgMemberController.ORG_BUDDY_TYPE)
+        buddy_service.remove_buddies.assert_called_once_with([4, 6], OrgMemberController.ORG_BUDDY_TYPE)
+
+        self.assertEqual([OrgMemberController.ORG_MEMBER_LOGOFF_EVENT, OrgMemberController.ORG_ROSTER_CHANGED_EVENT], [event_type for event_type, _ in self.events])
+        self.assertEqual(4, self.events[0][1].char_id)
+        self.assertEqual({"org_id": 1, "conn": conn, "added": [7], "updated": [2], "removed": [4, 6]}, self.events[1][1])
+
+        # nothing is written when the roster has not changed
+        self.events = []
+        self.org_member_controller.sync_org_roster({1, 2, 3, 7}, [], conn)
+        self.assertEqual([], self.events)
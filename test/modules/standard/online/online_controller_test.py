@@ -0,0 +1,114 @@
+import unittest
+from unittest.mock import Mock, MagicMock
+
+from core.alts_service import AltsService
+from core.db import DB
+from core.dict_object import DictObject
+from core.lookup.pork_service import PorkService
+from core.text import Text
+from core.util import Util
+from core.write_behind_service import WriteBehindService
+from modules.standard.online.online_controller import OnlineController
+
+
+class OnlineControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.db.connect_sqlite(":memory:")
+        self.db.exec("CREATE TABLE alts (char_id INT NOT NULL PRIMARY KEY, group_id INT NOT NULL, status SMALLINT NOT NULL)")
+        self.db.exec("CREATE TABLE player (char_id BIGINT PRIMARY KEY, name VARCHAR(20) NOT NULL, level INT, ai_level INT, profession VARCHAR(50), "
+                     "org_name VARCHAR(255), org_rank_name VARCHAR(255))")
+
+        pork_service = Mock()
+
+        bot = Mock()
+        bot.get_conns = MagicMock(return_value=[])
+
+        self.online_controller = OnlineController()
+        self.online_controller.db = self.db
+        self.online_controller.bot = bot
+        self.online_controller.text = Text()
+        self.online_controller.util = Util()
+        self.online_controller.pork_service = pork_service
+        self.online_controller.character_service = Mock(resolve_char_to_name=lambda char_id: "Char%d" % char_id)
+        self.online_controller.write_behind_service = WriteBehindService()
+        self.online_controller.write_behind_service.db = self.db
+        self.online_controller.db.exec("CREATE TABLE online (char_id INT NOT NULL, afk_dt INT NOT NULL, afk_reason VARCHAR(255) DEFAULT '', channel CHAR(50) NOT NULL, "
+                                       "dt INT NOT NULL, UNIQUE(char_id, channel))")
+
+    def add_player(self, char_id, name, profession="Doctor", main_id=None):
+        self.db.exec("INSERT INTO player (char_id, name, level, ai_level, profession, org_name, org_rank_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [char_id, name, 220, 30, profession, "Org", "Member"])
+        if main_id:
+            self.db.exec("INSERT OR IGNORE INTO alts (char_id, group_id, status) VALUES (?, ?, ?)", [main_id, main_id, 2])
+            self.db.exec("INSERT INTO alts (char_id, group_id, status) VALUES (?, ?, ?)", [char_id, main_id, 1])
+
+    def get_uncached_output(self):
+        online_rows = self.online_controller.online_rows
+        self.online_controller.online_rows = {}
+        output = self.online_controller.get_online_output()
+        self.online_controller.online_rows = online_rows
+        return output
+
+    def test_online_output(self):
+        self.add_player(1, "Main")
+        self.add_player(2, "Alt", main_id=1)
+        self.add_player(3, "Other", "Soldier")
+
+        channel = OnlineController.PRIVATE_CHANNEL
+        self.online_controller.add_online_char(3, channel)
+        output = self.online_controller.get_online_output()
+        self.assertEqual("Online (1)", output.title)
+
+        # rows are added to and removed from the rendered list without reloading the channel
+        self.online_controller.add_online_char(2, channel)
+        self.online_controller.add_online_char(1, channel)
+        self.online_controller.add_online_char(1, channel)
+        self.online_controller.add_online_char(4, channel)
+        output = self.online_controller.get_online_output()
+        self.assertEqual("Online (3)", output.title)
+        self.assertEqual(self.get_uncached_output().msg, output.msg)
+        self.assertLess(output.msg.index("Main"), output.msg.index("Alt"))
+        self.assertLess(output.msg.index("Alt"), output.msg.index("Other"))
+
+        self.online_controller.remove_online_char(3)
+        self.assertFalse(self.online_controller.is_online(3))
+        self.assertTrue(self.online_controller.is_online(1, channel))
+        self.assertEqual(self.get_uncached_output().msg, self.online_controller.get_online_output().msg)
+        self.assertEqual([{"count": 3}], self.db.query("SELECT COUNT(1) AS count FROM online"))
+
+        # rows are updated once character info has been saved
+        self.add_player(4, "Newbie", "Trader")
+        self.online_controller.character_info_updated_event(PorkService.CHARACTER_INFO_UPDATED_EVENT, DictObject({"char_ids": [3, 4]}))
+        self.assertIn("Newbie (220/<green>30</green>) Trader", self.online_controller.get_online_output().msg)
+
+        self.db.exec("UPDATE player SET level = 150 WHERE char_id = 2")
+        self.online_controller.character_info_updated_event(PorkService.CHARACTER_INFO_UPDATED_EVENT, DictObject({"char_ids": [2]}))
+        self.assertIn("Alt (150/<green>30</green>) Doctor", self.online_controller.get_online_output().msg)
+
+        # a removed alt is no longer grouped under its old main
+        self.db.exec("DELETE FROM alts WHERE char_id = 2")
+        self.online_controller.alt_removed_event(AltsService.ALT_REMOVED_EVENT_TYPE, DictObject({"alt_char_id": 2, "group_id": 1}))
+        self.assertEqual(self.get_uncached_output().msg, self.online_controller.get_online_output().msg)
+        self.assertIn("alts Alt", self.online_controller.get_online_output().msg)
+
+        replies = []
+        self.online_controller.afk_check(1, "afk lunch", replies.append)
+        self.online_controller.afk_check(3, "afk", replies.append)
+        self.assertIn("Main (220/<green>30</green>) Doctor, Org (Member) - <highlight>afk lunch", self.online_controller.get_online_output().msg)
+        self.assertEqual([1], list(self.online_controller.afk_status))
+
+        # afk status is written to the database behind
+        self.assertEqual(0, self.db.query_single("SELECT afk_dt FROM online WHERE char_id = 1").afk_dt)
+        self.online_controller.write_behind_service.flush()
+        self.assertEqual("afk lunch", self.db.query_single("SELECT afk_reason FROM online WHERE char_id = 1").afk_reason)
+
+        self.online_controller.afk_check(1, "back", replies.append)
+        self.online_controller.afk_check(1, "still here", replies.append)
+        self.assertEqual(1, len(replies))
+        self.assertTrue(replies[0].startswith("<highlight>Char1</highlight> is back after"))
+        self.assertNotIn("afk lunch", self.online_controller.get_online_output().msg)
+
+        self.online_controller.clear_online_channel(channel)
+        self.assertEqual("Online (0)", self.online_controller.get_online_output().title)
+        self.assertEqual([], self.db.query("SELECT * FROM online"))
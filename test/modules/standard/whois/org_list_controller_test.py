@@ -0,0 +1,130 @@
+import time
+import unittest
+from unittest.mock import Mock
+
+from core.aochat import client_packets, server_packets
+from core.buddy_service import BuddyService
+from core.chat_blob import ChatBlob
+from core.dict_object import DictObject
+from core.job_scheduler import JobScheduler
+from core.text import Text
+from core.util import Util
+from modules.standard.whois.org_list_controller import OrgListController
+
+
+class FakeConn:
+    def __init__(self, _id, char_id):
+        self.id = _id
+        self.char_id = char_id
+        self.buddy_list = {}
+        self.packets = []
+
+    def send_packet(self, packet):
+        self.packets.append(packet)
+
+    def send_packets(self, packets):
+        self.packets.extend(packets)
+
+
+class FakeBot:
+    def __init__(self, conns):
+        self.conns = DictObject({conn.id: conn for conn in conns})
+
+    def get_conns(self):
+        return self.conns.items()
+
+
+class OrgListControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.conn1 = FakeConn("bot0", 100)
+        self.conn2 = FakeConn("bot1", 200)
+        self.job_scheduler = JobScheduler()
+
+        self.org_list_controller = OrgListController()
+
+        def fire_event(event_type, packet):
+            if event_type == BuddyService.BUDDY_LOGON_EVENT:
+                self.org_list_controller.buddy_logon_event(event_type, packet)
+            else:
+                self.org_list_controller.buddy_logoff_event(event_type, packet)
+
+        self.buddy_service = BuddyService()
+        self.buddy_service.bot = FakeBot([self.conn1, self.conn2])
+        self.buddy_service.event_service = Mock(fire_event=fire_event)
+        self.buddy_service.job_scheduler = self.job_scheduler
+        self.buddy_service.handle_login_ok(self.conn1, None)
+        self.buddy_service.handle_login_ok(self.conn2, None)
+
+        org_members = {}
+        for char_id in range(1000, 1010):
+            org_members[char_id] = DictObject({"char_id": char_id, "name": "Char%d" % char_id, "level": 220, "ai_level": 0, "gender": "Female",
+                                               "breed": "Solitus", "profession": "Doctor", "org_rank_name": "Member"})
+        org_info = DictObject({"org_id": 1, "name": "Test Org", "governing_type": "Republic"})
+
+        self.org_list_controller.util = Util()
+        self.org_list_controller.text = Text()
+        self.org_list_controller.job_scheduler = self.job_scheduler
+        self.org_list_controller.buddy_service = self.buddy_service
+        self.org_list_controller.org_pork_service = Mock(get_org_info=lambda org_id: DictObject({"org_info": org_info, "org_members": org_members}))
+        # Char1009 does not exist anymore
+        self.org_list_controller.character_service = Mock(name_to_id={"Char1009": None})
+        self.org_list_controller.ORGLIST_BATCH_SIZE = 4
+
+        self.replies = []
+
+    def get_added_char_ids(self):
+        return sorted(packet.char_id for packet in self.conn1.packets + self.conn2.packets if packet.id == client_packets.BuddyAdd.id)
+
+    def respond(self, char_ids, online):
+        for char_id in char_ids:
+            conn = self.buddy_service.bot.conns[self.buddy_service.get_buddy(char_id)["conn_id"]]
+            self.buddy_service.handle_add(conn, server_packets.BuddyAdded(char_id, online, "\0"))
+
+    def test_orglist(self):
+        # already a buddy, so its online status is known without adding it again
+        self.buddy_service.add_buddy(1008, "member")
+        self.respond([1008], 1)
+
+        self.org_list_controller.start_orglist_lookup(self.replies.append, 1, OrgListController.DEFAULT_OFFLINE_MEMBER_DISPLAY_THRESHOLD)
+        self.assertEqual(2, len(self.replies))
+
+        # the first batch is spread over both conns
+        self.job_scheduler.check_for_scheduled_jobs()
+        self.assertEqual([1004, 1005, 1006, 1007, 1008], self.get_added_char_ids())
+        self.assertEqual(3, len(self.conn1.buddy_list))
+        self.assertEqual(2, len(self.conn2.buddy_list))
+
+        self.respond([1007, 1006], 1)
+        self.respond([1005, 1004], 0)
+        self.assertEqual("Checked 6 / 10 members of <highlight>Test Org</highlight>, 3 online so far...", self.replies[-1])
+        self.assertEqual(["member"], self.buddy_service.get_buddy(1008)["types"])
+        self.assertEqual({1000, 1001, 1002, 1003}, set(self.buddy_service.get_buddies_by_type(OrgListController.ORGLIST_BUDDY_TYPE).keys()))
+
+        # members that do not respond in time are counted as inactive
+        self.respond([1003, 1002], 0)
+        self.respond([1001], 1)
+        self.job_scheduler.check_for_scheduled_jobs(time.time() + OrgListController.ORGLIST_BATCH_TIMEOUT + 60)
+
+        self.assertIsNone(self.org_list_controller.orglist)
+        self.assertEqual({}, self.buddy_service.get_buddies_by_type(OrgListController.ORGLIST_BUDDY_TYPE))
+        result = self.replies[-1]
+        self.assertIsInstance(result, ChatBlob)
+        self.assertEqual("Orglist for 'Test Org' (4 / 10)", result.title)
+        self.assertIn("<header2>Inactive (0 / 2)</header2>", result.msg)
+
+    def test_orglist_max_duration(self):
+        # all buddy slots are in use, so the scan can not make progress
+        self.buddy_service.conn_capacities = {"bot0": 0, "bot1": 0}
+
+        self.org_list_controller.start_orglist_lookup(self.replies.append, 1, OrgListController.DEFAULT_OFFLINE_MEMBER_DISPLAY_THRESHOLD)
+        self.assertIsNotNone(self.org_list_controller.orglist)
+        self.assertEqual(2, len(self.replies))
+
+        self.org_list_controller.orglist.started_at -= OrgListController.ORGLIST_MAX_DURATION + 1
+        self.job_scheduler.check_for_scheduled_jobs(time.time() + OrgListController.ORGLIST_RETRY_INTERVAL)
+
+        # the scan ends by itself with the partial result
+        self.assertIsNone(self.org_list_controller.orglist)
+        self.assertEqual([], self.job_scheduler.get_pending_jobs())
+        self.assertTrue(self.replies[2].startswith("Automatically ending orglist"))
+        self.assertEqual("Orglist for 'Test Org' (0 / 0)", self.replies[3].title)